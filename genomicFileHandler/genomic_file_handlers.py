@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
-from pysam import AlignmentFile
-import sys, os, gzip, re, math
+from pysam import AlignmentFile, TabixFile
+import sys, os, gzip, re, math, heapq
 
 # The regular expression pattern for "chrXX 1234567" in both VarScan2 Output and VCF files:
 pattern_major_chr_position = re.compile(r'^(?:chr)?(?:[1-9]|1[0-9]|2[0-2]|[XY]|MT?)\t[0-9]+\b')
@@ -24,15 +24,30 @@ AA_1to3 = {"A": "Ala", "R": "Arg", "N": "Asn", "D": "Asp", "C": "Cys", "E": "Glu
 
 ### ### ### ### ### MAJOR CLASSES ### ### ### ### ###
 class Vcf_line:
-    '''Each instance of this object is a line from the vcf file (no header).'''
+    '''
+    Each instance of this object is a line from the vcf file (no header).
+    The columns are split right away, but INFO and the samples are only parsed into dictionaries the first time a value is looked up.
+    '''
+
+    __slots__ = ('vcf_line', 'chromosome', 'position', 'identifier', 'refbase', 'altbase', 'qual', 'filters', 'info', 'has_samples', 'field', 'samples', '_info_line', '_info_values', '_sample_values')
+
+    # The regex get_info_value used to compile on every call, compiled once for each key:
+    info_patterns = {}
+
+    # Keys made only of word characters, whose values can be looked up in the INFO dictionary instead:
+    plain_info_keys = set()
+
 
     def __init__(self, vcf_line):
 
         '''Argument is a line in pileup file.'''
         self.vcf_line = vcf_line.rstrip('\n')
 
+        self._info_line     = None
+        self._sample_values = {}
+
         try:
-            self.chromosome, self.position, self.identifier, self.refbase, self.altbase, self.qual, self.filters, self.info, *self.has_samples = vcf_line.rstrip('\n').split('\t')
+            self.chromosome, self.position, self.identifier, self.refbase, self.altbase, self.qual, self.filters, self.info, *self.has_samples = self.vcf_line.split('\t')
             self.position = int(self.position)
 
             try:
@@ -45,13 +60,65 @@ class Vcf_line:
             self.position = None
 
 
+    @classmethod
+    def from_lines(cls, vcf_lines):
+        '''A block of lines, e.g., all the lines at a coordinate, into a list of Vcf_line's'''
+        return [ cls(line_i) for line_i in vcf_lines ]
+
+
     def get_info_items(self):
         return self.info.split(';')
 
 
+    def get_info_dict(self):
+        '''
+        The KEY=VALUE items of the INFO column of vcf_line (so not affected by changes to self.info), where VALUE is what get_info_value's regex captures, i.e., up to a white space.
+        Parsed again only if vcf_line is changed.
+        '''
+
+        if self._info_line is not self.vcf_line:
+
+            info_values = {}
+            info_column = self.vcf_line.split('\t', 8)[7:8]
+
+            for item_i in info_column[0].split(';') if info_column else ():
+
+                key_i, equal_sign, value_i = item_i.partition('=')
+
+                if equal_sign and value_i and not value_i[0].isspace() and key_i not in info_values:
+                    info_values[key_i] = value_i.split()[0]
+
+            self._info_values = info_values
+            self._info_line   = self.vcf_line
+
+        return self._info_values
+
+
     def get_info_value(self, variable):
 
-        key_item = re.search(r'\b{}=([^;\s]+)([;\W]|$)'.format(variable), self.vcf_line)
+        try:
+            info_pattern = self.info_patterns[variable]
+        except KeyError:
+            info_pattern = self.info_patterns[variable] = re.compile(r'\b{}=([^;\s]+)([;\W]|$)'.format(variable))
+            if re.fullmatch(r'\w+', variable):
+                self.plain_info_keys.add(variable)
+
+        # The regex searches the whole line, so the dictionary gives the same answer only when "KEY=" appears no more than once in the line
+        if variable in self.plain_info_keys:
+
+            n_occurrences = self.vcf_line.count(variable + '=')
+
+            if n_occurrences == 1 and variable in self.get_info_dict():
+                return self._info_values[variable]
+
+            elif n_occurrences == 0:
+                key_item = None
+
+            else:
+                key_item = info_pattern.search(self.vcf_line)
+
+        else:
+            key_item = info_pattern.search(self.vcf_line)
 
         # The key has a value attached to it, e.g., VAR=1,2,3
         if key_item:
@@ -78,7 +145,14 @@ class Vcf_line:
 
     def get_sample_value(self, variable, idx=0):
 
-        var2value = dict( zip( self.field.split(':'), self.samples[idx].split(':') ))
+        sample_i = self.samples[idx]
+
+        # The dictionary of a sample is made again if FORMAT or the sample has been changed since
+        field_i, cached_sample_i, var2value = self._sample_values.get(idx, (None, None, None))
+
+        if field_i is not self.field or cached_sample_i is not sample_i:
+            var2value = dict( zip( self.field.split(':'), sample_i.split(':') ))
+            self._sample_values[idx] = (self.field, sample_i, var2value)
 
         try:
             return var2value[variable]
@@ -163,8 +237,12 @@ def faiordict2contigorder(file_name, file_format):
 
 def open_textfile(file_name):
 
+    # In-memory VCF files, i.e., vcfModifier.vcfStream.VcfStream, open themselves:
+    if hasattr(file_name, 'open'):
+        return file_name.open()
+
     # See if the input file is a .gz file:
-    if file_name.lower().endswith('.gz'):
+    elif file_name.lower().endswith('.gz'):
         return gzip.open(file_name, 'rt')
 
     else:
@@ -347,6 +425,51 @@ def whoisbehind(coord_0, coord_1, chrom_sequence):
 
 
 
+# Coordinates as single integers, i.e., contig order * COORDINATE_SHIFT + position, made once when a line is read, so that which coordinate is behind is one integer comparison instead of whoisbehind:
+COORDINATE_SHIFT = 1 << 32
+
+# Larger than any coordinate, the same way whoisbehind takes an empty coordinate as the end of a file:
+END_OF_FILE_KEY  = (1 << 63) - 1
+
+pattern_contig_position = re.compile(r'([^\t]+)\t([0-9]+)\b')
+
+
+def contig_order(chrom_sequence):
+    '''chrom_sequence as a dictionary, if it's a list or tuple of contigs'''
+
+    if isinstance(chrom_sequence, dict):
+        return chrom_sequence
+    else:
+        return { contig_i:n for n, contig_i in enumerate(chrom_sequence) }
+
+
+def coordinate_key(coordinate, chrom_seq):
+    '''coordinate is what whoisbehind takes, i.e., "contig\tposition" or (contig, position), and chrom_seq is a dictionary'''
+
+    if coordinate == '' or coordinate==['',''] or coordinate==('','') or not coordinate:
+        return END_OF_FILE_KEY
+
+    if isinstance(coordinate, str):
+        contig_i, position_i = coordinate.split()
+    else:
+        contig_i, position_i = coordinate[0], coordinate[1]
+
+    return chrom_seq[contig_i] * COORDINATE_SHIFT + int(position_i)
+
+
+def line_coordinate_key(line_i, chrom_seq):
+    '''Coordinate key of a VCF (or VarScan2) line, or END_OF_FILE_KEY if there is no coordinate, e.g., the empty line at the end of a file'''
+
+    coordinate_i = pattern_contig_position.match(line_i)
+
+    if coordinate_i:
+        return chrom_seq[ coordinate_i.group(1) ] * COORDINATE_SHIFT + int( coordinate_i.group(2) )
+    else:
+        return END_OF_FILE_KEY
+
+
+
+
 def vcf_header_modifier(infile_handle, addons=[], getlost=' '):
 
     '''addons = A list of INFO, FORMAT, ID, or Filter lines you want to add.
@@ -398,48 +521,23 @@ def catchup(coordinate_i, line_j, filehandle_j, chrom_sequence):
     Returns (False, Vcf_line_j) if the j_th vcf file does not contain such an entry, and therefore the function has run past the i_th coordinate, by which time the programmer can decide to move into the next i_th coordiate.
     '''
 
-    coordinate_j = re.match( pattern_chr_position, line_j )
+    chrom_seq = contig_order(chrom_sequence)
 
-    if coordinate_j:
-        coordinate_j = coordinate_j.group()
-    else:
-        coordinate_j = ''
+    key_i = coordinate_key(coordinate_i, chrom_seq)
+    key_j = line_coordinate_key(line_j, chrom_seq)
 
-    # Which coordinate is behind?
-    is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
+    # If file_j is behind, then needs to catch up, i.e., keep at it until line_j is no longer behind:
+    while key_j < key_i:
+        line_j = filehandle_j.readline().rstrip()
+        key_j  = line_coordinate_key(line_j, chrom_seq)
 
-    # The file_j is already ahead, return the same line_j, but tag it "False"
-    if is_behind == 0:
-        reporter = (False, line_j)
-
-    # The two coordinates are the same, return the same line_j, but tag it "True"
-    elif is_behind == 10:
+    # The two coordinates are the same, return the line_j, but tag it "True"
+    if key_j == key_i:
         reporter = (True, line_j)
 
-    # If file_j is behind, then needs to catch up:
-    elif is_behind == 1:
-
-        # Keep at it until line_j is no longer behind:
-        while is_behind == 1:
-
-            # Catch up
-            line_j = filehandle_j.readline().rstrip()
-            next_coord = re.match( pattern_chr_position, line_j )
-
-            if next_coord:
-                coordinate_j = next_coord.group()
-            else:
-                coordinate_j = ''
-
-            is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
-
-        # If file_j has caught up exactly to the position of coordinate_i:
-        if is_behind == 10:
-            reporter = (True, line_j)
-
-        # If file_j has run past coordinate_i:
-        elif is_behind == 0:
-            reporter = (False, line_j)
+    # The file_j is (or has run) ahead, return the line_j, but tag it "False"
+    else:
+        reporter = (False, line_j)
 
     return reporter
 
@@ -460,126 +558,222 @@ def catchup_multilines(coordinate_i, line_j, filehandle_j, chrom_sequence):
     Returns (False, []        , line_j) if the j_th vcf file does not contain such an entry, and therefore the function has run past the i_th coordinate, by which time the programmer can decide to move into the next i_th coordiate.
     '''
 
-    coordinate_j = re.match( pattern_chr_position, line_j )
+    chrom_seq = contig_order(chrom_sequence)
 
-    if coordinate_j:
-        coordinate_j = coordinate_j.group()
-    else:
-        coordinate_j = ''
+    key_i = coordinate_key(coordinate_i, chrom_seq)
+    key_j = line_coordinate_key(line_j, chrom_seq)
 
-    # Which coordinate is behind?
-    is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
+    # If file_j is behind, then needs to catch up:
+    # This is an opportunity to check if the vcf_j file is properly sorted, by asserting current line cannot be "behind" a subsequent line
+    while key_j < key_i:
 
-    # The file_j is already ahead, return the same line_j, but tag it "False"
-    if is_behind == 0:
-        reporter = (False, [], line_j)
+        line_j     = filehandle_j.readline().rstrip()
+        next_key_j = line_coordinate_key(line_j, chrom_seq)
 
-    # The two coordinates are the same, return the same line_j, but tag it "True"
-    elif is_behind == 10:
+        if next_key_j < key_j:
+            raise Exception('{} does not seem to be properly sorted'.format(filehandle_j.name) )
 
-        # Create a list, initiated with the current line:
-        lines_of_coordinate_i = [ line_j ]
+        key_j = next_key_j
 
-        while is_behind == 10:
-            line_j = filehandle_j.readline().rstrip()
-            next_coord = re.match( pattern_chr_position, line_j )
+    # If file_j is at the position of coordinate_i, create a list, initiated with the current line, and add the next lines with the same coordinate:
+    if key_j == key_i:
 
-            if next_coord:
-                coordinate_j = next_coord.group()
-            else:
-                coordinate_j = ''
+        lines_of_coordinate_i = [ line_j ]
 
-            is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
+        while key_j == key_i:
+            line_j = filehandle_j.readline().rstrip()
+            key_j  = line_coordinate_key(line_j, chrom_seq)
 
-            # If the next line (still) has the same coordinate:
-            if is_behind == 10:
+            if key_j == key_i:
                 lines_of_coordinate_i.append( line_j )
 
         reporter = (True, lines_of_coordinate_i, line_j)
 
+    # The file_j is (or has run) ahead:
+    else:
+        reporter = (False, [], line_j)
 
-    # If file_j is behind, then needs to catch up:
-    # This is an opportunity to check if the vcf_j file is properly sorted, by asserting current line cannot be "behind" a subsequent line
-    elif is_behind == 1:
+    return reporter
 
-        # Keep at it until line_j is no longer behind:
-        while is_behind == 1:
 
-            # Catch up
-            line_j = filehandle_j.readline().rstrip()
-            next_coord = re.match( pattern_chr_position, line_j )
 
-            if next_coord:
-                if whoisbehind(coordinate_j, next_coord.group(), chrom_sequence) == 1:
-                    raise Exception('{} does not seem to be properly sorted'.format(filehandle_j.name) )
 
-                coordinate_j = next_coord.group()
-            else:
-                coordinate_j = ''
 
-            is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
 
+def find_vcf_at_coordinate(my_coordinate, latest_vcf_line, vcf_file_handle, chrom_seq):
+    '''Best used in conjunction with catchup_multilines.
+    Given the current coordinate, the latest vcf_line from a vcf file, and the vcf file handle, it will return all the VCF variants (as VCF objects) at the given coordinate as a dictionary, where the key is the ( (contig, position), ref_base_i, alt_base_i ).
+    If there are two ALT bases in a given VCF line, the output dictionary will include two copies of this VCF object, with two different keys, each representing a different ALT base.
+    '''
+    latest_vcf_run  = catchup_multilines(my_coordinate, latest_vcf_line, vcf_file_handle, chrom_seq)
+    latest_vcf_here = latest_vcf_run[1]
 
-        # If file_j has caught up exactly to the position of coordinate_i:
-        if is_behind == 10:
+    vcf_variants = {}
+    if latest_vcf_run[0]:
 
-            # Create a list, initiated with the current line:
-            lines_of_coordinate_i = [ line_j ]
+        for vcf_i in Vcf_line.from_lines( latest_vcf_here ):
 
-            while is_behind == 10:
-                line_j = filehandle_j.readline().rstrip()
-                next_coord = re.match( pattern_chr_position, line_j )
+            # Some VCF files wrongly uses "/" to separate different ALT's
+            altbases = re.split(r'[,/]', vcf_i.altbase)
+            for alt_i in altbases:
+                vcf_variants[ ((vcf_i.chromosome, vcf_i.position), vcf_i.refbase, alt_i) ] = vcf_i
 
-                if next_coord:
-                    coordinate_j = next_coord.group()
-                else:
-                    coordinate_j = ''
+            assert my_coordinate[1] == vcf_i.position
 
-                is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
+    latest_vcf_line = latest_vcf_run[-1]
 
-                # If the next line (still) has the same coordinate:
-                if is_behind == 10:
-                    lines_of_coordinate_i.append( line_j )
+    return latest_vcf_run[0], vcf_variants, latest_vcf_line
 
-            reporter = (True, lines_of_coordinate_i, line_j)
 
 
-        elif is_behind == 0:
 
-            reporter = (False, [], line_j)
+def tabix_index_of(file_name):
+    '''The .tbi or .csi index of a bgzipped VCF file, or None if the file is not indexed'''
 
-    return reporter
+    if isinstance(file_name, str) and file_name.lower().endswith('.gz'):
+        for suffix_i in ('.tbi', '.csi'):
+            if os.path.exists( file_name + suffix_i ):
+                return file_name + suffix_i
 
+    return None
 
 
 
+class TabixVcfReader:
+    '''
+    Reads a tabix-indexed VCF file line by line like an opened VCF file, but seek(contig, position) jumps to the first record overlapping the position, so the lines before it are never read.
+    From there, lines are read ahead to the end of the contig as they are asked for.
+    '''
 
+    def __init__(self, file_name, index_file):
+        self.name    = file_name
+        self.tabix   = TabixFile(file_name, index=index_file)
+        self.contigs = set(self.tabix.contigs)
+        self.contig  = None
+        self.lines   = iter(())
 
-def find_vcf_at_coordinate(my_coordinate, latest_vcf_line, vcf_file_handle, chrom_seq):
-    '''Best used in conjunction with catchup_multilines.
-    Given the current coordinate, the latest vcf_line from a vcf file, and the vcf file handle, it will return all the VCF variants (as VCF objects) at the given coordinate as a dictionary, where the key is the ( (contig, position), ref_base_i, alt_base_i ).
-    If there are two ALT bases in a given VCF line, the output dictionary will include two copies of this VCF object, with two different keys, each representing a different ALT base.
+    def seek(self, contig, position):
+        self.contig = contig
+        self.lines  = self.tabix.fetch(contig, position-1) if contig in self.contigs else iter(())
+
+    def readline(self):
+        return next(self.lines, '')
+
+    def close(self):
+        self.tabix.close()
+
+
+
+class VcfMultiplexer:
+    '''
+    Reads all the sorted VCF files (e.g., the callers', truth, dbSNP, and COSMIC) together.
+    A min-heap keeps the coordinate key of the next line of each file, so for each coordinate, only the files that are behind or at the coordinate are read.
+    Files that are bgzipped and tabix-indexed (i.e., .vcf.gz with .tbi or .csi) are not streamed from the start. They seek to the coordinate when it is on another contig or more than seek_distance ahead, and are read ahead from there.
+    variants_at(my_coordinate)[name] is the same as the variants from find_vcf_at_coordinate for that file.
     '''
-    latest_vcf_run  = catchup_multilines(my_coordinate, latest_vcf_line, vcf_file_handle, chrom_seq)
-    latest_vcf_here = latest_vcf_run[1]
 
-    vcf_variants = {}
-    if latest_vcf_run[0]:
+    def __init__(self, vcf_files, chrom_seq, seek_distance=10000):
+        '''vcf_files is a dictionary of {name: VCF file}'''
 
-        for vcf_line_i in latest_vcf_here:
+        self.chrom_seq     = contig_order(chrom_seq)
+        self.seek_distance = seek_distance
+        self.names         = list(vcf_files)
+        self.handles       = {}
+        self.lines         = {}
+        self.next_lines    = []
 
-            vcf_i = Vcf_line( vcf_line_i )
+        # {name: (coordinate key of the next line, n)} of the tabix-indexed files, which are kept out of the heap
+        self.indexed       = {}
 
-            # Some VCF files wrongly uses "/" to separate different ALT's
-            altbases = re.split(r'[,/]', vcf_i.altbase)
-            for alt_i in altbases:
-                vcf_variants[ ((vcf_i.chromosome, vcf_i.position), vcf_i.refbase, alt_i) ] = vcf_i
+        for n, name_i in enumerate(self.names):
 
-            assert my_coordinate[1] == vcf_i.position
+            index_file = tabix_index_of( vcf_files[name_i] )
 
-    latest_vcf_line = latest_vcf_run[-1]
+            if index_file:
+                self.handles[name_i] = TabixVcfReader( vcf_files[name_i], index_file )
+                self.lines[name_i]   = ''
+                self.indexed[name_i] = (END_OF_FILE_KEY, n)
 
-    return latest_vcf_run[0], vcf_variants, latest_vcf_line
+            else:
+                self.handles[name_i] = open_textfile( vcf_files[name_i] )
+                self.lines[name_i]   = skip_vcf_header( self.handles[name_i] )
+
+                heapq.heappush( self.next_lines, (line_coordinate_key(self.lines[name_i], self.chrom_seq), n, name_i) )
+
+
+    def variants_at(self, my_coordinate):
+
+        key_i = coordinate_key(my_coordinate, self.chrom_seq)
+
+        variants_of_files = { name_i:{} for name_i in self.names }
+
+        # Files that are behind or at the coordinate
+        to_read = []
+        while self.next_lines and self.next_lines[0][0] <= key_i:
+            to_read.append( heapq.heappop(self.next_lines) )
+
+        for name_j, (key_j, n) in self.indexed.items():
+
+            reader_j = self.handles[name_j]
+
+            if reader_j.contig != my_coordinate[0] or key_j < key_i - self.seek_distance:
+                reader_j.seek( my_coordinate[0], int(my_coordinate[1]) )
+                self.lines[name_j] = reader_j.readline().rstrip()
+                key_j = line_coordinate_key(self.lines[name_j], self.chrom_seq)
+
+            to_read.append( (key_j, n, name_j) )
+
+        for key_j, n, name_j in to_read:
+
+            filehandle_j = self.handles[name_j]
+            line_j       = self.lines[name_j]
+
+            # Files that are behind catch up, while checking that each line is not behind the one before:
+            while key_j < key_i:
+
+                line_j     = filehandle_j.readline().rstrip()
+                next_key_j = line_coordinate_key(line_j, self.chrom_seq)
+
+                if next_key_j < key_j:
+                    raise Exception('{} does not seem to be properly sorted'.format(filehandle_j.name) )
+
+                key_j = next_key_j
+
+            # Files at the coordinate: all their lines with the same coordinate
+            if key_j == key_i:
+
+                lines_of_coordinate_i = [ line_j ]
+
+                while key_j == key_i:
+                    line_j = filehandle_j.readline().rstrip()
+                    key_j  = line_coordinate_key(line_j, self.chrom_seq)
+
+                    if key_j == key_i:
+                        lines_of_coordinate_i.append( line_j )
+
+                vcf_variants = variants_of_files[name_j]
+                for vcf_i in Vcf_line.from_lines( lines_of_coordinate_i ):
+
+                    # Some VCF files wrongly uses "/" to separate different ALT's
+                    altbases = re.split(r'[,/]', vcf_i.altbase)
+                    for alt_i in altbases:
+                        vcf_variants[ ((vcf_i.chromosome, vcf_i.position), vcf_i.refbase, alt_i) ] = vcf_i
+
+                    assert my_coordinate[1] == vcf_i.position
+
+            self.lines[name_j] = line_j
+
+            if name_j in self.indexed:
+                self.indexed[name_j] = (key_j, n)
+            else:
+                heapq.heappush( self.next_lines, (key_j, n, name_j) )
+
+        return variants_of_files
+
+
+    def close(self):
+        for handle_i in self.handles.values():
+            handle_i.close()
 
 
 
@@ -594,30 +788,22 @@ def catchup_one_line_at_a_time(coordinate_i, line_j, filehandle_j, chrom_sequenc
     Return (-1, Vcf_line_j) if the coordinate_j is behind of coordinate_i.
     '''
 
-    coordinate_j = re.match( pattern_chr_position, line_j )
+    chrom_seq = contig_order(chrom_sequence)
 
-    if coordinate_j:
-        coordinate_j = coordinate_j.group()
-    else:
-        coordinate_j = ''
-
-    # Which coordinate is behind?
-    is_behind = whoisbehind( coordinate_i, coordinate_j, chrom_sequence )
+    key_i = coordinate_key(coordinate_i, chrom_seq)
+    key_j = line_coordinate_key(line_j, chrom_seq)
 
     # The file_j is already ahead, return the same line_j, but tag it "False"
-    if is_behind == 0:
+    if key_j > key_i:
         reporter = (1, line_j)
 
     # The two coordinates are the same, return the same line_j, but tag it "True"
-    elif is_behind == 10:
+    elif key_j == key_i:
         reporter = (0, line_j)
 
-    # If file_j is behind, then needs to catch up:
-    elif is_behind == 1:
-
-        # Read one line into file_j:
+    # If file_j is behind, then read one line into file_j:
+    else:
         line_j_next = filehandle_j.readline().rstrip()
-        next_coord = re.match( pattern_chr_position, line_j_next )
         reporter = (-1, line_j_next)
 
     return reporter
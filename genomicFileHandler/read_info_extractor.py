@@ -124,6 +124,126 @@ def position_of_aligned_read(read_i, target_position):
 
 
 
+def locate_aligned_position(read_i, target_position):
+    '''
+    Same input and output as position_of_aligned_read, but it walks through read_i.cigartuples once instead of calling read_i.get_aligned_pairs() over and over again.
+    Every CIGAR operation is turned into a block of what get_aligned_pairs() would have returned, i.e., [index of its first pair, length, query start, reference start], where the query (or reference) start is None if the operation does not consume the query (or reference).
+    The quirks of position_of_aligned_read are kept, so the two always agree, e.g., the flanking indels are looked up with query positions as indices into the aligned pairs.
+    '''
+
+    blocks = []
+    n_pairs = 0
+    i = seq_i = None
+    query_i, ref_i = 0, read_i.reference_start
+
+    for op_i, length_i in (read_i.cigartuples or ()):
+
+        if length_i == 0 or op_i == cigar_hard_clip:
+            continue
+
+        # Aligned to the reference
+        if op_i in (cigar_aln_match, cigar_seq_match, cigar_seq_mismatch):
+            if i is None and ref_i <= target_position < ref_i + length_i:
+                i     = n_pairs + target_position - ref_i
+                seq_i = query_i + target_position - ref_i
+
+            blocks.append( (n_pairs, length_i, query_i, ref_i) )
+            query_i += length_i
+            ref_i   += length_i
+
+        # Deleted or skipped reference
+        elif op_i in (cigar_deletion, cigar_skip):
+            if i is None and ref_i <= target_position < ref_i + length_i:
+                i = n_pairs + target_position - ref_i
+
+            blocks.append( (n_pairs, length_i, None, ref_i) )
+            ref_i += length_i
+
+        # Insertion, soft-clip, and padding (pysam lists padding like an insertion)
+        else:
+            blocks.append( (n_pairs, length_i, query_i, None) )
+            query_i += length_i
+
+        n_pairs += length_i
+
+    # The target position does not exist in the read
+    if i is None:
+        return None, None, None, None, None
+
+    # The target position is deleted from the sequencing read:
+    if seq_i is None:
+        return 0, None, None, None, None
+
+    base_at_target = read_i.query_sequence[seq_i]
+
+    # If "i" is the final alignment, cannot exam for indel:
+    if i == n_pairs - 1:
+        return 1, seq_i, base_at_target, nan, None
+
+    next_query, next_ref = aligned_pair(blocks, i+1)
+
+    if next_query == seq_i+1 and next_ref == target_position + 1:
+        code = 1 # Reference read for mismatch
+        indel_length = 0
+
+    elif next_query is None and next_ref == target_position + 1:
+        code = 2 # Deletion
+        indel_length = -aligned_run_length(blocks, i+1, 2)
+
+    elif next_query == seq_i+1 and next_ref is None:
+        code = 3 # Insertion or soft-clipping
+        indel_length = aligned_run_length(blocks, i+1, 3)
+
+    else:
+        return None, None, None, None, None
+
+    # See if there is insertion/deletion within 3 bp, in the same order position_of_aligned_read checks them:
+    flanking_indel = inf
+    left_side_start = seq_i
+    right_side_start = seq_i + abs(indel_length) + 1
+    switch = 1
+    for j in (3,2,1):
+        for indel_seeker_i in left_side_start, right_side_start:
+
+            switch = switch * -1
+            seq_j = indel_seeker_i + j * switch
+
+            if 0 <= seq_j < n_pairs and None in aligned_pair(blocks, seq_j):
+                flanking_indel = j
+                break
+
+    return code, seq_i, base_at_target, indel_length, flanking_indel
+
+
+
+def aligned_pair(blocks, pair_index):
+    '''The (query position, reference position) of the pair_index'th item of get_aligned_pairs(), from the blocks in locate_aligned_position.'''
+    for first_pair, length_i, query_i, ref_i in blocks:
+        if pair_index < first_pair + length_i:
+            offset = pair_index - first_pair
+            return (query_i + offset if query_i is not None else None, ref_i + offset if ref_i is not None else None)
+
+
+
+def aligned_run_length(blocks, pair_index, code):
+    '''Starting at pair_index, the number of consecutive aligned pairs without a query position (code 2, i.e., deletion) or without a reference position (code 3, i.e., insertion).'''
+    # Deletions have no query start (item 2 of a block), insertions have no reference start (item 3 of a block)
+    missing = 2 if code == 2 else 3
+    run_length = 0
+    for block_i in blocks:
+        first_pair, length_i = block_i[0], block_i[1]
+        if first_pair + length_i <= pair_index:
+            continue
+
+        if block_i[missing] is not None:
+            break
+
+        run_length += first_pair + length_i - max(first_pair, pair_index)
+
+    return run_length
+
+
+
 ## Dedup test for BAM file
 def dedup_test(read_i, remove_dup_or_not=True):
     '''
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+import argparse, os, sys, json, struct, mmap, logging
+from bisect import bisect_right
+import numpy as np
+import pysam
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+
+# A compact reference cache, built once per genome reference and memory-mapped at run time, so many processes share the same pages.
+# For each contig in the .fai order, the file has:
+# 1) right_run: uint8 per base, the length of the homopolymer from this base to the right (capped at 255), exactly as the characters are in the fasta file, i.e., "a" and "A" are different bases.
+# 2) sequence: 2-bit packed A/C/G/T, 4 bases per byte, 1st base in the highest bits.
+# 3) N blocks and soft-masked (lowercase) blocks as [start, end) int64 arrays, and exceptions, i.e., any other characters, as int64 positions and uint8 characters.
+# A JSON header is at the end of the file, and the last 16 bytes are its offset and the magic number.
+
+MAGIC       = b'SSQREF01'
+CHUNK_SIZE  = 1 << 22
+MAX_RUN     = 255
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+ch.setFormatter(formatter)
+logger = logging.getLogger( os.path.basename(__file__) )
+logger.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+# A/C/G/T and a/c/g/t to 2-bit codes. Everything else is 0, and is recorded as an N block or an exception.
+base_codes = np.zeros(256, dtype=np.uint8)
+for code_i, base_i in enumerate('ACGT'):
+    base_codes[ ord(base_i) ] = base_codes[ ord(base_i.lower()) ] = code_i
+
+is_acgtn = np.zeros(256, dtype=bool)
+is_acgtn[ [ord(base_i) for base_i in 'ACGTNacgtn'] ] = True
+
+is_lowercase = np.zeros(256, dtype=bool)
+is_lowercase[ ord('a'):ord('z')+1 ] = True
+
+
+
+def default_cache_file(ref_fa):
+    return ref_fa + '.ssref'
+
+
+
+def blocks(mask, offset=0):
+    '''[start, end) of the runs of True in a boolean array'''
+    edges = np.flatnonzero( np.diff( np.concatenate( ([False], mask, [False]) ).astype(np.int8) ) )
+    return edges[0::2] + offset, edges[1::2] + offset
+
+
+
+def merge_blocks(starts, ends):
+    '''Join blocks that were split by chunk boundaries'''
+
+    starts = np.concatenate(starts).astype(np.int64) if starts else np.zeros(0, dtype=np.int64)
+    ends   = np.concatenate(ends).astype(np.int64)   if ends   else np.zeros(0, dtype=np.int64)
+
+    if len(starts) == 0:
+        return starts, ends
+
+    keep = np.concatenate( ([True], starts[1:] != ends[:-1]) )
+
+    return starts[keep], ends[ np.concatenate( (keep[1:], [True]) ) ]
+
+
+
+def right_runs(sequence, run_is_complete):
+    '''
+    sequence is a uint8 array. Returns the capped right_run of every base, except that if run_is_complete is False, the last run is left out because it may continue into the next chunk.
+    '''
+
+    run_starts = np.concatenate( ([0], np.flatnonzero(sequence[1:] != sequence[:-1]) + 1) )
+    run_ends   = np.concatenate( (run_starts[1:], [len(sequence)]) )
+
+    if not run_is_complete:
+        run_starts, run_ends = run_starts[:-1], run_ends[:-1]
+
+    n_done  = run_ends[-1] if len(run_ends) else 0
+    to_ends = np.repeat(run_ends, run_ends - run_starts) - np.arange(n_done)
+
+    return np.minimum(to_ends, MAX_RUN).astype(np.uint8)
+
+
+
+def pad_to_8(outhandle):
+    outhandle.write( b'\0' * (-outhandle.tell() % 8) )
+
+
+
+def write_array(outhandle, array_i):
+    pad_to_8(outhandle)
+    offset_i = outhandle.tell()
+    outhandle.write( array_i.tobytes() )
+    return offset_i
+
+
+
+def build(ref_fa, cache_file=None):
+
+    '''Write the reference cache for the fasta file ref_fa. Returns the cache file name.'''
+
+    if not cache_file:
+        cache_file = default_cache_file(ref_fa)
+
+    header = {'reference': os.path.basename(ref_fa), 'contigs': []}
+
+    with pysam.FastaFile(ref_fa) as fasta, open(cache_file + '.tmp', 'wb') as cache:
+
+        cache.write( MAGIC )
+
+        for contig_i, length_i in zip(fasta.references, fasta.lengths):
+
+            pad_to_8(cache)
+            run_offset = cache.tell()
+
+            packed_chunks   = []
+            n_starts,    n_ends    = [], []
+            mask_starts, mask_ends = [], []
+            exception_positions, exception_bases = [], []
+
+            # The last homopolymer of a chunk is held back until where it ends is known:
+            pending = np.zeros(0, dtype=np.uint8)
+
+            for chunk_start in range(0, length_i, CHUNK_SIZE):
+
+                seq_i = fasta.fetch(contig_i, chunk_start, min(chunk_start+CHUNK_SIZE, length_i))
+                seq_i = np.frombuffer( seq_i.encode() if isinstance(seq_i, str) else seq_i, dtype=np.uint8 )
+
+                # 2-bit packing. CHUNK_SIZE is a multiple of 4, so only the last chunk needs padding.
+                codes_i = base_codes[ seq_i ]
+                codes_i = np.concatenate( (codes_i, np.zeros(-len(codes_i) % 4, dtype=np.uint8)) ).reshape(-1, 4)
+                packed_chunks.append( (codes_i[:,0] << 6) | (codes_i[:,1] << 4) | (codes_i[:,2] << 2) | codes_i[:,3] )
+
+                starts_i, ends_i = blocks( (seq_i == ord('N')) | (seq_i == ord('n')), chunk_start )
+                n_starts.append(starts_i)
+                n_ends.append(ends_i)
+
+                starts_i, ends_i = blocks( is_lowercase[seq_i], chunk_start )
+                mask_starts.append(starts_i)
+                mask_ends.append(ends_i)
+
+                other_bases = np.flatnonzero( ~is_acgtn[seq_i] )
+                exception_positions.append( other_bases + chunk_start )
+                exception_bases.append( seq_i[other_bases] )
+
+                # Homopolymer runs:
+                sequence_i = np.concatenate( (pending, seq_i) )
+                runs_i     = right_runs(sequence_i, chunk_start + CHUNK_SIZE >= length_i)
+                cache.write( runs_i.tobytes() )
+                pending    = sequence_i[ len(runs_i): ]
+
+            n_starts,    n_ends    = merge_blocks(n_starts, n_ends)
+            mask_starts, mask_ends = merge_blocks(mask_starts, mask_ends)
+
+            exception_positions = np.concatenate(exception_positions).astype(np.int64) if exception_positions else np.zeros(0, dtype=np.int64)
+            exception_bases     = np.concatenate(exception_bases).astype(np.uint8)     if exception_bases     else np.zeros(0, dtype=np.uint8)
+
+            header['contigs'].append( {'name':            contig_i,
+                                       'length':          length_i,
+                                       'right_run':       run_offset,
+                                       'sequence':        write_array(cache, np.concatenate(packed_chunks) if packed_chunks else np.zeros(0, dtype=np.uint8)),
+                                       'n_starts':        write_array(cache, n_starts),
+                                       'n_ends':          write_array(cache, n_ends),
+                                       'n_blocks':        len(n_starts),
+                                       'mask_starts':     write_array(cache, mask_starts),
+                                       'mask_ends':       write_array(cache, mask_ends),
+                                       'mask_blocks':     len(mask_starts),
+                                       'exception_positions': write_array(cache, exception_positions),
+                                       'exception_bases':     write_array(cache, exception_bases),
+                                       'exceptions':      len(exception_positions),} )
+
+            logger.info( 'Cached {}: {} bp'.format(contig_i, length_i) )
+
+        pad_to_8(cache)
+        header_offset = cache.tell()
+        cache.write( json.dumps(header).encode() )
+        cache.write( struct.pack('<Q', header_offset) + MAGIC )
+
+    os.replace(cache_file + '.tmp', cache_file)
+
+    return cache_file
+
+
+
+class CachedContig:
+    '''
+    Views of one contig in the memory-mapped cache file. They are memoryviews rather than numpy arrays, because per-site lookups are a handful of bytes, where numpy's overhead would be most of the time.
+    '''
+
+    def __init__(self, cache_view, contig_header):
+
+        def view_at(offset_i, length_i, format_i):
+            return cache_view[ offset_i : offset_i + length_i * struct.calcsize(format_i) ].cast(format_i)
+
+        self.length      = contig_header['length']
+        self.right_run   = view_at( contig_header['right_run'],   self.length,            'B' )
+        self.sequence    = view_at( contig_header['sequence'],    (self.length + 3) // 4, 'B' )
+        self.n_starts    = view_at( contig_header['n_starts'],    contig_header['n_blocks'],    'q' )
+        self.n_ends      = view_at( contig_header['n_ends'],      contig_header['n_blocks'],    'q' )
+        self.mask_starts = view_at( contig_header['mask_starts'], contig_header['mask_blocks'], 'q' )
+        self.mask_ends   = view_at( contig_header['mask_ends'],   contig_header['mask_blocks'], 'q' )
+
+        exception_positions = view_at( contig_header['exception_positions'], contig_header['exceptions'], 'q' )
+        exception_bases     = view_at( contig_header['exception_bases'],     contig_header['exceptions'], 'B' )
+        self.exceptions     = dict( zip(exception_positions.tolist(), map(chr, exception_bases.tolist())) )
+
+
+    @staticmethod
+    def in_blocks(position, starts, ends):
+        i = bisect_right(starts, position) - 1
+        return i >= 0 and position < ends[i]
+
+
+    def base(self, position):
+        '''The character at a 0-based position, as it is in the fasta file'''
+
+        if position in self.exceptions:
+            return self.exceptions[position]
+
+        if self.in_blocks(position, self.n_starts, self.n_ends):
+            base_i = 'N'
+        else:
+            base_i = 'ACGT'[ (self.sequence[position >> 2] >> (6 - 2*(position & 3))) & 3 ]
+
+        return base_i.lower() if self.in_blocks(position, self.mask_starts, self.mask_ends) else base_i
+
+
+    def fetch(self, start, end):
+        '''Sequence of [start, end), clipped to the contig like pysam.FastaFile.fetch'''
+        start, end = min(max(start, 0), self.length), min(end, self.length)
+        return ''.join( [self.base(i) for i in range(start, end)] )
+
+
+    def homopolymers(self, start, end):
+        '''
+        Homopolymers in [start, end), cut off by the ends of the window. Returns the longest one and the last one.
+        Only the last homopolymer can run past the end, so it is measured by walking back while the base to the left continues into it, i.e., has right_run > 1.
+        '''
+
+        if start >= end:
+            return 0, 0
+
+        right_run  = self.right_run
+        last_start = end - 1
+
+        while last_start > start and right_run[last_start-1] > 1:
+            last_start -= 1
+
+        return max( max(right_run[start:last_start], default=0), end-last_start ), end-last_start
+
+
+
+class ReferenceCache:
+
+    def __init__(self, cache_file):
+
+        self.filename = cache_file
+
+        with open(cache_file, 'rb') as cache:
+            self.cache_map = mmap.mmap( cache.fileno(), 0, access=mmap.ACCESS_READ )
+
+        if self.cache_map[:8] != MAGIC or self.cache_map[-8:] != MAGIC:
+            raise Exception( '{} is not a reference cache. Build it with genomicFileHandler/reference_cache.py.'.format(cache_file) )
+
+        header_offset, = struct.unpack( '<Q', self.cache_map[-16:-8] )
+        header = json.loads( self.cache_map[header_offset:-16].decode() )
+
+        self.cache_view     = memoryview(self.cache_map)
+        self.contig_headers = { contig_i['name']: contig_i for contig_i in header['contigs'] }
+        self.references     = tuple( contig_i['name']   for contig_i in header['contigs'] )
+        self.lengths        = tuple( contig_i['length'] for contig_i in header['contigs'] )
+        self.contigs        = {}
+
+
+    def contig(self, contig_name):
+
+        if contig_name not in self.contigs:
+            self.contigs[contig_name] = CachedContig(self.cache_view, self.contig_headers[contig_name])
+
+        return self.contigs[contig_name]
+
+
+    def get_reference_length(self, contig_name):
+        return self.contig_headers[contig_name]['length']
+
+
+    def fetch(self, contig_name, start, end):
+        return self.contig(contig_name).fetch(start, end)
+
+
+    def check(self, fai_file):
+        '''Make sure the cache was built from a reference with the same contigs'''
+
+        with genome.open_textfile(fai_file) as fai:
+            contig_lengths = [ ( line_i.split('\t')[0], int(line_i.split('\t')[1]) ) for line_i in fai if line_i.strip() ]
+
+        if contig_lengths != list( zip(self.references, self.lengths) ):
+            raise Exception( 'Reference cache {} does not match {}. Rebuild it.'.format(self.filename, fai_file) )
+
+
+    def close(self):
+
+        # The memoryviews have to be released before the mmap can be closed:
+        for contig_i in self.contigs.values():
+            for view_i in (contig_i.right_run, contig_i.sequence, contig_i.n_starts, contig_i.n_ends, contig_i.mask_starts, contig_i.mask_ends):
+                view_i.release()
+
+        self.contigs = {}
+        self.cache_view.release()
+        self.cache_map.close()
+
+
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-ref',   '--genome-reference', type=str, help='Indexed fasta file', required=True)
+    parser.add_argument('-out',   '--output-cache',     type=str, help='Output cache file. Default is the reference file name + .ssref')
+
+    args = parser.parse_args()
+
+    return args.genome_reference, args.output_cache
+
+
+
+if __name__ == '__main__':
+
+    ref_fa, cache_file = run()
+
+    cache_file = build(ref_fa, cache_file)
+
+    logger.info( 'Reference cache written to {}'.format(cache_file) )
@@ -16,6 +16,9 @@ setup(
     package_data={'': ['*.R']},
     install_requires=['pysam', 'numpy', 'scipy'],
     scripts=['somaticseq/run_somaticseq.py',
+             'somaticseq/annotation_index.py',
+             'somaticseq/ada_predictor.py',
+             'somaticseq/ada_trainer.py',
              'somaticseq_parallel.py',
              'utilities/dockered_pipelines/makeSomaticScripts.py',],
 )
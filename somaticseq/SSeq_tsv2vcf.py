@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 import sys, argparse, math, gzip, os
+import numpy as np
+from itertools import compress, repeat
+from operator import itemgetter
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
@@ -11,6 +14,13 @@ from somaticseq._version import vcf_header as version_line
 
 nan = float('nan')
 
+# Number of TSV lines tsv2vcf hands to VcfWriter.write_block at a time
+BLOCK_SIZE = 10000
+
+# The columns of the Ensemble TSV that VcfWriter writes into the FORMAT fields, to be worked out by vcf2tsv even if the classifier does not need them
+FORMAT_FEATURES = ('N_REF_FOR', 'N_REF_REV', 'N_ALT_FOR', 'N_ALT_REV', 'nBAM_REF_Concordant', 'nBAM_REF_Discordant', 'nBAM_ALT_Concordant', 'nBAM_REF_MQ', 'nBAM_ALT_MQ', 'nBAM_REF_BQ', 'nBAM_ALT_BQ', 'nBAM_REF_NM', 'nBAM_ALT_NM', 'nBAM_StrandBias_FET', 'nBAM_Concordance_FET', 'nBAM_Z_Ranksums_MQ', 'nBAM_Z_Ranksums_BQ', 'nBAM_MQ0', \
+                   'T_REF_FOR', 'T_REF_REV', 'T_ALT_FOR', 'T_ALT_REV', 'tBAM_REF_Concordant', 'tBAM_REF_Discordant', 'tBAM_ALT_Concordant', 'tBAM_ALT_Discordant', 'tBAM_REF_MQ', 'tBAM_ALT_MQ', 'tBAM_REF_BQ', 'tBAM_ALT_BQ', 'tBAM_REF_NM', 'tBAM_ALT_NM', 'tBAM_StrandBias_FET', 'tBAM_Concordance_FET', 'tBAM_Z_Ranksums_MQ', 'tBAM_Z_Ranksums_BQ', 'tBAM_MQ0')
+
 
 def run():
     
@@ -81,7 +91,12 @@ def dp4_to_gt(ref_for, ref_rev, alt_for, alt_rev, hom_threshold=0.85, het_thresh
 
 
 
-def tsv2vcf(tsv_fn, vcf_fn, tools, pass_score=0.5, lowqual_score=0.1, hom_threshold=0.85, het_threshold=0.01, single_mode=False, paired_mode=True, normal_sample_name='NORMAL', tumor_sample_name='TUMOR', print_reject=True, phred_scaled=True):
+class VcfWriter:
+
+    '''
+    Writes the VCF lines of Ensemble TSV lines, split into items, one at a time or a block at a time, with the header of the VCF file written once it's opened.
+    tsv2vcf feeds it from a TSV file, and ada_predictor.StreamingClassifier from vcf2tsv as it goes.
+    '''
 
     tools_code = {'CGA':           'M',
                   'MuTect':        'M',
@@ -96,104 +111,117 @@ def tsv2vcf(tsv_fn, vcf_fn, tools, pass_score=0.5, lowqual_score=0.1, hom_thresh
                   'Strelka':       'K',
                   'TNscope':       'T',
                   'Platypus':      'Y'}
-    
-    
-    mvjsdu = ''
-    for tool_i in tools:
-        assert tool_i in tools_code.keys()
-        mvjsdu = mvjsdu + tools_code[tool_i]
-    
-    total_num_tools = len(mvjsdu)
-    tool_string = ', '.join( tools )
-        
-    
-    with open(tsv_fn) as tsv, open(vcf_fn, 'w') as vcf:
-        
-        # First line is a header:
-        tsv_i = tsv.readline().rstrip()
-        
-        tsv_header = tsv_i.split('\t')
-        
+
+    def __init__(self, vcf_fn, tsv_header, tools, pass_score=0.5, lowqual_score=0.1, hom_threshold=0.85, het_threshold=0.01, single_mode=False, paired_mode=True, normal_sample_name='NORMAL', tumor_sample_name='TUMOR', print_reject=True, phred_scaled=True):
+
+        self.pass_score    = pass_score
+        self.lowqual_score = lowqual_score
+        self.hom_threshold = hom_threshold
+        self.het_threshold = het_threshold
+        self.single_mode   = single_mode
+        self.paired_mode   = paired_mode
+        self.print_reject  = print_reject
+        self.phred_scaled  = phred_scaled
+
+        mvjsdu = ''
+        for tool_i in tools:
+            assert tool_i in self.tools_code.keys()
+            mvjsdu = mvjsdu + self.tools_code[tool_i]
+
+        self.mvjsdu = mvjsdu
+        self.total_num_tools = len(mvjsdu)
+        tool_string = ', '.join( tools )
+
         # Make the header items into indices (single/paired have different tool names)
-        toolcode2index = {}
+        self.toolcode2index = {}
+        self.MuSE_Tier      = None
         for n,item in enumerate(tsv_header):
-        
+
             if   'if_MuTect'        == item:
-                toolcode2index['M'] = n
+                self.toolcode2index['M'] = n
             elif 'if_VarScan2'      == item:
-                toolcode2index['V'] = n
+                self.toolcode2index['V'] = n
             elif 'if_JointSNVMix2'  == item:
-                toolcode2index['J'] = n
+                self.toolcode2index['J'] = n
             elif 'if_SomaticSniper' == item:
-                toolcode2index['S'] = n
+                self.toolcode2index['S'] = n
             elif 'if_VarDict'       == item:
-                toolcode2index['D'] = n
+                self.toolcode2index['D'] = n
             elif 'MuSE_Tier'        == item:
-                toolcode2index['U'] = n
-                MuSE_Tier = tsv_header.index('MuSE_Tier')
+                self.toolcode2index['U'] = n
+                self.MuSE_Tier = tsv_header.index('MuSE_Tier')
             elif 'if_LoFreq'        == item:
-                toolcode2index['L'] = n
+                self.toolcode2index['L'] = n
             elif 'if_Scalpel'       == item:
-                toolcode2index['P'] = n
+                self.toolcode2index['P'] = n
             elif 'if_Strelka'       == item:
-                toolcode2index['K'] = n
+                self.toolcode2index['K'] = n
             elif 'if_TNscope'       == item:
-                toolcode2index['T'] = n
+                self.toolcode2index['T'] = n
             elif 'if_Platypus'       == item:
-                toolcode2index['Y'] = n
-
-
-        ALT                  = tsv_header.index('ALT')
-        CHROM                = tsv_header.index('CHROM')
-        ID                   = tsv_header.index('ID')
-        POS                  = tsv_header.index('POS')
-        REF                  = tsv_header.index('REF')
-        T_ALT_FOR            = tsv_header.index('T_ALT_FOR')
-        T_ALT_REV            = tsv_header.index('T_ALT_REV')
-        tBAM_ALT_BQ          = tsv_header.index('tBAM_ALT_BQ')
-        tBAM_ALT_Concordant  = tsv_header.index('tBAM_ALT_Concordant')
-        tBAM_ALT_Discordant  = tsv_header.index('tBAM_ALT_Discordant')
-        tBAM_ALT_MQ          = tsv_header.index('tBAM_ALT_MQ')
-        tBAM_ALT_NM          = tsv_header.index('tBAM_ALT_NM')
-        tBAM_Concordance_FET = tsv_header.index('tBAM_Concordance_FET')
-        tBAM_MQ0             = tsv_header.index('tBAM_MQ0')
-        tBAM_REF_BQ          = tsv_header.index('tBAM_REF_BQ')
-        tBAM_REF_Concordant  = tsv_header.index('tBAM_REF_Concordant')
-        tBAM_REF_Discordant  = tsv_header.index('tBAM_REF_Discordant')
-        tBAM_REF_MQ          = tsv_header.index('tBAM_REF_MQ')
-        tBAM_REF_NM          = tsv_header.index('tBAM_REF_NM')
-        tBAM_StrandBias_FET  = tsv_header.index('tBAM_StrandBias_FET')
-        tBAM_Z_Ranksums_BQ   = tsv_header.index('tBAM_Z_Ranksums_BQ')
-        tBAM_Z_Ranksums_MQ   = tsv_header.index('tBAM_Z_Ranksums_MQ')
-        T_REF_FOR            = tsv_header.index('T_REF_FOR')
-        T_REF_REV            = tsv_header.index('T_REF_REV')
-        
-        
+                self.toolcode2index['Y'] = n
+
+
+        self.ALT                  = tsv_header.index('ALT')
+        self.CHROM                = tsv_header.index('CHROM')
+        self.ID                   = tsv_header.index('ID')
+        self.POS                  = tsv_header.index('POS')
+        self.REF                  = tsv_header.index('REF')
+        self.T_ALT_FOR            = tsv_header.index('T_ALT_FOR')
+        self.T_ALT_REV            = tsv_header.index('T_ALT_REV')
+        self.tBAM_ALT_BQ          = tsv_header.index('tBAM_ALT_BQ')
+        self.tBAM_ALT_Concordant  = tsv_header.index('tBAM_ALT_Concordant')
+        self.tBAM_ALT_Discordant  = tsv_header.index('tBAM_ALT_Discordant')
+        self.tBAM_ALT_MQ          = tsv_header.index('tBAM_ALT_MQ')
+        self.tBAM_ALT_NM          = tsv_header.index('tBAM_ALT_NM')
+        self.tBAM_Concordance_FET = tsv_header.index('tBAM_Concordance_FET')
+        self.tBAM_MQ0             = tsv_header.index('tBAM_MQ0')
+        self.tBAM_REF_BQ          = tsv_header.index('tBAM_REF_BQ')
+        self.tBAM_REF_Concordant  = tsv_header.index('tBAM_REF_Concordant')
+        self.tBAM_REF_Discordant  = tsv_header.index('tBAM_REF_Discordant')
+        self.tBAM_REF_MQ          = tsv_header.index('tBAM_REF_MQ')
+        self.tBAM_REF_NM          = tsv_header.index('tBAM_REF_NM')
+        self.tBAM_StrandBias_FET  = tsv_header.index('tBAM_StrandBias_FET')
+        self.tBAM_Z_Ranksums_BQ   = tsv_header.index('tBAM_Z_Ranksums_BQ')
+        self.tBAM_Z_Ranksums_MQ   = tsv_header.index('tBAM_Z_Ranksums_MQ')
+        self.T_REF_FOR            = tsv_header.index('T_REF_FOR')
+        self.T_REF_REV            = tsv_header.index('T_REF_REV')
+
+
         if not single_mode:
-            N_ALT_FOR            = tsv_header.index('N_ALT_FOR')
-            N_ALT_REV            = tsv_header.index('N_ALT_REV')
-            nBAM_ALT_BQ          = tsv_header.index('nBAM_ALT_BQ')
-            nBAM_ALT_Concordant  = tsv_header.index('nBAM_ALT_Concordant')
-            nBAM_ALT_MQ          = tsv_header.index('nBAM_ALT_MQ')
-            nBAM_ALT_NM          = tsv_header.index('nBAM_ALT_NM')
-            nBAM_Concordance_FET = tsv_header.index('nBAM_Concordance_FET')
-            nBAM_MQ0             = tsv_header.index('nBAM_MQ0')
-            nBAM_REF_BQ          = tsv_header.index('nBAM_REF_BQ')
-            nBAM_REF_Concordant  = tsv_header.index('nBAM_REF_Concordant')
-            nBAM_REF_Discordant  = tsv_header.index('nBAM_REF_Discordant')
-            nBAM_REF_MQ          = tsv_header.index('nBAM_REF_MQ')
-            nBAM_REF_NM          = tsv_header.index('nBAM_REF_NM')
-            nBAM_StrandBias_FET  = tsv_header.index('nBAM_StrandBias_FET')
-            nBAM_Z_Ranksums_BQ   = tsv_header.index('nBAM_Z_Ranksums_BQ')
-            nBAM_Z_Ranksums_MQ   = tsv_header.index('nBAM_Z_Ranksums_MQ')
-            N_REF_FOR            = tsv_header.index('N_REF_FOR')
-            N_REF_REV            = tsv_header.index('N_REF_REV')
+            self.N_ALT_FOR            = tsv_header.index('N_ALT_FOR')
+            self.N_ALT_REV            = tsv_header.index('N_ALT_REV')
+            self.nBAM_ALT_BQ          = tsv_header.index('nBAM_ALT_BQ')
+            self.nBAM_ALT_Concordant  = tsv_header.index('nBAM_ALT_Concordant')
+            self.nBAM_ALT_MQ          = tsv_header.index('nBAM_ALT_MQ')
+            self.nBAM_ALT_NM          = tsv_header.index('nBAM_ALT_NM')
+            self.nBAM_Concordance_FET = tsv_header.index('nBAM_Concordance_FET')
+            self.nBAM_MQ0             = tsv_header.index('nBAM_MQ0')
+            self.nBAM_REF_BQ          = tsv_header.index('nBAM_REF_BQ')
+            self.nBAM_REF_Concordant  = tsv_header.index('nBAM_REF_Concordant')
+            self.nBAM_REF_Discordant  = tsv_header.index('nBAM_REF_Discordant')
+            self.nBAM_REF_MQ          = tsv_header.index('nBAM_REF_MQ')
+            self.nBAM_REF_NM          = tsv_header.index('nBAM_REF_NM')
+            self.nBAM_StrandBias_FET  = tsv_header.index('nBAM_StrandBias_FET')
+            self.nBAM_Z_Ranksums_BQ   = tsv_header.index('nBAM_Z_Ranksums_BQ')
+            self.nBAM_Z_Ranksums_MQ   = tsv_header.index('nBAM_Z_Ranksums_MQ')
+            self.N_REF_FOR            = tsv_header.index('N_REF_FOR')
+            self.N_REF_REV            = tsv_header.index('N_REF_REV')
 
-        try:
-            SCORE = tsv_header.index('SCORE')
-        except ValueError:
-            pass
+        self.SCORE = tsv_header.index('SCORE') if 'SCORE' in tsv_header else None
 
+        # The DP4, CD4, and other FORMAT field columns of each sample, in the order write puts them, for vcf_lines:
+        self.tumor_columns = ( (self.T_REF_FOR, self.T_REF_REV, self.T_ALT_FOR, self.T_ALT_REV), \
+                               (self.tBAM_REF_Concordant, self.tBAM_REF_Discordant, self.tBAM_ALT_Concordant, self.tBAM_ALT_Discordant), \
+                               (self.tBAM_REF_MQ, self.tBAM_ALT_MQ, self.tBAM_REF_BQ, self.tBAM_ALT_BQ, self.tBAM_REF_NM, self.tBAM_ALT_NM, self.tBAM_StrandBias_FET, self.tBAM_Concordance_FET, self.tBAM_Z_Ranksums_MQ, self.tBAM_Z_Ranksums_BQ, self.tBAM_MQ0) )
+
+        if not single_mode:
+            self.normal_columns = ( (self.N_REF_FOR, self.N_REF_REV, self.N_ALT_FOR, self.N_ALT_REV), \
+                                    (self.nBAM_REF_Concordant, self.nBAM_REF_Discordant, self.nBAM_ALT_Concordant, self.nBAM_ALT_Concordant), \
+                                    (self.nBAM_REF_MQ, self.nBAM_ALT_MQ, self.nBAM_REF_BQ, self.nBAM_ALT_BQ, self.nBAM_REF_NM, self.nBAM_ALT_NM, self.nBAM_StrandBias_FET, self.nBAM_Concordance_FET, self.nBAM_Z_Ranksums_MQ, self.nBAM_Z_Ranksums_BQ, self.nBAM_MQ0) )
+
+
+        self.vcf = vcf = open(vcf_fn, 'w')
 
         # Create vcf headers:
         vcf.write('##fileformat=VCFv4.1\n')
@@ -202,221 +230,395 @@ def tsv2vcf(tsv_fn, vcf_fn, tools, pass_score=0.5, lowqual_score=0.1, hom_thresh
         vcf.write('##FILTER=<ID=PASS,Description="Accept as a confident somatic mutation calls with probability value at least {}">\n'.format(pass_score) )
         vcf.write('##FILTER=<ID=REJECT,Description="Rejected as a confident somatic mutation with ONCOSCORE below 2">\n')
         vcf.write('##INFO=<ID=SOMATIC,Number=0,Type=Flag,Description="Somatic mutation in primary">\n')
-        vcf.write('##INFO=<ID={COMBO},Number={NUM},Type=Integer,Description="Calling decision of the {NUM} algorithms: {TOOL_STRING}">\n'.format(COMBO=mvjsdu, NUM=total_num_tools, TOOL_STRING=tool_string) )
+        vcf.write('##INFO=<ID={COMBO},Number={NUM},Type=Integer,Description="Calling decision of the {NUM} algorithms: {TOOL_STRING}">\n'.format(COMBO=mvjsdu, NUM=self.total_num_tools, TOOL_STRING=tool_string) )
         vcf.write('##INFO=<ID=NUM_TOOLS,Number=1,Type=Float,Description="Number of tools called it Somatic">\n')
-        
+
         if single_mode:
             vcf.write('##INFO=<ID=AF,Number=1,Type=Float,Description="Variant Allele Fraction">\n')
-        
+
         vcf.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
         vcf.write('##FORMAT=<ID=DP4,Number=4,Type=Integer,Description="ref forward, ref reverse, alt forward, alt reverse">\n')
         vcf.write('##FORMAT=<ID=CD4,Number=4,Type=Integer,Description="ref concordant, ref discordant, alt concordant, alt discordant">\n')
-    
+
         vcf.write('##FORMAT=<ID=refMQ,Number=1,Type=Float,Description="average mapping score for reference reads">\n')
         vcf.write('##FORMAT=<ID=altMQ,Number=1,Type=Float,Description="average mapping score for alternate reads">\n')
         vcf.write('##FORMAT=<ID=refBQ,Number=1,Type=Float,Description="average base quality score for reference reads">\n')
         vcf.write('##FORMAT=<ID=altBQ,Number=1,Type=Float,Description="average base quality score for alternate reads">\n')
         vcf.write('##FORMAT=<ID=refNM,Number=1,Type=Float,Description="average edit distance for reference reads">\n')
         vcf.write('##FORMAT=<ID=altNM,Number=1,Type=Float,Description="average edit distance for alternate reads">\n')
-    
+
         vcf.write('##FORMAT=<ID=fetSB,Number=1,Type=Float,Description="Strand bias FET">\n')
         vcf.write('##FORMAT=<ID=fetCD,Number=1,Type=Float,Description="Concordance FET">\n')
         vcf.write('##FORMAT=<ID=zMQ,Number=1,Type=Float,Description="z-score rank sum of mapping quality">\n')
         vcf.write('##FORMAT=<ID=zBQ,Number=1,Type=Float,Description="z-score rank sum of base quality">\n')
         vcf.write('##FORMAT=<ID=MQ0,Number=1,Type=Integer,Description="Number of reads with mapping quality of 0">\n')
         vcf.write('##FORMAT=<ID=VAF,Number=1,Type=Float,Description="Variant Allele Frequency">\n')
-    
+
         if single_mode:
             vcf.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\n'.format(tumor_sample_name) )
         elif paired_mode:
             vcf.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\t{}\n'.format(normal_sample_name, tumor_sample_name) )
-        
-        
-        # Start writing content:
-        tsv_i = tsv.readline().rstrip()
-        
-        
-        while tsv_i:
-            
-            tsv_item = tsv_i.split('\t')
-            try:
-                score = float( tsv_item[SCORE] )
-            except NameError:
-                score = nan
-    
-            if phred_scaled:
-                scaled_score = p2phred(1-score, max_phred = 255)
+
+
+    def close(self):
+        self.vcf.close()
+
+
+    def write_block(self, tsv_items):
+        '''
+        Same as write for each of tsv_items, i.e., TSV lines split by tabs, but column by column, with the numbers in numpy arrays, and their VCF lines are written at once.
+        A block with anything vcf_lines does not take, e.g., a caller decision of nan, goes through write line by line instead, to have the same lines or the same error.
+        '''
+
+        if not tsv_items:
+            return
+
+        try:
+            vcf_lines = self.vcf_lines(tsv_items)
+
+        except (ValueError, IndexError):
+            for tsv_item in tsv_items:
+                self.write(tsv_item)
+
+        else:
+            self.vcf.write( vcf_lines )
+
+
+    def vcf_lines(self, tsv_items):
+        '''The text write would write for all of tsv_items. Raises ValueError for what it leaves to write.'''
+
+        num_items = len(tsv_items)
+
+        tool_indices   = [ self.toolcode2index[tool_i] for tool_i in self.mvjsdu ]
+        sample_columns = (self.tumor_columns,) if self.single_mode else (self.normal_columns, self.tumor_columns)
+
+        # The columns it takes, out of every line in one go, as tuples of strings:
+        indices = {self.CHROM, self.POS, self.ID, self.REF, self.ALT} | set(tool_indices) | { index_i for sample_i in sample_columns for columns_i in sample_i for index_i in columns_i }
+        if self.SCORE is not None:
+            indices.add( self.SCORE )
+
+        indices = sorted(indices)
+        columns = dict( zip(indices, zip(*map(itemgetter(*indices), tsv_items))) )
+
+        def field(index, missing):
+            values = columns[index]
+            if 'nan' in values:
+                values = list( map({'nan': missing}.get, values, values) )
+            return values
+
+        def counts(values):
+            return np.fromiter( map(int, values), dtype=np.int64, count=num_items )
+
+        def sample_string(dp4_indices, cd4_indices, other_indices):
+            '''GT:DP4:CD4:...:VAF of a sample for every line, and its VAF'''
+
+            dp4 = [ field(index_i, '0') for index_i in dp4_indices ]
+            cd4 = [ field(index_i, '0') for index_i in cd4_indices ]
+
+            ref_for, ref_rev, alt_for, alt_rev = map(counts, dp4)
+            ref_counts  = ref_for + ref_rev
+            var_counts  = alt_for + alt_rev
+            all_counts  = ref_counts + var_counts
+            no_counts   = all_counts == 0
+
+            # dp4_to_gt divides by zero on these:
+            if ( no_counts & ((ref_counts != 0) | (var_counts != 0)) ).any():
+                raise ValueError('Read counts adding up to 0')
+
+            vaf = var_counts / np.where(no_counts, 1, all_counts)
+            gt  = np.select( (no_counts, vaf > self.hom_threshold, vaf >= self.het_threshold), ('./.', '1/1', '0/1'), '0/0' ).tolist()
+            vaf = [ '%.3g' % vaf_i for vaf_i in vaf.tolist() ]
+
+            others = [ field(index_i, '.') for index_i in other_indices ]
+
+            return list( map(':'.join, zip(gt, map(','.join, zip(*dp4)), map(','.join, zip(*cd4)), *others, vaf)) ), vaf
+
+        # Caller decisions, which write takes only as 1 or otherwise 0:
+        num_tools = np.zeros(num_items, dtype=np.int64)
+        decisions = []
+        for tool_index_i in tool_indices:
+            if_Tool = np.array( columns[tool_index_i], dtype=object )
+
+            if (if_Tool == 'nan').any():
+                raise ValueError('Caller decision of nan')
+
+            is_called  = if_Tool == '1'
+            num_tools += is_called
+            decisions.append( np.where(is_called, '1', '0').tolist() )
+
+        MVJS = list( map(','.join, zip(*decisions)) ) if decisions else [''] * num_items
+        info_strings = [ '{}={};NUM_TOOLS={}'.format(self.mvjsdu, MVJS_i, num_tools_i) for MVJS_i, num_tools_i in zip(MVJS, num_tools.tolist()) ]
+
+        # NORMAL
+        if not self.single_mode:
+            normal_sample_strings, normal_vaf = sample_string( *self.normal_columns )
+
+        ### TUMOR ###
+        tumor_sample_strings, tumor_vaf = sample_string( *self.tumor_columns )
+
+        # Add VAF to info string if and only if there is one single sample in the VCF sample
+        if self.single_mode:
+            info_strings = [ info_i + ';AF=' + vaf_i for info_i, vaf_i in zip(info_strings, tumor_vaf) ]
+
+        if self.single_mode:
+            sample_strings = (tumor_sample_strings,)
+        elif self.paired_mode:
+            sample_strings = (normal_sample_strings, tumor_sample_strings)
+        else:
+            sample_strings = ()
+
+        # QUAL and FILTER, with p2phred's cases:
+        if self.SCORE is not None:
+            score = np.fromiter( map(float, columns[self.SCORE]), dtype=np.float64, count=num_items )
+
+            if self.phred_scaled:
+                p = 1 - score
+                scaled_score = np.full(num_items, nan)
+                in_between   = (p > 0) & (p < 1)
+                scaled_score[ in_between ] = [ -10 * math.log10(p_i) for p_i in p[in_between].tolist() ]
+                scaled_score[ p == 0 ] = 255
+                scaled_score[ p == 1 ] = 0
+                scaled_score[ scaled_score > 255 ] = 255
             else:
                 scaled_score = score
-            
-            
-            try:
-                # Non-PASS MuSE calls are made into fractions. 
-                if tsv_item[MuSE_Tier] != '1':
-                    if_MuSE = '0'
-                else:
-                    if_MuSE = '1'
-            except NameError:
-                if_MuSE = '.'
-            
-            
-            MVJS = []
-            num_tools = 0
-            for tool_i in mvjsdu:
-                
-                if_Tool = tsv_item[ toolcode2index[tool_i] ]
-                
-                if if_Tool == '1':
-                    if_Tool = '1'
-                
-                elif if_Tool == 'nan':
-                    if_Tool = '.'
-                
-                else:
-                    if_Tool = '0'
-                
-                MVJS.append( if_Tool )
-                num_tools = num_tools + int(if_Tool)
-                
-            MVJS = ','.join(MVJS)
-                
-            info_string = '{COMBO}={MVJSD};NUM_TOOLS={NUM_TOOLS}'.format( COMBO=mvjsdu, MVJSD=MVJS, NUM_TOOLS=num_tools )
-    
-            # NORMAL
-            if not single_mode:
-                n_ref_mq  = tsv_item[nBAM_REF_MQ]          if tsv_item[nBAM_REF_MQ]          != 'nan' else '.'
-                n_alt_mq  = tsv_item[nBAM_ALT_MQ]          if tsv_item[nBAM_ALT_MQ]          != 'nan' else '.'
-                n_ref_bq  = tsv_item[nBAM_REF_BQ]          if tsv_item[nBAM_REF_BQ]          != 'nan' else '.'
-                n_alt_bq  = tsv_item[nBAM_ALT_BQ]          if tsv_item[nBAM_ALT_BQ]          != 'nan' else '.'
-                n_ref_nm  = tsv_item[nBAM_REF_NM]          if tsv_item[nBAM_REF_NM]          != 'nan' else '.'
-                n_alt_nm  = tsv_item[nBAM_ALT_NM]          if tsv_item[nBAM_ALT_NM]          != 'nan' else '.'
-                n_MQ0     = tsv_item[nBAM_MQ0]             if tsv_item[nBAM_MQ0]             != 'nan' else '.'
-                
-                n_sb      = tsv_item[nBAM_StrandBias_FET]  if tsv_item[nBAM_StrandBias_FET]  != 'nan' else '.'
-                n_cd      = tsv_item[nBAM_Concordance_FET] if tsv_item[nBAM_Concordance_FET] != 'nan' else '.'
-                n_bqb     = tsv_item[nBAM_Z_Ranksums_BQ]   if tsv_item[nBAM_Z_Ranksums_BQ]   != 'nan' else '.'
-                n_mqb     = tsv_item[nBAM_Z_Ranksums_MQ]   if tsv_item[nBAM_Z_Ranksums_MQ]   != 'nan' else '.'
-                
-                n_ref_for = tsv_item[N_REF_FOR] if tsv_item[N_REF_FOR] != 'nan' else '0'
-                n_ref_rev = tsv_item[N_REF_REV] if tsv_item[N_REF_REV] != 'nan' else '0'
-                n_alt_for = tsv_item[N_ALT_FOR] if tsv_item[N_ALT_FOR] != 'nan' else '0'
-                n_alt_rev = tsv_item[N_ALT_REV] if tsv_item[N_ALT_REV] != 'nan' else '0'
-                
-                n_ref_con = tsv_item[nBAM_REF_Concordant] if tsv_item[nBAM_REF_Concordant] != 'nan' else '0'
-                n_ref_dis = tsv_item[nBAM_REF_Discordant] if tsv_item[nBAM_REF_Discordant] != 'nan' else '0'
-                n_alt_con = tsv_item[nBAM_ALT_Concordant] if tsv_item[nBAM_ALT_Concordant] != 'nan' else '0'
-                n_alt_dis = tsv_item[nBAM_ALT_Concordant] if tsv_item[nBAM_ALT_Concordant] != 'nan' else '0'
-                
-        
-                # DP4toGT:
-                gt = dp4_to_gt(n_ref_for, n_ref_rev, n_alt_for, n_alt_rev, hom_threshold, het_threshold)
-                
-                # 4-number strings:
-                dp4_string = ','.join(( n_ref_for, n_ref_rev, n_alt_for, n_alt_rev ))
-                cd4_string = ','.join(( n_ref_con, n_ref_dis, n_alt_con, n_alt_dis ))
-                
-                try:
-                    vaf = ( int(n_alt_for) + int(n_alt_rev) ) / ( int(n_alt_for) + int(n_alt_rev) + int(n_ref_for) + int(n_ref_rev) )
-                except ZeroDivisionError:
-                    vaf = 0
-                vaf = '%.3g' % vaf
-                
-                normal_sample_string = '{GT}:{DP4}:{CD4}:{refMQ}:{altMQ}:{refBQ}:{altBQ}:{refNM}:{altNM}:{fetSB}:{fetCD}:{zMQ}:{zBQ}:{MQ0}:{VAF}'.format(GT=gt, DP4=dp4_string, CD4=cd4_string, refMQ=n_ref_mq, altMQ=n_alt_mq, refBQ=n_ref_bq, altBQ=n_alt_bq, refNM=n_ref_nm, altNM=n_alt_nm, fetSB=n_sb, fetCD=n_cd, zMQ=n_mqb, zBQ=n_bqb, MQ0=n_MQ0, VAF=vaf)
-    
-    
-            ### TUMOR ###
-            t_ref_mq  = tsv_item[tBAM_REF_MQ]          if tsv_item[tBAM_REF_MQ]          != 'nan' else '.'
-            t_alt_mq  = tsv_item[tBAM_ALT_MQ]          if tsv_item[tBAM_ALT_MQ]          != 'nan' else '.'
-            t_ref_bq  = tsv_item[tBAM_REF_BQ]          if tsv_item[tBAM_REF_BQ]          != 'nan' else '.'
-            t_alt_bq  = tsv_item[tBAM_ALT_BQ]          if tsv_item[tBAM_ALT_BQ]          != 'nan' else '.'
-            t_ref_nm  = tsv_item[tBAM_REF_NM]          if tsv_item[tBAM_REF_NM]          != 'nan' else '.'
-            t_alt_nm  = tsv_item[tBAM_ALT_NM]          if tsv_item[tBAM_ALT_NM]          != 'nan' else '.'        
-            t_MQ0     = tsv_item[tBAM_MQ0]             if tsv_item[tBAM_MQ0]             != 'nan' else '.'
-            
-            t_sb      = tsv_item[tBAM_StrandBias_FET]  if tsv_item[tBAM_StrandBias_FET]  != 'nan' else '.'
-            t_cd      = tsv_item[tBAM_Concordance_FET] if tsv_item[tBAM_Concordance_FET] != 'nan' else '.'        
-            t_bqb     = tsv_item[tBAM_Z_Ranksums_BQ]   if tsv_item[tBAM_Z_Ranksums_BQ]   != 'nan' else '.'
-            t_mqb     = tsv_item[tBAM_Z_Ranksums_MQ]   if tsv_item[tBAM_Z_Ranksums_MQ]   != 'nan' else '.'
-            
-            t_ref_for = tsv_item[T_REF_FOR] if tsv_item[T_REF_FOR] != 'nan' else '0'
-            t_ref_rev = tsv_item[T_REF_REV] if tsv_item[T_REF_REV] != 'nan' else '0'
-            t_alt_for = tsv_item[T_ALT_FOR] if tsv_item[T_ALT_FOR] != 'nan' else '0'
-            t_alt_rev = tsv_item[T_ALT_REV] if tsv_item[T_ALT_REV] != 'nan' else '0'
-    
-            t_ref_con = tsv_item[tBAM_REF_Concordant] if tsv_item[tBAM_REF_Concordant] != 'nan' else '0'
-            t_ref_dis = tsv_item[tBAM_REF_Discordant] if tsv_item[tBAM_REF_Discordant] != 'nan' else '0'
-            t_alt_con = tsv_item[tBAM_ALT_Concordant] if tsv_item[tBAM_ALT_Concordant] != 'nan' else '0'
-            t_alt_dis = tsv_item[tBAM_ALT_Discordant] if tsv_item[tBAM_ALT_Discordant] != 'nan' else '0'
-    
+
+            with np.errstate(invalid='ignore'):
+                is_pass    = score >= self.pass_score
+                is_lowqual = ~is_pass & (score >= self.lowqual_score)
+
+            qual_strings = [ '%.4f' % score_i for score_i in scaled_score.tolist() ]
+
+        else:
+            is_pass    = num_tools > 0.5*self.total_num_tools
+            is_lowqual = ~is_pass & (num_tools >= 1) & (num_tools >= 0.33*self.total_num_tools)
+
+            qual_strings = repeat('0.0000')
+
+        filters = np.select( (is_pass, is_lowqual), ('PASS', 'LowQual'), 'REJECT' ).tolist()
+        info_strings = [ 'SOMATIC;'+info_i if pass_i else info_i for info_i, pass_i in zip(info_strings, is_pass.tolist()) ]
+
+        field_string = 'GT:DP4:CD4:refMQ:altMQ:refBQ:altBQ:refNM:altNM:fetSB:fetCD:zMQ:zBQ:MQ0:VAF'
+
+        vcf_lines = map( '\t'.join, zip(columns[self.CHROM], columns[self.POS], columns[self.ID], columns[self.REF], columns[self.ALT], qual_strings, filters, info_strings, repeat(field_string), *sample_strings) )
+
+        if not self.print_reject:
+            vcf_lines = compress( vcf_lines, (is_pass | is_lowqual).tolist() )
+
+        return ''.join( vcf_line + '\n' for vcf_line in vcf_lines )
+
+
+    def write(self, tsv_item):
+        '''tsv_item is a TSV line split by tabs'''
+
+        vcf   = self.vcf
+        total_num_tools = self.total_num_tools
+
+        if self.SCORE is not None:
+            score = float( tsv_item[self.SCORE] )
+        else:
+            score = nan
+
+        if self.phred_scaled:
+            scaled_score = p2phred(1-score, max_phred = 255)
+        else:
+            scaled_score = score
+
+
+        if self.MuSE_Tier is not None:
+            # Non-PASS MuSE calls are made into fractions.
+            if tsv_item[self.MuSE_Tier] != '1':
+                if_MuSE = '0'
+            else:
+                if_MuSE = '1'
+        else:
+            if_MuSE = '.'
+
+
+        MVJS = []
+        num_tools = 0
+        for tool_i in self.mvjsdu:
+
+            if_Tool = tsv_item[ self.toolcode2index[tool_i] ]
+
+            if if_Tool == '1':
+                if_Tool = '1'
+
+            elif if_Tool == 'nan':
+                if_Tool = '.'
+
+            else:
+                if_Tool = '0'
+
+            MVJS.append( if_Tool )
+            num_tools = num_tools + int(if_Tool)
+
+        MVJS = ','.join(MVJS)
+
+        info_string = '{COMBO}={MVJSD};NUM_TOOLS={NUM_TOOLS}'.format( COMBO=self.mvjsdu, MVJSD=MVJS, NUM_TOOLS=num_tools )
+
+        # NORMAL
+        if not self.single_mode:
+            n_ref_mq  = tsv_item[self.nBAM_REF_MQ]          if tsv_item[self.nBAM_REF_MQ]          != 'nan' else '.'
+            n_alt_mq  = tsv_item[self.nBAM_ALT_MQ]          if tsv_item[self.nBAM_ALT_MQ]          != 'nan' else '.'
+            n_ref_bq  = tsv_item[self.nBAM_REF_BQ]          if tsv_item[self.nBAM_REF_BQ]          != 'nan' else '.'
+            n_alt_bq  = tsv_item[self.nBAM_ALT_BQ]          if tsv_item[self.nBAM_ALT_BQ]          != 'nan' else '.'
+            n_ref_nm  = tsv_item[self.nBAM_REF_NM]          if tsv_item[self.nBAM_REF_NM]          != 'nan' else '.'
+            n_alt_nm  = tsv_item[self.nBAM_ALT_NM]          if tsv_item[self.nBAM_ALT_NM]          != 'nan' else '.'
+            n_MQ0     = tsv_item[self.nBAM_MQ0]             if tsv_item[self.nBAM_MQ0]             != 'nan' else '.'
+
+            n_sb      = tsv_item[self.nBAM_StrandBias_FET]  if tsv_item[self.nBAM_StrandBias_FET]  != 'nan' else '.'
+            n_cd      = tsv_item[self.nBAM_Concordance_FET] if tsv_item[self.nBAM_Concordance_FET] != 'nan' else '.'
+            n_bqb     = tsv_item[self.nBAM_Z_Ranksums_BQ]   if tsv_item[self.nBAM_Z_Ranksums_BQ]   != 'nan' else '.'
+            n_mqb     = tsv_item[self.nBAM_Z_Ranksums_MQ]   if tsv_item[self.nBAM_Z_Ranksums_MQ]   != 'nan' else '.'
+
+            n_ref_for = tsv_item[self.N_REF_FOR] if tsv_item[self.N_REF_FOR] != 'nan' else '0'
+            n_ref_rev = tsv_item[self.N_REF_REV] if tsv_item[self.N_REF_REV] != 'nan' else '0'
+            n_alt_for = tsv_item[self.N_ALT_FOR] if tsv_item[self.N_ALT_FOR] != 'nan' else '0'
+            n_alt_rev = tsv_item[self.N_ALT_REV] if tsv_item[self.N_ALT_REV] != 'nan' else '0'
+
+            n_ref_con = tsv_item[self.nBAM_REF_Concordant] if tsv_item[self.nBAM_REF_Concordant] != 'nan' else '0'
+            n_ref_dis = tsv_item[self.nBAM_REF_Discordant] if tsv_item[self.nBAM_REF_Discordant] != 'nan' else '0'
+            n_alt_con = tsv_item[self.nBAM_ALT_Concordant] if tsv_item[self.nBAM_ALT_Concordant] != 'nan' else '0'
+            n_alt_dis = tsv_item[self.nBAM_ALT_Concordant] if tsv_item[self.nBAM_ALT_Concordant] != 'nan' else '0'
+
+
             # DP4toGT:
-            gt = dp4_to_gt(t_ref_for, t_ref_rev, t_alt_for, t_alt_rev, hom_threshold, het_threshold)
-            
+            gt = dp4_to_gt(n_ref_for, n_ref_rev, n_alt_for, n_alt_rev, self.hom_threshold, self.het_threshold)
+
             # 4-number strings:
-            dp4_string = ','.join(( t_ref_for, t_ref_rev, t_alt_for, t_alt_rev ))
-            cd4_string = ','.join(( t_ref_con, t_ref_dis, t_alt_con, t_alt_dis ))        
-            
+            dp4_string = ','.join(( n_ref_for, n_ref_rev, n_alt_for, n_alt_rev ))
+            cd4_string = ','.join(( n_ref_con, n_ref_dis, n_alt_con, n_alt_dis ))
+
             try:
-                vd  = int(t_alt_for) + int(t_alt_rev)
-                vaf = vd / ( vd + int(t_ref_for) + int(t_ref_rev) )
+                vaf = ( int(n_alt_for) + int(n_alt_rev) ) / ( int(n_alt_for) + int(n_alt_rev) + int(n_ref_for) + int(n_ref_rev) )
             except ZeroDivisionError:
-                vd  = 0
                 vaf = 0
-                
             vaf = '%.3g' % vaf
-    
-            # Add VAF to info string if and only if there is one single sample in the VCF sample
-            if single_mode:
-                info_string = info_string + ';AF={}'.format(vaf)
-                
-    
-            tumor_sample_string = '{GT}:{DP4}:{CD4}:{refMQ}:{altMQ}:{refBQ}:{altBQ}:{refNM}:{altNM}:{fetSB}:{fetCD}:{zMQ}:{zBQ}:{MQ0}:{VAF}'.format(GT=gt, DP4=dp4_string, CD4=cd4_string, refMQ=t_ref_mq, altMQ=t_alt_mq, refBQ=t_ref_bq, altBQ=t_alt_bq, refNM=t_ref_nm, altNM=t_alt_nm, fetSB=t_sb, fetCD=t_cd, zMQ=t_mqb, zBQ=t_bqb, MQ0=t_MQ0, VAF=vaf)
-    
-            field_string = 'GT:DP4:CD4:refMQ:altMQ:refBQ:altBQ:refNM:altNM:fetSB:fetCD:zMQ:zBQ:MQ0:VAF'
-            
-            if score is nan:
-                scaled_score = 0
-            
-            
-            # PASS
-            if score >= pass_score or (score is nan and num_tools > 0.5*total_num_tools):
-                
-                vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[CHROM], tsv_item[POS], tsv_item[ID], tsv_item[REF], tsv_item[ALT], '%.4f' % scaled_score, 'PASS', 'SOMATIC;'+info_string, field_string)
-                
-                if single_mode:
-                    vcf_line = vcf_line + '\t' + tumor_sample_string
-                elif paired_mode:
-                    vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
-                
-                vcf.write( vcf_line + '\n' )
-                
-            # Low Qual
-            elif score >= lowqual_score or (score is nan and num_tools >= 1 and num_tools >= 0.33*total_num_tools):
-                                            
-                vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[CHROM], tsv_item[POS], tsv_item[ID], tsv_item[REF], tsv_item[ALT], '%.4f' % scaled_score, 'LowQual', info_string, field_string)
-                
-                if single_mode:
-                    vcf_line = vcf_line + '\t' + tumor_sample_string
-                elif paired_mode:
-                    vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
-                
-                vcf.write( vcf_line + '\n' )
-            
-            # REJECT
-            elif print_reject:
-                
-                vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[CHROM], tsv_item[POS], tsv_item[ID], tsv_item[REF], tsv_item[ALT], '%.4f' % scaled_score, 'REJECT', info_string, field_string)
-    
-                if single_mode:
-                    vcf_line = vcf_line + '\t' + tumor_sample_string
-                elif paired_mode:
-                    vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
-                
-                vcf.write( vcf_line + '\n' )
-    
-    
-            # Next line:
-            tsv_i = tsv.readline().rstrip()
-    
+
+            normal_sample_string = '{GT}:{DP4}:{CD4}:{refMQ}:{altMQ}:{refBQ}:{altBQ}:{refNM}:{altNM}:{fetSB}:{fetCD}:{zMQ}:{zBQ}:{MQ0}:{VAF}'.format(GT=gt, DP4=dp4_string, CD4=cd4_string, refMQ=n_ref_mq, altMQ=n_alt_mq, refBQ=n_ref_bq, altBQ=n_alt_bq, refNM=n_ref_nm, altNM=n_alt_nm, fetSB=n_sb, fetCD=n_cd, zMQ=n_mqb, zBQ=n_bqb, MQ0=n_MQ0, VAF=vaf)
+
+
+        ### TUMOR ###
+        t_ref_mq  = tsv_item[self.tBAM_REF_MQ]          if tsv_item[self.tBAM_REF_MQ]          != 'nan' else '.'
+        t_alt_mq  = tsv_item[self.tBAM_ALT_MQ]          if tsv_item[self.tBAM_ALT_MQ]          != 'nan' else '.'
+        t_ref_bq  = tsv_item[self.tBAM_REF_BQ]          if tsv_item[self.tBAM_REF_BQ]          != 'nan' else '.'
+        t_alt_bq  = tsv_item[self.tBAM_ALT_BQ]          if tsv_item[self.tBAM_ALT_BQ]          != 'nan' else '.'
+        t_ref_nm  = tsv_item[self.tBAM_REF_NM]          if tsv_item[self.tBAM_REF_NM]          != 'nan' else '.'
+        t_alt_nm  = tsv_item[self.tBAM_ALT_NM]          if tsv_item[self.tBAM_ALT_NM]          != 'nan' else '.'
+        t_MQ0     = tsv_item[self.tBAM_MQ0]             if tsv_item[self.tBAM_MQ0]             != 'nan' else '.'
+
+        t_sb      = tsv_item[self.tBAM_StrandBias_FET]  if tsv_item[self.tBAM_StrandBias_FET]  != 'nan' else '.'
+        t_cd      = tsv_item[self.tBAM_Concordance_FET] if tsv_item[self.tBAM_Concordance_FET] != 'nan' else '.'
+        t_bqb     = tsv_item[self.tBAM_Z_Ranksums_BQ]   if tsv_item[self.tBAM_Z_Ranksums_BQ]   != 'nan' else '.'
+        t_mqb     = tsv_item[self.tBAM_Z_Ranksums_MQ]   if tsv_item[self.tBAM_Z_Ranksums_MQ]   != 'nan' else '.'
+
+        t_ref_for = tsv_item[self.T_REF_FOR] if tsv_item[self.T_REF_FOR] != 'nan' else '0'
+        t_ref_rev = tsv_item[self.T_REF_REV] if tsv_item[self.T_REF_REV] != 'nan' else '0'
+        t_alt_for = tsv_item[self.T_ALT_FOR] if tsv_item[self.T_ALT_FOR] != 'nan' else '0'
+        t_alt_rev = tsv_item[self.T_ALT_REV] if tsv_item[self.T_ALT_REV] != 'nan' else '0'
+
+        t_ref_con = tsv_item[self.tBAM_REF_Concordant] if tsv_item[self.tBAM_REF_Concordant] != 'nan' else '0'
+        t_ref_dis = tsv_item[self.tBAM_REF_Discordant] if tsv_item[self.tBAM_REF_Discordant] != 'nan' else '0'
+        t_alt_con = tsv_item[self.tBAM_ALT_Concordant] if tsv_item[self.tBAM_ALT_Concordant] != 'nan' else '0'
+        t_alt_dis = tsv_item[self.tBAM_ALT_Discordant] if tsv_item[self.tBAM_ALT_Discordant] != 'nan' else '0'
+
+        # DP4toGT:
+        gt = dp4_to_gt(t_ref_for, t_ref_rev, t_alt_for, t_alt_rev, self.hom_threshold, self.het_threshold)
+
+        # 4-number strings:
+        dp4_string = ','.join(( t_ref_for, t_ref_rev, t_alt_for, t_alt_rev ))
+        cd4_string = ','.join(( t_ref_con, t_ref_dis, t_alt_con, t_alt_dis ))
+
+        try:
+            vd  = int(t_alt_for) + int(t_alt_rev)
+            vaf = vd / ( vd + int(t_ref_for) + int(t_ref_rev) )
+        except ZeroDivisionError:
+            vd  = 0
+            vaf = 0
+
+        vaf = '%.3g' % vaf
+
+        # Add VAF to info string if and only if there is one single sample in the VCF sample
+        if self.single_mode:
+            info_string = info_string + ';AF={}'.format(vaf)
+
+
+        tumor_sample_string = '{GT}:{DP4}:{CD4}:{refMQ}:{altMQ}:{refBQ}:{altBQ}:{refNM}:{altNM}:{fetSB}:{fetCD}:{zMQ}:{zBQ}:{MQ0}:{VAF}'.format(GT=gt, DP4=dp4_string, CD4=cd4_string, refMQ=t_ref_mq, altMQ=t_alt_mq, refBQ=t_ref_bq, altBQ=t_alt_bq, refNM=t_ref_nm, altNM=t_alt_nm, fetSB=t_sb, fetCD=t_cd, zMQ=t_mqb, zBQ=t_bqb, MQ0=t_MQ0, VAF=vaf)
+
+        field_string = 'GT:DP4:CD4:refMQ:altMQ:refBQ:altBQ:refNM:altNM:fetSB:fetCD:zMQ:zBQ:MQ0:VAF'
+
+        if score is nan:
+            scaled_score = 0
+
+
+        # PASS
+        if score >= self.pass_score or (score is nan and num_tools > 0.5*total_num_tools):
+
+            vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[self.CHROM], tsv_item[self.POS], tsv_item[self.ID], tsv_item[self.REF], tsv_item[self.ALT], '%.4f' % scaled_score, 'PASS', 'SOMATIC;'+info_string, field_string)
+
+            if self.single_mode:
+                vcf_line = vcf_line + '\t' + tumor_sample_string
+            elif self.paired_mode:
+                vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
+
+            vcf.write( vcf_line + '\n' )
+
+        # Low Qual
+        elif score >= self.lowqual_score or (score is nan and num_tools >= 1 and num_tools >= 0.33*total_num_tools):
+
+            vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[self.CHROM], tsv_item[self.POS], tsv_item[self.ID], tsv_item[self.REF], tsv_item[self.ALT], '%.4f' % scaled_score, 'LowQual', info_string, field_string)
+
+            if self.single_mode:
+                vcf_line = vcf_line + '\t' + tumor_sample_string
+            elif self.paired_mode:
+                vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
+
+            vcf.write( vcf_line + '\n' )
+
+        # REJECT
+        elif self.print_reject:
+
+            vcf_line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format( tsv_item[self.CHROM], tsv_item[self.POS], tsv_item[self.ID], tsv_item[self.REF], tsv_item[self.ALT], '%.4f' % scaled_score, 'REJECT', info_string, field_string)
+
+            if self.single_mode:
+                vcf_line = vcf_line + '\t' + tumor_sample_string
+            elif self.paired_mode:
+                vcf_line = vcf_line + '\t' + normal_sample_string + '\t' + tumor_sample_string
+
+            vcf.write( vcf_line + '\n' )
+
+
+
+
+def tsv2vcf(tsv_fn, vcf_fn, tools, pass_score=0.5, lowqual_score=0.1, hom_threshold=0.85, het_threshold=0.01, single_mode=False, paired_mode=True, normal_sample_name='NORMAL', tumor_sample_name='TUMOR', print_reject=True, phred_scaled=True):
+
+    with open(tsv_fn) as tsv:
+
+        # First line is a header:
+        tsv_i = tsv.readline().rstrip()
+
+        tsv_header = tsv_i.split('\t')
+
+        vcf_writer = VcfWriter(vcf_fn, tsv_header, tools, pass_score, lowqual_score, hom_threshold, het_threshold, single_mode, paired_mode, normal_sample_name, tumor_sample_name, print_reject, phred_scaled)
+
+        # Start writing content, BLOCK_SIZE lines at a time, up to the first blank line:
+        tsv_items = []
+        for tsv_i in tsv:
+
+            tsv_i = tsv_i.rstrip()
+            if not tsv_i:
+                break
+
+            tsv_items.append( tsv_i.split('\t') )
+
+            if len(tsv_items) >= BLOCK_SIZE:
+                vcf_writer.write_block( tsv_items )
+                tsv_items = []
+
+        vcf_writer.write_block( tsv_items )
+        vcf_writer.close()
+
+    return vcf_fn
 
 
 
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+# Scores an Ensemble TSV file with a classifier exported by r_scripts/ada_model_exporter.R, the same way r_scripts/ada_model_predictor.R does with the .RData file, but without R.
+# The trees are evaluated for a block of TSV lines at a time, all the trees and all the lines together in numpy arrays, following rpart's prediction rules:
+# 1) A split sends a line left if (value < split point) and NCAT is -1, or if (value >= split point) and NCAT is 1.
+# 2) If the value is missing, i.e., nan, the node's surrogate splits are tried in order, and if all of them are missing too, the line goes to the child with more training samples.
+# SCORE = 1 / (1 + exp(-2F)), where F = sum of ALPHA times VALUE of the leaf over the first n_iter trees, same as predict.ada: ada's alpha of each tree already includes the shrinkage nu, which is in the file for reference only.
+
+import sys, os, argparse
+import numpy as np
+from itertools import islice
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+
+MAGIC = '##SomaticSeq tree ensemble'
+
+# ada_model_predictor.R uses the first 300 trees
+N_ITER = 300
+
+# TSV lines scored at a time
+BLOCK_SIZE = 10000
+
+# The features ada_model_predictor.R adds to the TSV, i.e., REF/ALT pairs for each type of base substitution
+SUBSTITUTIONS = {'GC2CG': (('G', 'C'), ('C', 'G')),
+                 'GC2TA': (('G', 'T'), ('C', 'A')),
+                 'GC2AT': (('G', 'A'), ('C', 'T')),
+                 'TA2AT': (('T', 'A'), ('A', 'T')),
+                 'TA2GC': (('T', 'G'), ('A', 'C')),
+                 'TA2CG': (('T', 'C'), ('A', 'G')) }
+
+
+# Values read.table reads as logical or missing, e.g., the False written for a missing INFO value
+NON_NUMBERS = {'False': 0.0, 'FALSE': 0.0, 'false': 0.0, 'True': 1.0, 'TRUE': 1.0, 'true': 1.0, 'NA': float('nan')}
+
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-model', '--classifier',      type=str, help='Classifier exported by r_scripts/ada_model_exporter.R', required=True)
+    parser.add_argument('-tsv',   '--ensemble-tsv',    type=str, help='Ensemble TSV file',   required=True)
+    parser.add_argument('-out',   '--output-tsv',      type=str, help='Output TSV file with the SCORE column', required=True)
+    parser.add_argument('-iter',  '--num-iterations',  type=int, help='Number of trees to use', default=N_ITER)
+
+    args = parser.parse_args()
+
+    return args.classifier, args.ensemble_tsv, args.output_tsv, args.num_iterations
+
+
+
+def is_tree_ensemble(file_name):
+    '''True if file_name is exported by ada_model_exporter.R, rather than an .RData file'''
+
+    if not ( isinstance(file_name, str) and os.path.isfile(file_name) ):
+        return False
+
+    with open(file_name, 'rb') as model_file:
+        return model_file.read( len(MAGIC) ) == MAGIC.encode()
+
+
+
+def feature_manifest(file_name):
+    '''
+    The set of TSV columns needed to score with a classifier exported by ada_model_exporter.R or trained by ada_trainer.py, for vcf2tsv's features.
+    Otherwise, file_name is a text file of the columns, one per line.
+    '''
+
+    if is_tree_ensemble(file_name):
+        return TreeEnsemble(file_name).features()
+
+    with open(file_name) as manifest:
+        return { line_i.strip() for line_i in manifest if line_i.strip() and not line_i.startswith('#') }
+
+
+
+class TreeEnsemble:
+
+    '''
+    The nodes of all the trees are in the same arrays, and node_i's splits are split_variables[node_i], split_points[node_i], and split_left_below[node_i], padded with -1 variables.
+    Variables are numbered by their order in self.variables.
+    '''
+
+    def __init__(self, model_file):
+
+        trees = {}
+
+        with open(model_file) as model:
+            for line_i in model:
+
+                if line_i.strip() and not line_i.startswith('#'):
+                    tree_i, alpha_i, node_i, n_i, variable_i, ncat_i, split_i, value_i = line_i.rstrip('\n').split('\t')
+
+                    tree_i = trees.setdefault( int(tree_i), {'alpha': float(alpha_i), 'nodes': {}} )
+                    node_i = tree_i['nodes'].setdefault( int(node_i), {'n': float(n_i), 'value': float(value_i), 'splits': []} )
+
+                    if variable_i != '<leaf>':
+                        node_i['splits'].append( (variable_i, int(ncat_i), float(split_i)) )
+
+        if not trees:
+            raise Exception( '{} has no tree.'.format(model_file) )
+
+        self.variables = sorted( { split_j[0] for tree_i in trees.values() for node_j in tree_i['nodes'].values() for split_j in node_j['splits'] } )
+        variable_numbers = { variable_i:i for i, variable_i in enumerate(self.variables) }
+
+        max_splits = max( [ len(node_j['splits']) for tree_i in trees.values() for node_j in tree_i['nodes'].values() ] + [1] )
+
+        self.alphas = []
+        self.roots  = []
+        left, right, values, majority_left = [], [], [], []
+        split_variables, split_points, split_left_below = [], [], []
+
+        for tree_number in sorted(trees):
+
+            nodes   = trees[tree_number]['nodes']
+            offset  = len(values)
+            indices = { node_i:offset+i for i, node_i in enumerate(sorted(nodes)) }
+
+            self.alphas.append( trees[tree_number]['alpha'] )
+            self.roots.append( indices[1] )
+
+            # rpart's node k has the children 2k and 2k+1
+            for node_i in sorted(nodes):
+
+                node     = nodes[node_i]
+                is_split = len(node['splits']) > 0
+
+                left.append(  indices[2*node_i]   if is_split else -1 )
+                right.append( indices[2*node_i+1] if is_split else -1 )
+                values.append( node['value'] )
+                majority_left.append( is_split and nodes[2*node_i]['n'] > nodes[2*node_i+1]['n'] )
+
+                padding = max_splits - len(node['splits'])
+                split_variables.append(  [ variable_numbers[split_j[0]] for split_j in node['splits'] ] + [-1] * padding )
+                split_points.append(     [ split_j[2] for split_j in node['splits'] ]                   + [0.0] * padding )
+                split_left_below.append( [ split_j[1] < 0 for split_j in node['splits'] ]               + [False] * padding )
+
+        self.alphas           = np.array(self.alphas)
+        self.roots            = np.array(self.roots)
+        self.left             = np.array(left)
+        self.right            = np.array(right)
+        self.values           = np.array(values)
+        self.majority_left    = np.array(majority_left)
+        self.split_variables  = np.array(split_variables)
+        self.split_points     = np.array(split_points)
+        self.split_left_below = np.array(split_left_below)
+
+
+    def features(self):
+        '''The TSV columns of self.variables, with REF and ALT for the substitution features'''
+
+        return { variable_i for variable_i in self.variables if variable_i not in SUBSTITUTIONS } | {'REF', 'ALT'}
+
+
+    def leaves(self, features, n_iter=N_ITER):
+        '''features is a 2-D array of the values of self.variables, one row per line. Returns the leaf of each line (row) in each tree (column).'''
+
+        roots = self.roots[:n_iter]
+        nodes = np.broadcast_to( roots, (features.shape[0], len(roots)) ).copy()
+        rows  = np.broadcast_to( np.arange(features.shape[0])[:, None], nodes.shape )
+
+        inner = self.left[nodes] >= 0
+
+        while inner.any():
+
+            row_i  = rows[inner]
+            node_i = nodes[inner]
+
+            go_left = np.zeros(len(node_i), dtype=bool)
+            decided = np.zeros(len(node_i), dtype=bool)
+
+            # The primary split, then the surrogates for the lines still undecided
+            for j in range(self.split_variables.shape[1]):
+
+                variable_j = self.split_variables[node_i, j]
+                value_j    = features[ row_i, np.maximum(variable_j, 0) ]
+                usable     = ~decided & (variable_j >= 0) & ~np.isnan(value_j)
+
+                go_left[usable] = ( value_j[usable] < self.split_points[node_i[usable], j] ) == self.split_left_below[node_i[usable], j]
+                decided        |= usable
+
+            go_left[~decided] = self.majority_left[ node_i[~decided] ]
+
+            nodes[inner] = np.where( go_left, self.left[node_i], self.right[node_i] )
+            inner        = self.left[nodes] >= 0
+
+        return nodes
+
+
+    def score(self, features, n_iter=N_ITER):
+        '''Probability of being a true variant of each row of features'''
+
+        f = ( self.values[ self.leaves(features, n_iter) ] * self.alphas[:n_iter] ).sum(axis=1)
+
+        return 1 / ( 1 + np.exp(-2*f) )
+
+
+
+def feature_matrix(header, lines, variables):
+    '''header is the list of the TSV columns, and lines are split TSV lines. Returns the 2-D array of the variables, including the substitution features.'''
+
+    features = np.empty( (len(lines), len(variables)) )
+
+    for j, variable_j in enumerate(variables):
+
+        if variable_j in SUBSTITUTIONS:
+            ref_i, alt_i = header.index('REF'), header.index('ALT')
+            features[:, j] = [ (line_i[ref_i], line_i[alt_i]) in SUBSTITUTIONS[variable_j] for line_i in lines ]
+
+        elif variable_j in header:
+            i = header.index(variable_j)
+            try:
+                features[:, j] = np.array( [ line_i[i] for line_i in lines ], dtype=object ).astype(np.float64)
+            except ValueError:
+                features[:, j] = [ NON_NUMBERS[line_i[i]] if line_i[i] in NON_NUMBERS else float(line_i[i]) for line_i in lines ]
+
+        else:
+            raise Exception( 'The classifier needs {}, which is not in the TSV file.'.format(variable_j) )
+
+    return features
+
+
+
+def predict(model_file, tsv_in, tsv_out, n_iter=N_ITER):
+
+    model = TreeEnsemble(model_file)
+
+    with genome.open_textfile(tsv_in) as tsv, open(tsv_out, 'w') as out:
+
+        header_line = tsv.readline().rstrip('\n')
+        header      = header_line.split('\t')
+
+        block = [ line_i.rstrip('\n') for line_i in islice(tsv, BLOCK_SIZE) if line_i.strip() ]
+
+        # Like ada_model_predictor.R, no SCORE column without any line to score:
+        out.write( header_line + ('\tSCORE\n' if block else '\n') )
+
+        while block:
+
+            scores = model.score( feature_matrix(header, [ line_j.split('\t') for line_j in block ], model.variables), n_iter )
+
+            for line_j, score_j in zip(block, scores):
+                out.write( '{}\t{:.15g}\n'.format(line_j, score_j) )
+
+            block = [ line_i.rstrip('\n') for line_i in islice(tsv, BLOCK_SIZE) if line_i.strip() ]
+
+    return tsv_out
+
+
+
+class StreamingClassifier:
+
+    '''
+    Takes the place of vcf2tsv's output file, so its TSV lines are scored BLOCK_SIZE at a time as they come, and handed straight to vcf_writer with the SCORE column, without going through any file.
+    vcf_writer(tsv_header) is called with the header, e.g., a partial of SSeq_tsv2vcf.VcfWriter, and its write_block method with every block of lines split by tabs.
+    ensemble_tsv and classified_tsv, if given, are also written, the same as vcf2tsv and predict would.
+    '''
+
+    def __init__(self, model, vcf_writer, ensemble_tsv=None, classified_tsv=None, n_iter=N_ITER):
+
+        self.model          = model
+        self.make_writer    = vcf_writer
+        self.vcf_writer     = None
+        self.n_iter         = n_iter
+        self.ensemble_tsv   = open(ensemble_tsv,   'w') if ensemble_tsv   else None
+        self.classified_tsv = open(classified_tsv, 'w') if classified_tsv else None
+        self.header         = None
+        self.block          = []
+        self.pending        = ''
+        self.num_lines      = 0
+
+
+    def write(self, text):
+
+        if self.ensemble_tsv:
+            self.ensemble_tsv.write( text )
+
+        lines = ( self.pending + text ).split('\n')
+        self.pending = lines.pop()
+
+        for line_i in lines:
+            self.add_line( line_i )
+
+
+    def add_line(self, line_i):
+
+        if self.header is None:
+            self.header = line_i
+
+        elif line_i.strip():
+            self.block.append( line_i )
+
+            if len(self.block) >= BLOCK_SIZE:
+                self.flush()
+
+
+    def flush(self):
+
+        if not self.block:
+            return
+
+        header = self.header.split('\t')
+
+        if self.vcf_writer is None:
+            self.vcf_writer = self.make_writer( header + ['SCORE'] )
+
+            if self.classified_tsv:
+                self.classified_tsv.write( self.header + '\tSCORE\n' )
+
+        scores = self.model.score( feature_matrix(header, [ line_j.split('\t') for line_j in self.block ], self.model.variables), self.n_iter )
+
+        # Scores go through the same text as in the classified TSV file, so the VCF file is the same either way:
+        scores = [ '{:.15g}'.format(score_j) for score_j in scores ]
+
+        self.vcf_writer.write_block( [ line_j.split('\t') + [score_j] for line_j, score_j in zip(self.block, scores) ] )
+
+        if self.classified_tsv:
+            self.classified_tsv.write( ''.join( line_j + '\t' + score_j + '\n' for line_j, score_j in zip(self.block, scores) ) )
+
+        self.num_lines += len(self.block)
+        self.block      = []
+
+
+    def close(self):
+
+        if self.pending:
+            self.add_line( self.pending )
+            self.pending = ''
+
+        self.flush()
+
+        # Like predict, no SCORE column without any line to score:
+        if self.vcf_writer is None:
+            self.vcf_writer = self.make_writer( self.header.split('\t') )
+
+            if self.classified_tsv:
+                self.classified_tsv.write( self.header + '\n' )
+
+        self.vcf_writer.close()
+
+        for file_i in (self.ensemble_tsv, self.classified_tsv):
+            if file_i:
+                file_i.close()
+
+        return self.num_lines
+
+
+
+if __name__ == '__main__':
+    model_file, tsv_in, tsv_out, n_iter = run()
+    predict(model_file, tsv_in, tsv_out, n_iter)
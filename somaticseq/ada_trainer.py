@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+# Trains a classifier from Ensemble TSV files with ground truth without R, as an alternative to r_scripts/ada_model_builder_ntChange.R (--python-trainer), and writes it in the format of r_scripts/ada_model_exporter.R for somaticseq/ada_predictor.py.
+# Like the R script, it leaves out CHROM, POS, ID, REF, ALT, if_COSMIC, COSMIC_CNT, T_VAF_REV, T_VAF_FOR, and the excluded features, and adds the six base substitution features.
+# The model is discrete AdaBoost as in ada, i.e., exponential loss, shrinkage nu, and each tree fit on a random bag_fraction of the lines, but the trees are grown level by level with histograms:
+# 1) Each feature is binned once into up to 255 bins, whose edges are half way between two observed values, so "value < edge" in the predictor is the same as "bin <= k" here.
+# 2) For all the nodes of a level, every worker process adds up the weights of the true and false variants in each bin of its features, and finds the split of the least Gini impurity.
+# 3) Missing values go to the child with more lines, which is what the predictor does when a split has no surrogate.
+
+import sys, os, argparse, math, logging
+import numpy as np
+from multiprocessing import Pool, RawArray
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+import somaticseq.ada_predictor as ada_predictor
+
+FORMAT = '%(levelname)s %(asctime)-15s %(name)-20s %(message)s'
+logger = logging.getLogger('ada_trainer')
+logger.setLevel(logging.DEBUG)
+
+# Columns ada_model_builder_ntChange.R does not train on
+NOT_FEATURES = ('CHROM', 'POS', 'ID', 'REF', 'ALT', 'if_COSMIC', 'COSMIC_CNT', 'T_VAF_REV', 'T_VAF_FOR')
+LABEL        = 'TrueVariant_or_False'
+
+# Bin 255 is for the missing values
+MAX_BINS    = 255
+MISSING_BIN = 255
+
+# Shared arrays of the worker processes
+worker = {}
+
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-tsvs',    '--ensemble-tsvs',     nargs='+', help='Ensemble TSV files with TrueVariant_or_False', required=True)
+    parser.add_argument('-out',     '--output-classifier', type=str,  help='Output classifier, by default the first TSV file + .ntChange.Classifier.txt')
+    parser.add_argument('-exclude', '--excluded-features', nargs='*', help='Features not to train on', default=[])
+    parser.add_argument('-iter',    '--iterations',        type=int,   help='Number of trees', default=500)
+    parser.add_argument('-nu',      '--shrinkage',         type=float, help='Shrinkage of each tree', default=0.1)
+    parser.add_argument('-bag',     '--bag-fraction',      type=float, help='Fraction of the lines to fit each tree on', default=0.5)
+    parser.add_argument('-depth',   '--max-depth',         type=int,   help='Maximum depth of the trees', default=4)
+    parser.add_argument('-minsplit','--min-split',         type=int,   help='Minimum number of lines in a node to split it', default=20)
+    parser.add_argument('-minleaf', '--min-leaf',          type=int,   help='Minimum number of lines in a leaf', default=7)
+    parser.add_argument('-seed',    '--seed',              type=int,   help='Random seed of the bags', default=0)
+    parser.add_argument('-nt',      '--threads',           type=int,   help='Number of processes to find the splits', default=1)
+
+    args = parser.parse_args()
+
+    return args
+
+
+
+def read_training_data(tsv_files, excluded_features=()):
+    '''Returns the feature names, the 2-D float32 array of the features, and the labels, i.e., 1 or -1, of the lines with a label'''
+
+    header, blocks, labels = None, [], []
+
+    for tsv_file_i in tsv_files:
+        with genome.open_textfile(tsv_file_i) as tsv:
+
+            header_i = tsv.readline().rstrip('\n').split('\t')
+
+            if header is None:
+                header   = header_i
+                features = [ column_j for column_j in header if column_j not in NOT_FEATURES and column_j != LABEL and column_j not in excluded_features ]
+                features = features + [ feature_j for feature_j in ada_predictor.SUBSTITUTIONS if feature_j not in excluded_features ]
+
+            elif header_i != header:
+                raise Exception( '{} does not have the same columns as {}.'.format(tsv_file_i, tsv_files[0]) )
+
+            label_i = header.index(LABEL)
+
+            lines = []
+            for line_j in tsv:
+                if line_j.strip():
+                    items_j = line_j.rstrip('\n').split('\t')
+                    if items_j[label_i] in ('0', '1'):
+                        lines.append( items_j )
+
+                if len(lines) >= ada_predictor.BLOCK_SIZE:
+                    blocks.append( ada_predictor.feature_matrix(header, lines, features).astype(np.float32) )
+                    labels.extend( int(items_j[label_i]) for items_j in lines )
+                    lines = []
+
+            if lines:
+                blocks.append( ada_predictor.feature_matrix(header, lines, features).astype(np.float32) )
+                labels.extend( int(items_j[label_i]) for items_j in lines )
+
+    labels = np.array(labels, dtype=np.int8) * 2 - 1
+
+    if not ( (labels == 1).any() and (labels == -1).any() ):
+        raise Exception('In training mode, there must be both true positives and false positives in the call set.')
+
+    return features, np.concatenate(blocks), labels
+
+
+
+def bin_edges(values):
+    '''Edges half way between observed values, at most MAX_BINS-1 of them, at about equal quantiles if there are more observed values'''
+
+    observed = np.unique( values[ ~np.isnan(values) ] ).astype(np.float64)
+
+    if len(observed) > MAX_BINS:
+        i = np.unique( np.searchsorted( observed, np.quantile(observed, np.linspace(0, 1, MAX_BINS+1)[1:-1]) ) )
+        i = i[ i < len(observed)-1 ]
+    else:
+        i = np.arange( len(observed)-1 )
+
+    return (observed[i] + observed[i+1]) / 2
+
+
+
+def init_worker(shared_arrays, num_lines, num_features):
+
+    worker['codes']     = np.frombuffer(shared_arrays[0], dtype=np.uint8).reshape(num_features, num_lines)
+    worker['node']      = np.frombuffer(shared_arrays[1], dtype=np.int32)
+    worker['w_true']    = np.frombuffer(shared_arrays[2], dtype=np.float64)
+    worker['w_false']   = np.frombuffer(shared_arrays[3], dtype=np.float64)
+    worker['in_bag']    = np.frombuffer(shared_arrays[4], dtype=np.float64)
+
+
+
+def best_splits(feature_numbers, num_nodes, min_leaf):
+    '''
+    The best split among feature_numbers of each node of this level, i.e., the lines with worker['node'] from 0 to num_nodes-1.
+    Returns (gain, feature, bin) arrays, gain -inf if no split is allowed. A split sends bins <= bin to the left, and the missing values to the side with more lines.
+    '''
+
+    # The lines out of the bag weigh nothing
+    active  = (worker['node'] >= 0) & (worker['in_bag'] > 0)
+    keys    = worker['node'][active].astype(np.int64) * (MAX_BINS+1)
+    w_true  = worker['w_true'][active]
+    w_false = worker['w_false'][active]
+    in_bag  = worker['in_bag'][active]
+
+    best_gain    = np.full(num_nodes, -np.inf)
+    best_feature = np.zeros(num_nodes, dtype=int)
+    best_bin     = np.zeros(num_nodes, dtype=int)
+
+    for feature_j in feature_numbers:
+
+        key_j = keys + worker['codes'][feature_j][active]
+
+        histograms = [ np.bincount(key_j, weights_i, minlength=num_nodes*(MAX_BINS+1)).reshape(num_nodes, MAX_BINS+1) for weights_i in (w_true, w_false, in_bag) ]
+
+        # Left of each candidate bin, then right of it, before the missing values go to the bigger side:
+        left    = [ np.cumsum(histogram_i[:, :MISSING_BIN], axis=1) for histogram_i in histograms ]
+        right   = [ left_i[:, -1:] - left_i for left_i in left ]
+        missing = [ histogram_i[:, MISSING_BIN:] for histogram_i in histograms ]
+
+        missing_left = left[2] > right[2]
+        left  = [ left_i  + missing_i * missing_left  for left_i,  missing_i in zip(left,  missing) ]
+        right = [ right_i + missing_i * ~missing_left for right_i, missing_i in zip(right, missing) ]
+
+        # Weighted Gini impurity of a node with weights p and q of the two classes is 2pq/(p+q)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            parent   = np.nan_to_num( 2 * histograms[0].sum(axis=1) * histograms[1].sum(axis=1) / (histograms[0].sum(axis=1) + histograms[1].sum(axis=1)) )
+            children = np.nan_to_num( 2 * left[0] * left[1] / (left[0] + left[1]) ) + np.nan_to_num( 2 * right[0] * right[1] / (right[0] + right[1]) )
+
+        gains = parent[:, None] - children
+        gains[ (left[2] < min_leaf) | (right[2] < min_leaf) ] = -np.inf
+
+        bin_j  = gains.argmax(axis=1)
+        gain_j = gains[ np.arange(num_nodes), bin_j ]
+
+        better = gain_j > best_gain
+        best_gain[better]    = gain_j[better]
+        best_feature[better] = feature_j
+        best_bin[better]     = bin_j[better]
+
+    return best_gain, best_feature, best_bin
+
+
+
+def find_splits(pool, feature_chunks, num_nodes, min_leaf):
+
+    if pool:
+        results = pool.starmap( best_splits, [ (chunk_i, num_nodes, min_leaf) for chunk_i in feature_chunks ] )
+    else:
+        results = [ best_splits(chunk_i, num_nodes, min_leaf) for chunk_i in feature_chunks ]
+
+    # Ties go to the first feature, whatever the number of processes:
+    best_gain, best_feature, best_bin = results[0]
+    for gain_i, feature_i, bin_i in results[1:]:
+        better = gain_i > best_gain
+        best_gain    = np.where(better, gain_i,    best_gain)
+        best_feature = np.where(better, feature_i, best_feature)
+        best_bin     = np.where(better, bin_i,     best_bin)
+
+    return best_gain, best_feature, best_bin
+
+
+
+def grow_tree(pool, feature_chunks, max_depth, min_split, min_leaf):
+
+    '''
+    Grows a tree on the lines in worker's shared arrays, level by level.
+    Returns {rpart node number: (number of lines, value, (feature, bin) or None)}, and the value of the leaf of each line.
+    '''
+
+    codes = worker['codes']
+    node  = worker['node']
+
+    node[:]      = 0
+    level        = [1]
+    tree         = {}
+    line_values  = np.zeros(len(node))
+
+    for depth in range(max_depth+1):
+
+        num_nodes = len(level)
+        active    = node >= 0
+
+        w_true  = np.bincount( node[active], worker['w_true'][active],  minlength=num_nodes )
+        w_false = np.bincount( node[active], worker['w_false'][active], minlength=num_nodes )
+        counts  = np.bincount( node[active], worker['in_bag'][active],  minlength=num_nodes )
+
+        # Ties go to the first class, as in rpart
+        values = np.where(w_true > w_false, 1.0, -1.0)
+
+        if depth < max_depth:
+            gains, features, bins = find_splits(pool, feature_chunks, num_nodes, min_leaf)
+        else:
+            gains = np.full(num_nodes, -np.inf)
+
+        splits     = (gains > 0) & (counts >= min_split) & (w_true > 0) & (w_false > 0)
+        next_level = []
+        next_node  = np.full(len(node), -1, dtype=np.int32)
+
+        lines_of_node = np.split( np.flatnonzero(active)[ np.argsort(node[active], kind='stable') ], np.cumsum(np.bincount(node[active], minlength=num_nodes))[:-1] )
+
+        for i, node_number in enumerate(level):
+
+            if splits[i]:
+                tree[node_number] = ( int(round(counts[i])), values[i], (int(features[i]), int(bins[i])) )
+
+                codes_i  = codes[ features[i] ][ lines_of_node[i] ]
+                non_missing = codes_i != MISSING_BIN
+                is_left  = (codes_i <= bins[i]) & non_missing
+
+                # The same rule as best_splits for the missing values:
+                in_bag_i = worker['in_bag'][ lines_of_node[i] ] > 0
+                if ( is_left & in_bag_i ).sum() > ( ~is_left & non_missing & in_bag_i ).sum():
+                    is_left |= ~non_missing
+
+                next_node[ lines_of_node[i][is_left]  ] = len(next_level)
+                next_node[ lines_of_node[i][~is_left] ] = len(next_level) + 1
+                next_level.extend( (2*node_number, 2*node_number+1) )
+
+            else:
+                tree[node_number] = ( int(round(counts[i])), values[i], None )
+                line_values[ lines_of_node[i] ] = values[i]
+
+        node[:] = next_node
+        level   = next_level
+
+        if not level:
+            break
+
+    return tree, line_values
+
+
+
+def write_tree_ensemble(trees, alphas, nu, features, edges, outfile, source):
+
+    with open(outfile, 'w') as out:
+
+        out.write( ada_predictor.MAGIC + '\n' )
+        out.write( '##model={}\n'.format(source) )
+        out.write( '##nu={!r}\n'.format(nu) )
+        out.write( '#TREE\tALPHA\tNODE\tN\tVARIABLE\tNCAT\tSPLIT\tVALUE\n' )
+
+        for i, (tree_i, alpha_i) in enumerate(zip(trees, alphas), start=1):
+            for node_j in sorted(tree_i):
+
+                n_j, value_j, split_j = tree_i[node_j]
+
+                if split_j:
+                    feature_k, bin_k = split_j
+                    out.write( '{}\t{!r}\t{}\t{}\t{}\t-1\t{!r}\t{!r}\n'.format(i, alpha_i, node_j, n_j, features[feature_k], float(edges[feature_k][bin_k]), float(value_j)) )
+                else:
+                    out.write( '{}\t{!r}\t{}\t{}\t<leaf>\t0\tnan\t{!r}\n'.format(i, alpha_i, node_j, n_j, float(value_j)) )
+
+    return outfile
+
+
+
+def train(tsv_files, outfile=None, excluded_features=(), iterations=500, nu=0.1, bag_fraction=0.5, max_depth=4, min_split=20, min_leaf=7, seed=0, threads=1):
+
+    if not outfile:
+        outfile = tsv_files[0] + '.ntChange.Classifier.txt'
+
+    features, data, labels = read_training_data(tsv_files, excluded_features)
+    num_lines, num_features = data.shape
+
+    logger.info( '{} lines and {} features from {}'.format(num_lines, num_features, ', '.join(tsv_files)) )
+
+    # The bins of every feature, in shared memory for the worker processes:
+    shared_arrays = ( RawArray('B', num_features*num_lines), RawArray('i', num_lines), RawArray('d', num_lines), RawArray('d', num_lines), RawArray('d', num_lines) )
+    init_worker(shared_arrays, num_lines, num_features)
+
+    edges = []
+    for j in range(num_features):
+        edges.append( bin_edges(data[:, j]) )
+        codes_j = np.searchsorted( edges[j], data[:, j].astype(np.float64), side='right' )
+        codes_j[ np.isnan(data[:, j]) ] = MISSING_BIN
+        worker['codes'][j] = codes_j
+
+    del data
+
+    # An empty side is never a split:
+    min_leaf = max(min_leaf, 1)
+
+    feature_chunks = [ chunk_i for chunk_i in np.array_split( np.arange(num_features), max(threads, 1) ) if len(chunk_i) ]
+    pool = Pool(threads, initializer=init_worker, initargs=(shared_arrays, num_lines, num_features)) if threads > 1 else None
+
+    try:
+        random   = np.random.default_rng(seed)
+        bag_size = max( 1, int(bag_fraction * num_lines) )
+
+        f       = np.zeros(num_lines)
+        weights = np.full(num_lines, 1/num_lines)
+        trees, alphas = [], []
+
+        for m in range(iterations):
+
+            in_bag = np.zeros(num_lines)
+            in_bag[ random.choice(num_lines, bag_size, replace=False) ] = 1
+
+            worker['in_bag'][:]  = in_bag
+            worker['w_true'][:]  = weights * in_bag * (labels == 1)
+            worker['w_false'][:] = weights * in_bag * (labels == -1)
+
+            tree_m, predictions = grow_tree(pool, feature_chunks, max_depth, min_split, min_leaf)
+
+            error   = min( max( weights[ predictions != labels ].sum() / weights.sum(), 1e-10 ), 1 - 1e-10 )
+            # Shrunk by nu, which is the alpha ada keeps for each tree
+            alpha_m = nu * 0.5 * math.log( (1-error) / error )
+
+            f      += alpha_m * predictions
+            weights = np.exp( -labels * f )
+            weights = weights / weights.sum()
+
+            trees.append( tree_m )
+            alphas.append( alpha_m )
+
+            if (m+1) % 50 == 0:
+                logger.info( '{} trees, training error {:.4f}'.format(m+1, ( np.sign(f) != labels ).mean()) )
+
+    finally:
+        # Also if a tree fails, so no worker is left attached to the shared arrays:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    return write_tree_ensemble(trees, alphas, nu, features, edges, outfile, ', '.join(tsv_files))
+
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=FORMAT)
+    args = run()
+    train(args.ensemble_tsvs, args.output_classifier, args.excluded_features, args.iterations, args.shrinkage, args.bag_fraction, args.max_depth, args.min_split, args.min_leaf, args.seed, args.threads)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+# Converts a dbSNP or COSMIC VCF file into a binary index that vcf2tsv memory-maps, instead of parsing the VCF text on every run.
+# For every ALT allele (sorted by coordinate, then by the hash of REF and ALT), the index holds:
+# 1) the coordinate key, i.e., contig number * genome.COORDINATE_SHIFT + position, as int64,
+# 2) a 64-bit hash of REF and ALT,
+# 3) packed flags: COMMON=1 (dbSNP) and SNP (COSMIC), and the COSMIC CNT as int64 (-1 if there is none),
+# 4) the ID column, as a number into a table of strings.
+# A lookup is a binary search on the coordinate keys, and gives the same answers as annotate_caller.dbSNP and annotate_caller.COSMIC.
+
+import sys, os, argparse, re, json, hashlib, tempfile, logging
+import numpy as np
+from array import array
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+
+logger = logging.getLogger( os.path.basename(__file__) )
+
+nan = float('nan')
+
+MAGIC = b'SSEQIDX1'
+
+FLAG_COMMON = 1
+FLAG_SNP    = 2
+
+# Number of rows kept in memory before they are appended to the temporary files, and written to the index at a time
+FLUSH_SIZE = 1 << 20
+
+# name, dtype, and whether there is one per variant (otherwise the length is in the header)
+ARRAYS = ( ('keys', np.int64, True), ('hashes', np.uint64, True), ('num_cases', np.int64, True), ('flags', np.uint8, True), ('id_numbers', np.int64, True), ('id_offsets', np.int64, False), ('id_table', np.uint8, False) )
+
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-vcf', '--vcf-in',     type=str, help='dbSNP or COSMIC VCF file', required=True)
+    parser.add_argument('-out', '--index-out',  type=str, help='Output index file, to be used in place of the VCF file for vcf2tsv\'s -dbsnp or -cosmic', required=True)
+
+    args = parser.parse_args()
+
+    return args.vcf_in, args.index_out
+
+
+
+def ref_alt_hash(refbase, altbase):
+    return int.from_bytes( hashlib.blake2b('{}\t{}'.format(refbase, altbase).encode(), digest_size=8).digest(), 'little' )
+
+
+
+def is_annotation_index(file_name):
+    '''True if file_name is an index made by this script, rather than a VCF file'''
+
+    if not ( isinstance(file_name, str) and os.path.isfile(file_name) ):
+        return False
+
+    with open(file_name, 'rb') as index_file:
+        return index_file.read( len(MAGIC) ) == MAGIC
+
+
+
+def num_cases_of(vcf_i):
+
+    num_cases = vcf_i.get_info_value('CNT')
+
+    if not num_cases:
+        return -1
+
+    elif isinstance(num_cases, str) and num_cases.isdigit() and str(int(num_cases)) == num_cases:
+        return int(num_cases)
+
+    else:
+        raise Exception( 'CNT={} at {}:{} is not an integer, so it cannot be indexed'.format(num_cases, vcf_i.chromosome, vcf_i.position) )
+
+
+
+def append_alleles(columns, key, alleles):
+    '''The ALT alleles at a coordinate, i.e., hash -> (flags, num_cases, ID number), in the order of their hashes'''
+
+    for hash_i in sorted(alleles):
+        flags, num_cases, id_number = alleles[hash_i]
+
+        columns['keys'].append( key )
+        columns['hashes'].append( hash_i )
+        columns['flags'].append( flags )
+        columns['num_cases'].append( num_cases )
+        columns['id_numbers'].append( id_number )
+
+
+
+def flush_columns(columns, column_files):
+    for name_i in columns:
+        column_files[name_i].write( columns[name_i] )
+        del columns[name_i][:]
+
+
+
+def mapped_array(file_name, dtype):
+    '''The file as a read-only array, or an empty array because an empty file cannot be memory-mapped'''
+
+    if os.path.getsize(file_name) == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(file_name, dtype=dtype, mode='r')
+
+
+
+def build_index(vcf_in, index_out):
+    '''
+    The VCF file is coordinate-sorted, so the ALT alleles are sorted one coordinate at a time, and appended to a temporary file for each array, which are memory-mapped to write the index.
+    Only if the VCF file is not sorted (or a contig is in more than one block), they are sorted all at once in the end.
+    '''
+
+    contigs   = {}
+    n_lines   = 0
+    id_length = 0
+    in_order  = True
+
+    # The ALT alleles at the current coordinate. If the same variant is in more than one line, the last one stands, same as the dictionary of variants at a coordinate.
+    key_i, alleles = None, {}
+
+    with tempfile.TemporaryDirectory( dir=os.path.dirname(os.path.abspath(index_out)) ) as tmp_dir:
+
+        columns = { name_i:array('q') for name_i in ('keys', 'num_cases', 'id_numbers') }
+        columns['hashes']     = array('Q')
+        columns['flags']      = array('B')
+        columns['id_offsets'] = array('q', [0])
+        columns['id_table']   = bytearray()
+
+        column_files = { name_i:open(os.path.join(tmp_dir, name_i), 'wb') for name_i in columns }
+
+        with genome.open_textfile(vcf_in) as vcf:
+
+            line_i = genome.skip_vcf_header(vcf)
+
+            while line_i:
+
+                vcf_i = genome.Vcf_line( line_i )
+
+                if vcf_i.chromosome not in contigs:
+                    contigs[ vcf_i.chromosome ] = len(contigs)
+
+                key_j = contigs[vcf_i.chromosome] * genome.COORDINATE_SHIFT + vcf_i.position
+
+                if key_j != key_i:
+
+                    if key_i is not None:
+                        in_order = in_order and key_j > key_i
+                        append_alleles(columns, key_i, alleles)
+
+                    key_i, alleles = key_j, {}
+
+                    if len(columns['keys']) >= FLUSH_SIZE:
+                        flush_columns(columns, column_files)
+
+                identifier = vcf_i.identifier.encode()
+                id_length += len(identifier)
+                columns['id_table'].extend( identifier )
+                columns['id_offsets'].append( id_length )
+
+                flags     = ( FLAG_COMMON if vcf_i.get_info_value('COMMON') == '1' else 0 ) | ( FLAG_SNP if vcf_i.get_info_value('SNP') else 0 )
+                num_cases = num_cases_of(vcf_i)
+
+                # Some VCF files wrongly uses "/" to separate different ALT's
+                for alt_i in re.split(r'[,/]', vcf_i.altbase):
+                    alleles[ ref_alt_hash(vcf_i.refbase, alt_i) ] = (flags, num_cases, n_lines)
+
+                n_lines += 1
+                line_i = vcf.readline().rstrip()
+
+        if key_i is not None:
+            append_alleles(columns, key_i, alleles)
+
+        flush_columns(columns, column_files)
+
+        for file_i in column_files.values():
+            file_i.close()
+
+        arrays = { name_i:mapped_array(os.path.join(tmp_dir, name_i), dtype_i) for name_i, dtype_i, per_variant in ARRAYS }
+
+        if not in_order:
+            logger.warning( '{} is not sorted by coordinate, so it is sorted in memory'.format(vcf_in) )
+
+            # Sorted by coordinate and then hash, and the last of the same variant stands
+            order   = np.lexsort( (np.arange(len(arrays['keys'])), arrays['hashes'], arrays['keys']) )
+            sorted_keys, sorted_hashes = arrays['keys'][order], arrays['hashes'][order]
+            is_last = np.ones( len(order), dtype=bool )
+            is_last[:-1] = (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_hashes[1:] != sorted_hashes[:-1])
+            order   = order[is_last]
+
+            for name_i, dtype_i, per_variant in ARRAYS:
+                if per_variant:
+                    arrays[name_i] = arrays[name_i][order]
+
+        write_index(index_out, arrays, list(contigs))
+
+        n_variants = len(arrays['keys'])
+        del arrays
+
+    logger.info( '{} variants of {} are indexed in {}'.format(n_variants, vcf_in, index_out) )
+
+    return index_out
+
+
+
+def write_index(index_out, arrays, contigs):
+
+    # Each array starts at a multiple of 8 bytes, so it can be memory-mapped in place
+    header = {'contigs': contigs, 'arrays': {}}
+    offset = 0
+    for name_i, dtype_i, per_variant in ARRAYS:
+        header['arrays'][name_i] = [offset, len(arrays[name_i])]
+        offset += -(-arrays[name_i].nbytes // 8) * 8
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * ( -len(header_bytes) % 8 )
+
+    with open(index_out, 'wb') as index_file:
+
+        index_file.write( MAGIC )
+        index_file.write( np.uint64( len(header_bytes) ).tobytes() )
+        index_file.write( header_bytes )
+
+        for name_i, dtype_i, per_variant in ARRAYS:
+
+            # A block at a time, so that memory-mapped arrays are not read into memory as a whole
+            for start_i in range(0, len(arrays[name_i]), FLUSH_SIZE):
+                index_file.write( arrays[name_i][ start_i : start_i + FLUSH_SIZE ].tobytes() )
+
+            index_file.write( b'\0' * ( -arrays[name_i].nbytes % 8 ) )
+
+
+
+class AnnotationIndex:
+
+    def __init__(self, index_file):
+
+        self.name = index_file
+
+        with open(index_file, 'rb') as index_in:
+            if index_in.read( len(MAGIC) ) != MAGIC:
+                raise Exception( '{} is not an annotation index'.format(index_file) )
+
+            header_length = int( np.frombuffer(index_in.read(8), dtype=np.uint64)[0] )
+            header        = json.loads( index_in.read(header_length) )
+
+        self.contigs = { contig_i:n for n, contig_i in enumerate(header['contigs']) }
+
+        # The whole file is mapped once, and each array is a view into it
+        data = np.memmap(index_file, dtype=np.uint8, mode='r')[ len(MAGIC) + 8 + header_length : ]
+
+        for name_i, dtype_i, per_variant in ARRAYS:
+            offset_i, length_i = header['arrays'][name_i]
+            setattr(self, name_i, data[ offset_i : offset_i + length_i * np.dtype(dtype_i).itemsize ].view(dtype_i))
+
+
+    def find(self, variant_id):
+        '''Row of ((contig, position), refbase, altbase) in the index, or None'''
+
+        (contig_i, position_i), refbase, altbase = variant_id
+
+        if contig_i not in self.contigs:
+            return None
+
+        key_i = self.contigs[contig_i] * genome.COORDINATE_SHIFT + int(position_i)
+        start = int( self.keys.searchsorted(key_i, 'left') )
+
+        if start == len(self.keys) or self.keys[start] != key_i:
+            return None
+
+        end    = int( self.keys.searchsorted(key_i, 'right') )
+        hash_i = ref_alt_hash(refbase, altbase)
+
+        for row_i in range(start, end):
+            if int(self.hashes[row_i]) == hash_i:
+                return row_i
+
+        return None
+
+
+    def identifiers(self, row_i):
+        id_number = self.id_numbers[row_i]
+        return self.id_table[ self.id_offsets[id_number] : self.id_offsets[id_number+1] ].tobytes().decode().split(',')
+
+
+    def dbSNP(self, variant_id):
+        '''Same as annotate_caller.dbSNP'''
+
+        row_i = self.find(variant_id)
+
+        if row_i is None:
+            return 0, 0, []
+
+        if_common = 1 if self.flags[row_i] & FLAG_COMMON else 0
+
+        return 1, if_common, self.identifiers(row_i)
+
+
+    def COSMIC(self, variant_id):
+        '''Same as annotate_caller.COSMIC'''
+
+        row_i = self.find(variant_id)
+
+        if row_i is None:
+            return 0, 0, []
+
+        # If designated as SNP, make it "non-cosmic" and make CNT=nan.
+        if self.flags[row_i] & FLAG_SNP:
+            if_cosmic = 0
+            num_cases = nan
+
+        else:
+            if_cosmic = 1
+            num_cases = int( self.num_cases[row_i] )
+            num_cases = num_cases if num_cases >= 0 else nan
+
+        return if_cosmic, num_cases, self.identifiers(row_i)
+
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    vcf_in, index_out = run()
+    build_index(vcf_in, index_out)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import sys, os, argparse, gzip, re, subprocess
+import sys, os, argparse, gzip, re
+from functools import partial
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
@@ -11,6 +12,44 @@ import vcfModifier.copy_TextFile as copy_TextFile
 import vcfModifier.splitVcf as splitVcf
 import vcfModifier.getUniqueVcfPositions as getUniqueVcfPositions
 from vcfModifier.vcfIntersector import *
+from vcfModifier.vcfStream import LineReader, VcfStream, selected_lines
+
+# Steps to take the SNV or INDEL lines out of a two-way split, i.e., splitVcf.split_lines or the modify_* that split
+snv_lines   = partial(selected_lines, variant_type='snv')
+indel_lines = partial(selected_lines, variant_type='indel')
+
+
+
+def normalized_lines(caller_vcf, inclusion=None, exclusion=None, *steps):
+    '''
+    Chains the region filtering of caller_vcf and then each of the steps as generators.
+    Each step takes an opened VCF (i.e., readline or iteration) and yields lines, e.g., modify_*.convert_lines, splitVcf.split_lines, snv_lines, or partial(sorted_lines, ref).
+    '''
+
+    vcf_lines = intersected_lines(caller_vcf, inclusion, exclusion)
+
+    for step_i in steps:
+        vcf_lines = step_i( LineReader(vcf_lines, str(caller_vcf)) )
+
+    return vcf_lines
+
+
+
+def normalized_vcf(outdir, file_name, caller_vcf, inclusion=None, exclusion=None, steps=(), keep_intermediates=False, intermediate_files=None):
+    '''
+    The caller's VCF file ready to be merged and annotated.
+    It's only written into outdir/file_name if the intermediate files are kept. Otherwise, it's a VcfStream that re-reads caller_vcf whenever it's opened.
+    '''
+
+    vcf_stream = VcfStream(file_name, partial(normalized_lines, caller_vcf, inclusion, exclusion, *steps))
+
+    if keep_intermediates:
+        outfile = vcf_stream.write( os.sep.join(( outdir, file_name )) )
+        intermediate_files.add(outfile)
+        return outfile
+
+    else:
+        return vcf_stream
 
 
 
@@ -30,32 +69,22 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
                          'LoFreq'   :{'snv': None, 'indel': None}, \
                          'Strelka'  :{'snv': None, 'indel': None}, }
 
+    # Each caller's VCF is region-filtered, modified, split, and sorted as a chain of generators, so nothing is written unless keep_intermediates:
+    normalized = partial(normalized_vcf, outdir, inclusion=inclusion, exclusion=exclusion, keep_intermediates=keep_intermediates, intermediate_files=intermediate_files)
+
     if mutect:
         
         import vcfModifier.modify_MuTect as mod_mutect
         
-        mutect_in = bed_intersector(mutect, os.sep.join(( outdir, 'intersect.mutect1.vcf' )), inclusion, exclusion)
-        intermediate_files.add(mutect_in)
-        
-        snv_mutect_out = os.sep.join(( outdir, 'snv.mutect1.vcf' ))
-        mod_mutect.convert(mutect_in, snv_mutect_out, bam)
-        
-        intermediate_files.add(snv_mutect_out)
+        snv_mutect_out = normalized('snv.mutect1.vcf', mutect, steps=(partial(mod_mutect.convert_lines, tbam=bam, nbam=None),) )
         snv_intermediates.append(snv_mutect_out)
 
     if mutect2:
         import vcfModifier.modify_ssMuTect2 as mod_mutect2
-                
-        mutect2_in = bed_intersector(mutect2, os.sep.join(( outdir, 'intersect.mutect2.vcf' )), inclusion, exclusion)
-        intermediate_files.add(mutect2_in)
         
-        snv_mutect_out   = os.sep.join(( outdir, 'snv.mutect2.vcf' ))
-        indel_mutect_out = os.sep.join(( outdir, 'indel.mutect2.vcf' ))
-        mod_mutect2.convert(mutect2_in, snv_mutect_out, indel_mutect_out)
+        snv_mutect_out   = normalized('snv.mutect2.vcf',   mutect2, steps=(mod_mutect2.convert_lines, snv_lines) )
+        indel_mutect_out = normalized('indel.mutect2.vcf', mutect2, steps=(mod_mutect2.convert_lines, indel_lines) )
         
-        for file_i in snv_mutect_out, indel_mutect_out:
-            intermediate_files.add( file_i )
-            
         snv_intermediates.append(snv_mutect_out)
         indel_intermediates.append(indel_mutect_out)
         intermediate_vcfs['MuTect2']['snv']   = snv_mutect_out
@@ -64,20 +93,8 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
     if varscan:
         import vcfModifier.modify_VarScan2 as mod_varscan2
 
-        varscan_in = bed_intersector(varscan, os.sep.join(( outdir, 'intersect.varscan.vcf' )), inclusion, exclusion)
-        intermediate_files.add(varscan_in)
-
-        snv_temp          = os.sep.join(( outdir, 'snv.varscan.temp.vcf' ))
-        indel_temp        = os.sep.join(( outdir, 'indel.varscan.temp.vcf' ))
-        snv_varscan_out   = os.sep.join(( outdir, 'snv.varscan.vcf' ))
-        indel_varscan_out = os.sep.join(( outdir, 'indel.varscan.vcf' ))
-
-        splitVcf.split_into_snv_and_indel(varscan_in, snv_temp, indel_temp)
-        mod_varscan2.convert(snv_temp,   snv_varscan_out)
-        mod_varscan2.convert(indel_temp, indel_varscan_out)
-
-        for file_i in snv_temp, indel_temp, snv_varscan_out, indel_varscan_out:
-            intermediate_files.add( file_i )
+        snv_varscan_out   = normalized('snv.varscan.vcf',   varscan, steps=(splitVcf.split_lines, snv_lines,   mod_varscan2.convert_lines) )
+        indel_varscan_out = normalized('indel.varscan.vcf', varscan, steps=(splitVcf.split_lines, indel_lines, mod_varscan2.convert_lines) )
         
         snv_intermediates.append(snv_varscan_out)
         indel_intermediates.append(indel_varscan_out)
@@ -87,21 +104,9 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
     if vardict:
         import vcfModifier.modify_VarDict as mod_vardict
         
-        vardict_in = bed_intersector(vardict, os.sep.join(( outdir, 'intersect.vardict.vcf' )), inclusion, exclusion)
-        intermediate_files.add(vardict_in)
-
-        snv_vardict_out   = os.sep.join(( outdir, 'snv.vardict.vcf' ))
-        indel_vardict_out = os.sep.join(( outdir, 'indel.vardict.vcf'))
-        mod_vardict.convert(vardict_in, snv_vardict_out, indel_vardict_out)
-        
-        sorted_snv_vardict_out   = os.sep.join(( outdir, 'snv.sort.vardict.vcf'))
-        sorted_indel_vardict_out = os.sep.join(( outdir, 'indel.sort.vardict.vcf'))
-        
-        vcfsorter(ref, snv_vardict_out,   sorted_snv_vardict_out)
-        vcfsorter(ref, indel_vardict_out, sorted_indel_vardict_out)
-                
-        for file_i in snv_vardict_out, indel_vardict_out, sorted_snv_vardict_out, sorted_indel_vardict_out:
-            intermediate_files.add( file_i )
+        # VarDict's output is not sorted
+        sorted_snv_vardict_out   = normalized('snv.sort.vardict.vcf',   vardict, steps=(mod_vardict.convert_lines, snv_lines,   partial(sorted_lines, ref)) )
+        sorted_indel_vardict_out = normalized('indel.sort.vardict.vcf', vardict, steps=(mod_vardict.convert_lines, indel_lines, partial(sorted_lines, ref)) )
         
         snv_intermediates.append(sorted_snv_vardict_out)
         indel_intermediates.append(sorted_indel_vardict_out)
@@ -110,16 +115,8 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
 
     if lofreq:
         
-        lofreq_in = bed_intersector(lofreq, os.sep.join(( outdir, 'intersect.lofreq.vcf' )), inclusion, exclusion)
-        intermediate_files.add(lofreq_in)
-        
-        snv_lofreq_out   = os.sep.join(( outdir, 'snv.lofreq.vcf' ))
-        indel_lofreq_out = os.sep.join(( outdir, 'indel.lofreq.vcf' ))
-
-        splitVcf.split_into_snv_and_indel(lofreq_in, snv_lofreq_out, indel_lofreq_out)
-
-        for file_i in snv_lofreq_out, indel_lofreq_out:
-            intermediate_files.add( file_i )
+        snv_lofreq_out   = normalized('snv.lofreq.vcf',   lofreq, steps=(splitVcf.split_lines, snv_lines) )
+        indel_lofreq_out = normalized('indel.lofreq.vcf', lofreq, steps=(splitVcf.split_lines, indel_lines) )
         
         snv_intermediates.append(snv_lofreq_out)
         indel_intermediates.append(indel_lofreq_out)
@@ -128,26 +125,14 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
 
     if scalpel:
         
-        scalpel_in = bed_intersector(scalpel, os.sep.join(( outdir, 'intersect.scalpel.vcf' )), inclusion, exclusion)
-        intermediate_files.add(scalpel_in)
-
-        scalpel_out = os.sep.join(( outdir, 'indel.scalpel.vcf' ))
-        copy_TextFile.copy(scalpel_in, scalpel_out)
-        intermediate_files.add(scalpel_out)
+        scalpel_out = normalized('indel.scalpel.vcf', scalpel)
         indel_intermediates.append(scalpel_out)
         
     if strelka:
         import vcfModifier.modify_ssStrelka as mod_strelka
         
-        strelka_in = bed_intersector(strelka, os.sep.join(( outdir, 'intersect.strelka.vcf' )), inclusion, exclusion)
-        intermediate_files.add(strelka_in)
-
-        snv_strelka_out   = os.sep.join(( outdir, 'snv.strelka.vcf' ))
-        indel_strelka_out = os.sep.join(( outdir, 'indel.strelka.vcf' ))
-        mod_strelka.convert(strelka_in, snv_strelka_out, indel_strelka_out)
-        
-        for file_i in snv_strelka_out, indel_strelka_out:
-            intermediate_files.add( file_i )
+        snv_strelka_out   = normalized('snv.strelka.vcf',   strelka, steps=(mod_strelka.convert_lines, snv_lines) )
+        indel_strelka_out = normalized('indel.strelka.vcf', strelka, steps=(mod_strelka.convert_lines, indel_lines) )
         
         snv_intermediates.append(snv_strelka_out)
         indel_intermediates.append(indel_strelka_out)
@@ -155,27 +140,14 @@ def combineSingle(outdir, ref, bam, inclusion=None, exclusion=None, mutect=None,
         intermediate_vcfs['Strelka']['indel'] = indel_strelka_out
 
 
-    # Combine SNV/INDEL variant candidates
-    snv_combined   = os.sep.join(( outdir, 'unsorted.CombineVariants.snv.vcf' ))
-    indel_combined = os.sep.join(( outdir, 'unsorted.CombineVariants.indel.vcf' ))
-    
-    getUniqueVcfPositions.combine(snv_intermediates, snv_combined)
-    getUniqueVcfPositions.combine(indel_intermediates, indel_combined)
-    for file_i in snv_combined, indel_combined:
-        intermediate_files.add( file_i )
-    
-    # Sort them:
-    snv_combined_sorted = os.sep.join(( outdir, 'CombineVariants.snv.vcf' ))
+    # Combine SNV/INDEL variant candidates into sorted, unique candidates, merging the sorted VCF files in one pass:
+    snv_combined_sorted   = os.sep.join(( outdir, 'CombineVariants.snv.vcf' ))
     indel_combined_sorted = os.sep.join(( outdir, 'CombineVariants.indel.vcf' ))
     
-    vcfsorter(ref, snv_combined,   snv_combined_sorted)
-    vcfsorter(ref, indel_combined, indel_combined_sorted)
+    getUniqueVcfPositions.combine(snv_intermediates,   snv_combined_sorted,   ref + '.fai')
+    getUniqueVcfPositions.combine(indel_intermediates, indel_combined_sorted, ref + '.fai')
     
 
-    if not keep_intermediates:
-        for file_i in intermediate_files:
-            subprocess.call( ('rm', '-v', file_i ) )
-    
     return snv_combined_sorted, indel_combined_sorted, intermediate_vcfs, intermediate_files
 
 
@@ -197,6 +169,9 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
                          'TNscope':  {'snv': None, 'indel': None}, \
                          'Platypus': {'snv': None, 'indel': None} }
     
+    # Each caller's VCF is region-filtered, modified, split, and sorted as a chain of generators, so nothing is written unless keep_intermediates:
+    normalized = partial(normalized_vcf, outdir, inclusion=inclusion, exclusion=exclusion, keep_intermediates=keep_intermediates, intermediate_files=intermediate_files)
+
     # Modify direct VCF outputs for merging:
     if mutect or indelocator:
         
@@ -204,40 +179,21 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
 
         if mutect:
             
-            mutect_in = bed_intersector(mutect, os.sep.join(( outdir, 'intersect.mutect1.vcf' )), inclusion, exclusion)
-            intermediate_files.add(mutect_in)
-            
-            snv_mutect_out = os.sep.join(( outdir, 'snv.mutect1.vcf' ))
-            mod_mutect.convert(mutect_in, snv_mutect_out, tbam, nbam)
-            
-            intermediate_files.add(snv_mutect_out)
+            snv_mutect_out = normalized('snv.mutect1.vcf', mutect, steps=(partial(mod_mutect.convert_lines, tbam=tbam, nbam=nbam),) )
             snv_intermediates.append(snv_mutect_out)
         
         if indelocator:
             
-            indelocator_in = bed_intersector(indelocator, os.sep.join(( outdir, 'intersect.indelocator.vcf' )), inclusion, exclusion)
-            intermediate_files.add(indelocator_in)
-            
-            indel_indelocator_out = os.sep.join(( outdir, 'indel.indelocator.vcf'))
-            mod_mutect.convert(indelocator_in, indel_indelocator_out, tbam, nbam)
-            
-            intermediate_files.add(indel_indelocator_out)
+            indel_indelocator_out = normalized('indel.indelocator.vcf', indelocator, steps=(partial(mod_mutect.convert_lines, tbam=tbam, nbam=nbam),) )
             indel_intermediates.append(indel_indelocator_out)
 
     
     if mutect2:
         
         import vcfModifier.modify_MuTect2 as mod_mutect2
-                
-        mutect2_in = bed_intersector(mutect2, os.sep.join(( outdir, 'intersect.mutect2.vcf' )), inclusion, exclusion)
-        intermediate_files.add(mutect2_in)
-
-        snv_mutect_out   = os.sep.join(( outdir, 'snv.mutect2.vcf'))
-        indel_mutect_out = os.sep.join(( outdir, 'indel.mutect2.vcf'))
-        mod_mutect2.convert(mutect2_in, snv_mutect_out, indel_mutect_out, False)
         
-        for file_i in snv_mutect_out, indel_mutect_out:
-            intermediate_files.add( file_i )
+        snv_mutect_out   = normalized('snv.mutect2.vcf',   mutect2, steps=(partial(mod_mutect2.convert_lines, is_tnscope=False), snv_lines) )
+        indel_mutect_out = normalized('indel.mutect2.vcf', mutect2, steps=(partial(mod_mutect2.convert_lines, is_tnscope=False), indel_lines) )
         
         snv_intermediates.append(snv_mutect_out)
         indel_intermediates.append(indel_mutect_out)
@@ -251,68 +207,32 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
         
         if varscan_snv:
             
-            varscan_in = bed_intersector(varscan_snv, os.sep.join(( outdir, 'intersect.varscan.snv.vcf' )), inclusion, exclusion)
-            intermediate_files.add(varscan_in)
-            
-            snv_varscan_out = os.sep.join(( outdir, 'snv.varscan.vcf'))
-            mod_varscan2.convert(varscan_in, snv_varscan_out)
-            
-            intermediate_files.add(snv_varscan_out)
+            snv_varscan_out = normalized('snv.varscan.vcf', varscan_snv, steps=(mod_varscan2.convert_lines,) )
             snv_intermediates.append(snv_varscan_out)
             
         if varscan_indel:
 
-            varscan_in = bed_intersector(varscan_indel, os.sep.join(( outdir, 'intersect.varscan.indel.vcf' )), inclusion, exclusion)
-            intermediate_files.add(varscan_in)
-            
-            indel_varscan_out = os.sep.join(( outdir, 'indel.varscan.vcf' ))
-            mod_varscan2.convert(varscan_in, indel_varscan_out)
-            
-            intermediate_files.add(indel_varscan_out)
+            indel_varscan_out = normalized('indel.varscan.vcf', varscan_indel, steps=(mod_varscan2.convert_lines,) )
             indel_intermediates.append(indel_varscan_out)
     
     if jsm:
         import vcfModifier.modify_JointSNVMix2 as mod_jsm
 
-        jsm_in = bed_intersector(jsm, os.sep.join(( outdir, 'intersect.jsm.vcf' )), inclusion, exclusion)
-        intermediate_files.add(jsm_in)
-        
-        jsm_out = os.sep.join(( outdir, 'snv.jsm.vcf' ))
-        mod_jsm.convert(jsm_in, jsm_out)
-        
-        intermediate_files.add(jsm_out)
+        jsm_out = normalized('snv.jsm.vcf', jsm, steps=(mod_jsm.convert_lines,) )
         snv_intermediates.append(jsm_out)
     
     if sniper:
         import vcfModifier.modify_SomaticSniper as mod_sniper
         
-        sniper_in = bed_intersector(sniper, os.sep.join(( outdir, 'intersect.sniper.vcf' )), inclusion, exclusion)
-        intermediate_files.add(sniper_in)
-        
-        sniper_out = os.sep.join(( outdir, 'snv.somaticsniper.vcf' ))
-        mod_sniper.convert(sniper_in, sniper_out)
-        
-        intermediate_files.add(sniper_out)
+        sniper_out = normalized('snv.somaticsniper.vcf', sniper, steps=(mod_sniper.convert_lines,) )
         snv_intermediates.append(sniper_out)
         
     if vardict:
         import vcfModifier.modify_VarDict as mod_vardict
 
-        vardict_in = bed_intersector(vardict, os.sep.join(( outdir, 'intersect.vardict.vcf' )), inclusion, exclusion)
-        intermediate_files.add(vardict_in)
-        
-        snv_vardict_out   = os.sep.join(( outdir, 'snv.vardict.vcf' ))
-        indel_vardict_out = os.sep.join(( outdir, 'indel.vardict.vcf' ))
-        mod_vardict.convert(vardict_in, snv_vardict_out, indel_vardict_out)
-        
-        sorted_snv_vardict_out   = os.sep.join(( outdir, 'snv.sort.vardict.vcf' ))
-        sorted_indel_vardict_out = os.sep.join(( outdir, 'indel.sort.vardict.vcf' ))
-        
-        vcfsorter(ref, snv_vardict_out,   sorted_snv_vardict_out)
-        vcfsorter(ref, indel_vardict_out, sorted_indel_vardict_out)
-        
-        for file_i in snv_vardict_out, indel_vardict_out, sorted_snv_vardict_out, sorted_indel_vardict_out:
-            intermediate_files.add(file_i)
+        # VarDict's output is not sorted
+        sorted_snv_vardict_out   = normalized('snv.sort.vardict.vcf',   vardict, steps=(mod_vardict.convert_lines, snv_lines,   partial(sorted_lines, ref)) )
+        sorted_indel_vardict_out = normalized('indel.sort.vardict.vcf', vardict, steps=(mod_vardict.convert_lines, indel_lines, partial(sorted_lines, ref)) )
         
         snv_intermediates.append(sorted_snv_vardict_out)
         indel_intermediates.append(sorted_indel_vardict_out)
@@ -321,47 +241,22 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
         
     if muse:
 
-        muse_in = bed_intersector(muse, os.sep.join(( outdir, 'intersect.muse.vcf' )), inclusion, exclusion)
-        intermediate_files.add(muse_in)
-        
-        muse_out = os.sep.join(( outdir, 'snv.muse.vcf' ))
-        copy_TextFile.copy(muse_in, muse_out)
-        
-        intermediate_files.add(muse_out)
+        muse_out = normalized('snv.muse.vcf', muse)
         snv_intermediates.append(muse_out)
         
     if lofreq_snv:
         
-        lofreq_in = bed_intersector(lofreq_snv, os.sep.join(( outdir, 'intersect.lofreq.snv.vcf' )), inclusion, exclusion)
-        intermediate_files.add(lofreq_in)
-
-
-        snv_lofreq_out = os.sep.join(( outdir, 'snv.lofreq.vcf' ))
-        copy_TextFile.copy(lofreq_in, snv_lofreq_out)
-        
-        intermediate_files.add(snv_lofreq_out)
+        snv_lofreq_out = normalized('snv.lofreq.vcf', lofreq_snv)
         snv_intermediates.append(snv_lofreq_out)
 
     if lofreq_indel:
         
-        lofreq_in = bed_intersector(lofreq_indel, os.sep.join(( outdir, 'intersect.lofreq.indel.vcf' )), inclusion, exclusion)
-        intermediate_files.add(lofreq_in)
-
-        indel_lofreq_out = os.sep.join(( outdir, 'indel.lofreq.vcf' ))
-        copy_TextFile.copy(lofreq_in, indel_lofreq_out)
-        
-        intermediate_files.add(indel_lofreq_out)
+        indel_lofreq_out = normalized('indel.lofreq.vcf', lofreq_indel)
         indel_intermediates.append(indel_lofreq_out)
         
     if scalpel:
         
-        scalpel_in = bed_intersector(scalpel, os.sep.join(( outdir, 'intersect.scalpel.vcf' )), inclusion, exclusion)
-        intermediate_files.add(scalpel_in)
-        
-        scalpel_out = os.sep.join(( outdir, 'indel.scalpel.vcf' ))
-        copy_TextFile.copy(scalpel_in, scalpel_out)
-        
-        intermediate_files.add(scalpel_out)
+        scalpel_out = normalized('indel.scalpel.vcf', scalpel)
         indel_intermediates.append(scalpel_out)
     
     if strelka_snv or strelka_indel:
@@ -370,39 +265,20 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
 
         if strelka_snv:
             
-            strelka_in = bed_intersector(strelka_snv, os.sep.join(( outdir, 'intersect.strelka.snv.vcf' )), inclusion, exclusion)
-            intermediate_files.add(strelka_in)
-            
-            snv_strelka_out = os.sep.join(( outdir, 'snv.strelka.vcf' ))
-            mod_strelka.convert(strelka_in, snv_strelka_out)
-            
-            intermediate_files.add(snv_strelka_out)
+            snv_strelka_out = normalized('snv.strelka.vcf', strelka_snv, steps=(mod_strelka.convert_lines,) )
             snv_intermediates.append(snv_strelka_out)
 
         if strelka_indel:
             
-            strelka_in = bed_intersector(strelka_indel, os.sep.join(( outdir, 'intersect.strelka.indel.vcf' )), inclusion, exclusion)
-            intermediate_files.add(strelka_in)
-                        
-            indel_strelka_out = os.sep.join(( outdir, 'indel.strelka.vcf' ))
-            mod_strelka.convert(strelka_in, indel_strelka_out)
-            
-            intermediate_files.add(indel_strelka_out)
+            indel_strelka_out = normalized('indel.strelka.vcf', strelka_indel, steps=(mod_strelka.convert_lines,) )
             indel_intermediates.append(indel_strelka_out)
             
     if tnscope:
 
         import vcfModifier.modify_MuTect2 as mod_mutect2
         
-        tnscope_in = bed_intersector(tnscope, os.sep.join(( outdir, 'intersect.tnscope.vcf' )), inclusion, exclusion)
-        intermediate_files.add(tnscope_in)
-        
-        snv_tnscope_out   = os.sep.join(( outdir, 'snv.tnscope.vcf' ))
-        indel_tnscope_out = os.sep.join(( outdir, 'indel.tnscope.vcf' ))
-        mod_mutect2.convert(tnscope_in, snv_tnscope_out, indel_tnscope_out, True)
-        
-        for file_i in snv_tnscope_out, indel_tnscope_out:
-            intermediate_files.add( file_i )
+        snv_tnscope_out   = normalized('snv.tnscope.vcf',   tnscope, steps=(partial(mod_mutect2.convert_lines, is_tnscope=True), snv_lines) )
+        indel_tnscope_out = normalized('indel.tnscope.vcf', tnscope, steps=(partial(mod_mutect2.convert_lines, is_tnscope=True), indel_lines) )
         
         snv_intermediates.append(snv_tnscope_out)
         indel_intermediates.append(indel_tnscope_out)
@@ -411,16 +287,8 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
     
     if platypus:
         
-        platypus_in = bed_intersector(platypus, os.sep.join(( outdir, 'intersect.platypus.vcf' )), inclusion, exclusion)
-        intermediate_files.add(platypus_in)
-        
-        snv_platypus_out   = os.sep.join(( outdir, 'snv.platypus.vcf' ))
-        indel_platypus_out = os.sep.join(( outdir, 'indel.platypus.vcf' ))
-
-        splitVcf.split_into_snv_and_indel(platypus_in, snv_platypus_out, indel_platypus_out)
-
-        for file_i in snv_platypus_out, indel_platypus_out:
-            intermediate_files.add( file_i )
+        snv_platypus_out   = normalized('snv.platypus.vcf',   platypus, steps=(splitVcf.split_lines, snv_lines) )
+        indel_platypus_out = normalized('indel.platypus.vcf', platypus, steps=(splitVcf.split_lines, indel_lines) )
         
         snv_intermediates.append(snv_platypus_out)
         indel_intermediates.append(indel_platypus_out)
@@ -429,26 +297,11 @@ def combinePaired(outdir, ref, tbam, nbam, inclusion=None, exclusion=None, mutec
 
     
     
-    # Combine SNV/INDEL variant candidates
-    snv_combined   = os.sep.join(( outdir, 'unsorted.CombineVariants.snv.vcf' ))
-    indel_combined = os.sep.join(( outdir, 'unsorted.CombineVariants.indel.vcf' ))
-    
-    getUniqueVcfPositions.combine(snv_intermediates, snv_combined)
-    getUniqueVcfPositions.combine(indel_intermediates, indel_combined)
-    
-    for file_i in snv_combined, indel_combined:
-        intermediate_files.add( file_i )
-    
-    # Sort them:
-    snv_combined_sorted = os.sep.join(( outdir, 'CombineVariants.snv.vcf' ))
+    # Combine SNV/INDEL variant candidates into sorted, unique candidates, merging the sorted VCF files in one pass:
+    snv_combined_sorted   = os.sep.join(( outdir, 'CombineVariants.snv.vcf' ))
     indel_combined_sorted = os.sep.join(( outdir, 'CombineVariants.indel.vcf' ))
     
-    vcfsorter(ref, snv_combined,   snv_combined_sorted)
-    vcfsorter(ref, indel_combined, indel_combined_sorted)
-    
-    if not keep_intermediates:
-        for file_i in intermediate_files:
-            subprocess.call( ('rm', '-v', file_i ) )
+    getUniqueVcfPositions.combine(snv_intermediates,   snv_combined_sorted,   ref + '.fai')
+    getUniqueVcfPositions.combine(indel_intermediates, indel_combined_sorted, ref + '.fai')
     
     return snv_combined_sorted, indel_combined_sorted, intermediate_vcfs, intermediate_files
-
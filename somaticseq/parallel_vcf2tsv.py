@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# --threads of somatic_vcf2tsv.py and single_sample_vcf2tsv.py
+# The sorted candidate VCF file is cut into contiguous blocks of sites, and a pool of worker processes runs vcf2tsv on the blocks.
+# Each worker opens the BAM files, the reference, and the other VCF files the first time, and keeps them for all of its blocks. The blocks are handed out in order, so every worker gets its blocks in sorted order, and can keep reading forward through those files.
+# The TSV lines of the blocks come back in the order of the blocks, and are written into the one TSV file as they come.
+
+import sys, os, io, logging, contextlib
+from collections import deque
+from multiprocessing import Pool
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+import vcfModifier.vcfStream as vcfStream
+
+logger = logging.getLogger( os.path.basename(__file__) )
+
+# Number of candidate VCF lines in a block, except that lines of the same coordinate are never split
+BLOCK_SIZE = 1000
+
+# Blocks sent out to the workers for each thread, but not yet written out
+BLOCKS_AHEAD = 4
+
+# Opened inputs of a worker process
+worker = {}
+
+
+
+def vcf_blocks(vcf_file, chrom_seq, block_size):
+    '''Yields the header lines plus about block_size lines of vcf_file at a time'''
+
+    with genome.open_textfile(vcf_file) as vcf:
+
+        header = []
+        line_i = vcf.readline()
+
+        while line_i.startswith('#') or line_i.startswith('track='):
+            header.append( line_i )
+            line_i = vcf.readline()
+
+        block, key_i = [], None
+
+        while line_i.rstrip():
+
+            key_j = genome.line_coordinate_key( line_i, chrom_seq )
+
+            # Each block is checked in its worker, but not the lines between blocks:
+            if key_i is not None and key_i > key_j:
+                raise Exception( '{} does not seem to be properly sorted.'.format(vcf_file) )
+
+            if len(block) >= block_size and key_j != key_i:
+                yield header + block
+                block = []
+
+            block.append( line_i )
+            key_i  = key_j
+            line_i = vcf.readline()
+
+        if block:
+            yield header + block
+
+
+
+def init_worker(vcf2tsv, open_inputs):
+    '''vcf2tsv and open_inputs are the functions of the script, with all the parameters except for the sites'''
+
+    worker['vcf2tsv']     = vcf2tsv
+    worker['open_inputs'] = open_inputs
+    worker['inputs']      = None
+
+    # Every block would log the same messages again
+    logging.disable(logging.INFO)
+
+
+
+def tsv_of_block(block):
+
+    # Opened here rather than in init_worker, so that errors come back to the main process instead of killing the worker
+    if worker['inputs'] is None:
+        worker['inputs'] = worker['open_inputs']()
+
+    tsv_lines = io.StringIO()
+    worker['vcf2tsv']( is_vcf=vcfStream.VcfStream('<block>', lambda: (line_i for line_i in block)), outfile=tsv_lines, inputs=worker['inputs'] )
+
+    # Without the TSV header
+    return tsv_lines.getvalue().split('\n', 1)[1]
+
+
+
+def vcf2tsv_in_blocks(vcf2tsv, open_inputs, is_vcf, chrom_seq, outfile, threads, header_line):
+
+    with Pool(threads, initializer=init_worker, initargs=(vcf2tsv, open_inputs)) as pool, ( contextlib.nullcontext(outfile) if hasattr(outfile, 'write') else open(outfile, 'w') ) as outhandle:
+
+        outhandle.write( header_line )
+
+        tsv_blocks = deque()
+
+        for block_i in vcf_blocks(is_vcf, chrom_seq, BLOCK_SIZE):
+
+            tsv_blocks.append( pool.apply_async(tsv_of_block, (block_i,)) )
+
+            if len(tsv_blocks) >= threads * BLOCKS_AHEAD:
+                outhandle.write( tsv_blocks.popleft().get() )
+
+        while tsv_blocks:
+            outhandle.write( tsv_blocks.popleft().get() )
+
+    return outfile
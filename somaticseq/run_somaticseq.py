@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
 import sys, argparse, gzip, os, re, subprocess, logging
+from functools import partial
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
 sys.path.append( PRE_DIR )
 
 import genomicFileHandler.genomic_file_handlers as genome
+import genomicFileHandler.reference_cache as reference_cache
 import vcfModifier.copy_TextFile as copy_TextFile
 import somaticseq.combine_callers as combineCallers
 
@@ -24,7 +26,66 @@ adaTrainer   = os.sep.join( (PRE_DIR, 'r_scripts', 'ada_model_builder_ntChange.R
 adaPredictor = os.sep.join( (PRE_DIR, 'r_scripts', 'ada_model_predictor.R') )
 
 
-def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, inclusion=None, exclusion=None, mutect=None, indelocator=None, mutect2=None, varscan_snv=None, varscan_indel=None, jsm=None, sniper=None, vardict=None, muse=None, lofreq_snv=None, lofreq_indel=None, scalpel=None, strelka_snv=None, strelka_indel=None, tnscope=None, platypus=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False):
+def runPredictor(classifier, ensemble_tsv, classified_tsv):
+    '''Classifiers exported by r_scripts/ada_model_exporter.R are run in Python, and .RData files by ada_model_predictor.R'''
+
+    import somaticseq.ada_predictor as ada_predictor
+
+    if ada_predictor.is_tree_ensemble(classifier):
+        ada_predictor.predict(classifier, ensemble_tsv, classified_tsv)
+    else:
+        subprocess.call( (adaPredictor, classifier, ensemble_tsv, classified_tsv) )
+
+    return classified_tsv
+
+
+
+def streamingClassifier(classifier, vcf_writer, ensemble_tsv, classified_tsv, write_tsv=False):
+    '''
+    For a classifier exported by ada_model_exporter.R or trained by ada_trainer.py, returns the output for vcf2tsv that classifies its lines as they come, straight into vcf_writer's VCF file.
+    ensemble_tsv and classified_tsv are written only with write_tsv. None for .RData files.
+    '''
+
+    import somaticseq.ada_predictor as ada_predictor
+
+    if not ada_predictor.is_tree_ensemble(classifier):
+        return None
+
+    return ada_predictor.StreamingClassifier( ada_predictor.TreeEnsemble(classifier), vcf_writer, ensemble_tsv if write_tsv else None, classified_tsv if write_tsv else None )
+
+
+
+def streamedFeatures(stream, write_tsv=False):
+    '''
+    The columns vcf2tsv needs to work out for a streamingClassifier, i.e., its classifier's and the FORMAT fields of its VCF file.
+    None, i.e., all of them, without a streamingClassifier, or if the TSV files are written.
+    '''
+
+    import somaticseq.SSeq_tsv2vcf as tsv2vcf
+
+    if stream is None or write_tsv:
+        return None
+
+    return stream.model.features() | set(tsv2vcf.FORMAT_FEATURES)
+
+
+
+def runTrainer(ensemble_tsv, excluded_features=(), threads=1, python_trainer=False):
+    '''
+    Trains on ensemble_tsv with ada_model_builder_ntChange.R, or with python_trainer, in Python with threads processes by ada_trainer.py.
+    Returns the classifier, i.e., ensemble_tsv + .ntChange.Classifier.RData, or .ntChange.Classifier.txt from ada_trainer.py.
+    '''
+
+    if python_trainer:
+        import somaticseq.ada_trainer as ada_trainer
+        return ada_trainer.train( [ensemble_tsv], ensemble_tsv + '.ntChange.Classifier.txt', excluded_features, threads=threads )
+
+    subprocess.call( (adaTrainer, ensemble_tsv) + tuple(excluded_features) )
+
+    return ensemble_tsv + '.ntChange.Classifier.RData'
+
+
+def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, inclusion=None, exclusion=None, mutect=None, indelocator=None, mutect2=None, varscan_snv=None, varscan_indel=None, jsm=None, sniper=None, vardict=None, muse=None, lofreq_snv=None, lofreq_indel=None, scalpel=None, strelka_snv=None, strelka_indel=None, tnscope=None, platypus=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False, ref_cache=None, combined=None, shared_inputs=None, write_tsv=False, threads=1, python_trainer=False):
 
     import somaticseq.somatic_vcf2tsv as somatic_vcf2tsv
     import somaticseq.SSeq_tsv2vcf as tsv2vcf
@@ -54,8 +115,14 @@ def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL',
     if tnscope:                indelCallers.append('TNscope')
     if platypus:               indelCallers.append('Platypus')
 
-    # Function to combine individual VCFs into a simple VCF list of variants:
-    outSnv, outIndel, intermediateVcfs, tempFiles = combineCallers.combinePaired(outdir=outdir, ref=ref, tbam=tbam, nbam=nbam, inclusion=inclusion, exclusion=exclusion, mutect=mutect, indelocator=indelocator, mutect2=mutect2, varscan_snv=varscan_snv, varscan_indel=varscan_indel, jsm=jsm, sniper=sniper, vardict=vardict, muse=muse, lofreq_snv=lofreq_snv, lofreq_indel=lofreq_indel, scalpel=scalpel, strelka_snv=strelka_snv, strelka_indel=strelka_indel, tnscope=tnscope, platypus=platypus, keep_intermediates=True)
+    # Function to combine individual VCFs into a simple VCF list of variants.
+    # Without keep_intermediates, the modified caller VCFs in intermediateVcfs are VcfStream's, which vcf2tsv reads straight from the callers' VCF files.
+    # combined, i.e., (outSnv, outIndel, intermediateVcfs), is given if they were already combined, e.g., once for all the threads of somaticseq_parallel.py:
+    if combined:
+        outSnv, outIndel, intermediateVcfs = combined
+        tempFiles = ()
+    else:
+        outSnv, outIndel, intermediateVcfs, tempFiles = combineCallers.combinePaired(outdir=outdir, ref=ref, tbam=tbam, nbam=nbam, inclusion=inclusion, exclusion=exclusion, mutect=mutect, indelocator=indelocator, mutect2=mutect2, varscan_snv=varscan_snv, varscan_indel=varscan_indel, jsm=jsm, sniper=sniper, vardict=vardict, muse=muse, lofreq_snv=lofreq_snv, lofreq_indel=lofreq_indel, scalpel=scalpel, strelka_snv=strelka_snv, strelka_indel=strelka_indel, tnscope=tnscope, platypus=platypus, keep_intermediates=keep_intermediates)
 
     files_to_delete.add(outSnv)
     files_to_delete.add(outIndel)
@@ -69,15 +136,21 @@ def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL',
     ######################  SNV  ######################
     mutect_infile = intermediateVcfs['MuTect2']['snv'] if intermediateVcfs['MuTect2']['snv'] else mutect
 
-    somatic_vcf2tsv.vcf2tsv(is_vcf=outSnv, nbam_fn=nbam, tbam_fn=tbam, truth=truth_snv, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=varscan_snv, jsm=jsm, sniper=sniper, vardict=intermediateVcfs['VarDict']['snv'], muse=muse, lofreq=lofreq_snv, scalpel=None, strelka=strelka_snv, tnscope=intermediateVcfs['TNscope']['snv'], platypus=intermediateVcfs['Platypus']['snv'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, p_scale=None, outfile=ensembleSnv)
+    classifiedSnvTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.tsv' ))
+    classifiedSnvVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.vcf' ))
+
+    # With a classifier from ada_model_exporter.R or ada_trainer.py, the lines of vcf2tsv are classified as they come, straight into the VCF file:
+    snvStream = streamingClassifier(classifier_snv, partial(tsv2vcf.VcfWriter, classifiedSnvVcf, tools=snvCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True, phred_scaled=True), ensembleSnv, classifiedSnvTsv, write_tsv)
+
+    somatic_vcf2tsv.vcf2tsv(is_vcf=outSnv, nbam_fn=nbam, tbam_fn=tbam, truth=truth_snv, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=varscan_snv, jsm=jsm, sniper=sniper, vardict=intermediateVcfs['VarDict']['snv'], muse=muse, lofreq=lofreq_snv, scalpel=None, strelka=strelka_snv, tnscope=intermediateVcfs['TNscope']['snv'], platypus=intermediateVcfs['Platypus']['snv'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, ref_cache=ref_cache, p_scale=None, outfile=snvStream or ensembleSnv, shared_inputs=shared_inputs, features=streamedFeatures(snvStream, write_tsv))
 
 
     # Classify SNV calls
-    if classifier_snv:
-        classifiedSnvTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.tsv' ))
-        classifiedSnvVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.vcf' ))
+    if snvStream:
+        snvStream.close()
 
-        subprocess.call( (adaPredictor, classifier_snv, ensembleSnv, classifiedSnvTsv) )
+    elif classifier_snv:
+        runPredictor(classifier_snv, ensembleSnv, classifiedSnvTsv)
 
         tsv2vcf.tsv2vcf(classifiedSnvTsv, classifiedSnvVcf, snvCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True, phred_scaled=True)
 
@@ -85,7 +158,7 @@ def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL',
     else:
         # Train SNV classifier:
         if somaticseq_train and truth_snv:
-            subprocess.call( (adaTrainer, ensembleSnv, 'Consistent_Mates', 'Inconsistent_Mates') )
+            runTrainer(ensembleSnv, ('Consistent_Mates', 'Inconsistent_Mates'), threads, python_trainer)
 
         consensusSnvVcf = os.sep.join(( outdir, consensusOutPrefix + 'sSNV.vcf' ))
         tsv2vcf.tsv2vcf(ensembleSnv, consensusSnvVcf, snvCallers, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True)
@@ -95,22 +168,28 @@ def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL',
     ###################### INDEL ######################
     mutect_infile = intermediateVcfs['MuTect2']['indel'] if intermediateVcfs['MuTect2']['indel'] else indelocator
 
-    somatic_vcf2tsv.vcf2tsv(is_vcf=outIndel, nbam_fn=nbam, tbam_fn=tbam, truth=truth_indel, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=varscan_indel, vardict=intermediateVcfs['VarDict']['indel'], lofreq=lofreq_indel, scalpel=scalpel, strelka=strelka_indel, tnscope=intermediateVcfs['TNscope']['indel'], platypus=intermediateVcfs['Platypus']['indel'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, p_scale=None, outfile=ensembleIndel)
+    classifiedIndelTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.tsv' ))
+    classifiedIndelVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.vcf' ))
+
+    # With a classifier from ada_model_exporter.R or ada_trainer.py, the lines of vcf2tsv are classified as they come, straight into the VCF file:
+    indelStream = streamingClassifier(classifier_indel, partial(tsv2vcf.VcfWriter, classifiedIndelVcf, tools=indelCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True, phred_scaled=True), ensembleIndel, classifiedIndelTsv, write_tsv)
+
+    somatic_vcf2tsv.vcf2tsv(is_vcf=outIndel, nbam_fn=nbam, tbam_fn=tbam, truth=truth_indel, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=varscan_indel, vardict=intermediateVcfs['VarDict']['indel'], lofreq=lofreq_indel, scalpel=scalpel, strelka=strelka_indel, tnscope=intermediateVcfs['TNscope']['indel'], platypus=intermediateVcfs['Platypus']['indel'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, ref_cache=ref_cache, p_scale=None, outfile=indelStream or ensembleIndel, shared_inputs=shared_inputs, features=streamedFeatures(indelStream, write_tsv))
 
 
     # Classify INDEL calls
-    if classifier_indel:
-        classifiedIndelTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.tsv' ))
-        classifiedIndelVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.vcf' ))
+    if indelStream:
+        indelStream.close()
 
-        subprocess.call( (adaPredictor, classifier_indel, ensembleIndel, classifiedIndelTsv) )
+    elif classifier_indel:
+        runPredictor(classifier_indel, ensembleIndel, classifiedIndelTsv)
 
         tsv2vcf.tsv2vcf(classifiedIndelTsv, classifiedIndelVcf, indelCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True, phred_scaled=True)
 
     else:
         # Train INDEL classifier:
         if somaticseq_train and truth_indel:
-            subprocess.call( (adaTrainer, ensembleIndel, 'Strelka_QSS', 'Strelka_TQSS', 'Consistent_Mates', 'Inconsistent_Mates') )
+            runTrainer(ensembleIndel, ('Strelka_QSS', 'Strelka_TQSS', 'Consistent_Mates', 'Inconsistent_Mates'), threads, python_trainer)
 
         consensusIndelVcf = os.sep.join(( outdir, consensusOutPrefix + 'sINDEL.vcf' ))
         tsv2vcf.tsv2vcf(ensembleIndel, consensusIndelVcf, indelCallers, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=False, paired_mode=True, normal_sample_name=normal_name, tumor_sample_name=tumor_name, print_reject=True)
@@ -127,7 +206,7 @@ def runPaired(outdir, ref, tbam, nbam, tumor_name='TUMOR', normal_name='NORMAL',
 
 
 
-def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, inclusion=None, exclusion=None, mutect=None, mutect2=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False):
+def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, inclusion=None, exclusion=None, mutect=None, mutect2=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False, ref_cache=None, combined=None, shared_inputs=None, write_tsv=False, threads=1, python_trainer=False):
 
     import somaticseq.single_sample_vcf2tsv as single_sample_vcf2tsv
     import somaticseq.SSeq_tsv2vcf as tsv2vcf
@@ -151,8 +230,14 @@ def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel
     if strelka: indelCallers.append('Strelka')
 
 
-    # Function to combine individual VCFs into a simple VCF list of variants:
-    outSnv, outIndel, intermediateVcfs, tempFiles = combineCallers.combineSingle(outdir=outdir, ref=ref, bam=bam, inclusion=inclusion, exclusion=exclusion, mutect=mutect, mutect2=mutect2, varscan=varscan, vardict=vardict, lofreq=lofreq, scalpel=scalpel, strelka=strelka, keep_intermediates=True)
+    # Function to combine individual VCFs into a simple VCF list of variants.
+    # Without keep_intermediates, the modified caller VCFs in intermediateVcfs are VcfStream's, which vcf2tsv reads straight from the callers' VCF files.
+    # combined, i.e., (outSnv, outIndel, intermediateVcfs), is given if they were already combined, e.g., once for all the threads of somaticseq_parallel.py:
+    if combined:
+        outSnv, outIndel, intermediateVcfs = combined
+        tempFiles = ()
+    else:
+        outSnv, outIndel, intermediateVcfs, tempFiles = combineCallers.combineSingle(outdir=outdir, ref=ref, bam=bam, inclusion=inclusion, exclusion=exclusion, mutect=mutect, mutect2=mutect2, varscan=varscan, vardict=vardict, lofreq=lofreq, scalpel=scalpel, strelka=strelka, keep_intermediates=keep_intermediates)
 
     files_to_delete.add(outSnv)
     files_to_delete.add(outIndel)
@@ -165,15 +250,21 @@ def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel
     ######################  SNV  ######################
     mutect_infile = intermediateVcfs['MuTect2']['snv'] if intermediateVcfs['MuTect2']['snv'] else mutect
 
-    single_sample_vcf2tsv.vcf2tsv(is_vcf=outSnv, bam_fn=bam, truth=truth_snv, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=intermediateVcfs['VarScan2']['snv'], vardict=intermediateVcfs['VarDict']['snv'], lofreq=intermediateVcfs['LoFreq']['snv'], scalpel=None, strelka=intermediateVcfs['Strelka']['snv'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, p_scale=None, outfile=ensembleSnv)
+    classifiedSnvTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.tsv' ))
+    classifiedSnvVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.vcf' ))
+
+    # With a classifier from ada_model_exporter.R or ada_trainer.py, the lines of vcf2tsv are classified as they come, straight into the VCF file:
+    snvStream = streamingClassifier(classifier_snv, partial(tsv2vcf.VcfWriter, classifiedSnvVcf, tools=snvCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True, phred_scaled=True), ensembleSnv, classifiedSnvTsv, write_tsv)
+
+    single_sample_vcf2tsv.vcf2tsv(is_vcf=outSnv, bam_fn=bam, truth=truth_snv, cosmic=cosmic, dbsnp=dbsnp, mutect=mutect_infile, varscan=intermediateVcfs['VarScan2']['snv'], vardict=intermediateVcfs['VarDict']['snv'], lofreq=intermediateVcfs['LoFreq']['snv'], scalpel=None, strelka=intermediateVcfs['Strelka']['snv'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, ref_cache=ref_cache, p_scale=None, outfile=snvStream or ensembleSnv, shared_inputs=shared_inputs, features=streamedFeatures(snvStream, write_tsv))
 
 
     # Classify SNV calls
-    if classifier_snv:
-        classifiedSnvTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.tsv' ))
-        classifiedSnvVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sSNV.vcf' ))
+    if snvStream:
+        snvStream.close()
 
-        subprocess.call( (adaPredictor, classifier_snv, ensembleSnv, classifiedSnvTsv) )
+    elif classifier_snv:
+        runPredictor(classifier_snv, ensembleSnv, classifiedSnvTsv)
 
         tsv2vcf.tsv2vcf(classifiedSnvTsv, classifiedSnvVcf, snvCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True, phred_scaled=True)
 
@@ -181,7 +272,7 @@ def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel
     else:
         # Train SNV classifier:
         if somaticseq_train and truth_snv:
-            subprocess.call( (adaTrainer, ensembleSnv, 'Consistent_Mates', 'Inconsistent_Mates') )
+            runTrainer(ensembleSnv, ('Consistent_Mates', 'Inconsistent_Mates'), threads, python_trainer)
 
         consensusSnvVcf = os.sep.join(( outdir, consensusOutPrefix + 'sSNV.vcf' ))
         tsv2vcf.tsv2vcf(ensembleSnv, consensusSnvVcf, snvCallers, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True)
@@ -189,22 +280,28 @@ def runSingle(outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel
 
 
     ###################### INDEL ######################
-    single_sample_vcf2tsv.vcf2tsv(is_vcf=outIndel, bam_fn=bam, truth=truth_indel, cosmic=cosmic, dbsnp=dbsnp, mutect=intermediateVcfs['MuTect2']['indel'], varscan=intermediateVcfs['VarScan2']['indel'], vardict=intermediateVcfs['VarDict']['indel'], lofreq=intermediateVcfs['LoFreq']['indel'], scalpel=scalpel, strelka=intermediateVcfs['Strelka']['indel'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, p_scale=None, outfile=ensembleIndel)
+    classifiedIndelTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.tsv' ))
+    classifiedIndelVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.vcf' ))
+
+    # With a classifier from ada_model_exporter.R or ada_trainer.py, the lines of vcf2tsv are classified as they come, straight into the VCF file:
+    indelStream = streamingClassifier(classifier_indel, partial(tsv2vcf.VcfWriter, classifiedIndelVcf, tools=indelCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True, phred_scaled=True), ensembleIndel, classifiedIndelTsv, write_tsv)
+
+    single_sample_vcf2tsv.vcf2tsv(is_vcf=outIndel, bam_fn=bam, truth=truth_indel, cosmic=cosmic, dbsnp=dbsnp, mutect=intermediateVcfs['MuTect2']['indel'], varscan=intermediateVcfs['VarScan2']['indel'], vardict=intermediateVcfs['VarDict']['indel'], lofreq=intermediateVcfs['LoFreq']['indel'], scalpel=scalpel, strelka=intermediateVcfs['Strelka']['indel'], dedup=True, min_mq=min_mq, min_bq=min_bq, min_caller=min_caller, ref_fa=ref, ref_cache=ref_cache, p_scale=None, outfile=indelStream or ensembleIndel, shared_inputs=shared_inputs, features=streamedFeatures(indelStream, write_tsv))
 
 
     # Classify INDEL calls
-    if classifier_indel:
-        classifiedIndelTsv = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.tsv' ))
-        classifiedIndelVcf = os.sep.join(( outdir, classifiedOutPrefix + 'sINDEL.vcf' ))
+    if indelStream:
+        indelStream.close()
 
-        subprocess.call( (adaPredictor, classifier_indel, ensembleIndel, classifiedIndelTsv) )
+    elif classifier_indel:
+        runPredictor(classifier_indel, ensembleIndel, classifiedIndelTsv)
 
         tsv2vcf.tsv2vcf(classifiedIndelTsv, classifiedIndelVcf, indelCallers, pass_score=pass_threshold, lowqual_score=lowqual_threshold, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True, phred_scaled=True)
 
     else:
         # Train INDEL classifier:
         if somaticseq_train and truth_indel:
-            subprocess.call( (adaTrainer, ensembleIndel, 'Strelka_QSS', 'Strelka_TQSS', 'Consistent_Mates', 'Inconsistent_Mates') )
+            runTrainer(ensembleIndel, ('Strelka_QSS', 'Strelka_TQSS', 'Consistent_Mates', 'Inconsistent_Mates'), threads, python_trainer)
 
         consensusIndelVcf = os.sep.join(( outdir, consensusOutPrefix + 'sINDEL.vcf' ))
         tsv2vcf.tsv2vcf(ensembleIndel, consensusIndelVcf, indelCallers, hom_threshold=hom_threshold, het_threshold=het_threshold, single_mode=True, paired_mode=False, tumor_sample_name=sample_name, print_reject=True)
@@ -251,9 +348,13 @@ def run():
     parser.add_argument('-exclude',  '--exclusion-region', type=str,   help='exclusion bed')
 
     parser.add_argument('-nt', '--threads',  type=int, help='number of threads', default=1)
+    parser.add_argument('-chunks', '--chunks-per-thread', type=int, help='number of regions per thread, handed out to whichever thread is free', default=10)
+    parser.add_argument('-refcache', '--reference-cache', type=str, help='Reference cache for homopolymer lengths. Built with genomicFileHandler/reference_cache.py if it does not exist yet')
 
     parser.add_argument('--keep-intermediates',         action='store_true', help='Keep intermediate files', default=False)
     parser.add_argument('-train', '--somaticseq-train', action='store_true', help='Invoke training mode with ground truths', default=False)
+    parser.add_argument('--python-trainer',             action='store_true', help='In training mode, train in Python with --threads processes (somaticseq/ada_trainer.py) into a .txt classifier, instead of ada in R into an .RData classifier', default=False)
+    parser.add_argument('-tsv',   '--write-tsv',        action='store_true', help='Write the Ensemble and Classified TSV files also when classifying with a classifier from ada_model_exporter.R or ada_trainer.py, which is otherwise done in memory', default=False)
 
 
     # Modes:
@@ -318,6 +419,9 @@ if __name__ == '__main__':
 
     os.makedirs(runParameters['output_directory'], exist_ok=True)
 
+    if runParameters['reference_cache'] and not os.path.exists(runParameters['reference_cache']):
+        reference_cache.build(runParameters['genome_reference'], runParameters['reference_cache'])
+
     if runParameters['which'] == 'paired':
 
         runPaired( outdir             = runParameters['output_directory'], \
@@ -358,7 +462,11 @@ if __name__ == '__main__':
                    tnscope            = runParameters['tnscope_vcf'], \
                    platypus           = runParameters['platypus_vcf'], \
                    somaticseq_train   = runParameters['somaticseq_train'], \
-                   keep_intermediates = runParameters['keep_intermediates'] )
+                   keep_intermediates = runParameters['keep_intermediates'], \
+                   ref_cache          = runParameters['reference_cache'], \
+                   write_tsv          = runParameters['write_tsv'], \
+                   threads            = runParameters['threads'], \
+                   python_trainer     = runParameters['python_trainer'] )
 
     elif runParameters['which'] == 'single':
 
@@ -389,4 +497,8 @@ if __name__ == '__main__':
                    scalpel            = runParameters['scalpel_vcf'], \
                    strelka            = runParameters['strelka_vcf'], \
                    somaticseq_train   = runParameters['somaticseq_train'], \
-                   keep_intermediates = runParameters['keep_intermediates'] )
+                   keep_intermediates = runParameters['keep_intermediates'], \
+                   ref_cache          = runParameters['reference_cache'], \
+                   write_tsv          = runParameters['write_tsv'], \
+                   threads            = runParameters['threads'], \
+                   python_trainer     = runParameters['python_trainer'] )
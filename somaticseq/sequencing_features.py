@@ -1,199 +1,528 @@
 #!/usr/bin/env python3
 
-import sys, os, re, pysam
-import scipy.stats as stats
+import sys, os, re, math, threading, pysam
+from itertools import zip_longest
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
 sys.path.append( PRE_DIR )
 
 import genomicFileHandler.genomic_file_handlers as genome
+import somaticseq.fisher as fisher
 from genomicFileHandler.read_info_extractor import * 
 
 nan = float('nan')
 
+# The statistical tests of AlleleTally.features that are left nan when their columns of vcf2tsv (after the nBAM_ or tBAM_ prefix) are not needed, e.g., by the classifier. z_ranksums_NM has no column.
+OPTIONAL_FEATURES = {'z_ranksums_mq':     'Z_Ranksums_MQ',
+                     'z_ranksums_bq':     'Z_Ranksums_BQ',
+                     'z_ranksums_NM':     None,
+                     'z_ranksums_endpos': 'Z_Ranksums_EndPos',
+                     'concordance_fet':   'Concordance_FET',
+                     'strandbias_fet':    'StrandBias_FET',
+                     'clipping_fet':      'Clipping_FET'}
 
-def from_bam(bam, my_coordinate, ref_base, first_alt, min_mq=1, min_bq=10):
 
+
+class PileupSweeper:
+    '''
+    Stands in for a pysam.AlignmentFile in from_bam when the sites come in sorted order.
+    Instead of one bam.fetch() per site, it walks each region once and keeps the reads overlapping the current site in memory, so reads in dense clusters of candidates are only decoded once.
+    fetch(contig, start, stop) returns the same reads, in the same order, as bam.fetch(contig, start, stop) for a 1-bp window.
+    If the next site goes backward, moves to another contig, or jumps more than max_gap bp ahead, it simply re-seeks with the BAM index.
+    '''
+
+    def __init__(self, bam, max_gap=1000):
+
+        self.bam     = bam
+        self.max_gap = max_gap
+
+        self.contig     = None
+        self.last_start = None
+        self.reads      = None
+        self.active     = []    # [ (reference end, read), ... ] in BAM order
+        self.pending    = None  # read already taken out of self.reads, but not yet reached
+
+
+    def seek(self, contig, start):
+
+        self.contig     = contig
+        self.last_start = start
+        self.reads      = self.bam.fetch(contig, start)
+        self.active     = []
+        self.pending    = None
+
+
+    def fetch(self, contig, start, stop):
+
+        if contig != self.contig or start < self.last_start or start - self.last_start > self.max_gap:
+            self.seek(contig, start)
+
+        self.last_start = start
+
+        # Reads that end at or before the start cannot overlap this or any subsequent site:
+        self.active = [ item_i for item_i in self.active if item_i[0] > start ]
+
+        # Pull in the reads that start before the end of this window:
+        if self.pending is not None:
+            if self.pending.reference_start >= stop:
+                return [ item_i[1] for item_i in self.active ]
+
+            self.active.append( (read_end(self.pending), self.pending) )
+            self.pending = None
+
+        for read_i in self.reads:
+            if read_i.reference_start >= stop:
+                self.pending = read_i
+                break
+
+            self.active.append( (read_end(read_i), read_i) )
+
+        return [ item_i[1] for item_i in self.active if item_i[0] > start ]
+
+
+    def close(self):
+        self.bam.close()
+
+
+
+def read_end(read_i):
+    '''Same as htslib's bam_endpos, i.e., reads without alignment span 1 bp, which is how bam.fetch() decides if a read overlaps a region.'''
+    return read_i.reference_end if read_i.reference_end is not None else read_i.reference_start + 1
+
+
+
+
+class IntegerHistogram:
+    '''
+    Accumulates small non-negative integers, e.g., MQ, BQ, NM, or distance from the end of a read, as the number of reads for each value.
+    Memory is bounded by the largest value rather than by read depth, and the mean and rank-sum test can be done on the counts.
     '''
-    bam is the opened file handle of bam file
+
+    def __init__(self, size=64):
+
+        self.counts = [0] * size
+        self.n      = 0
+        self.total  = 0
+
+
+    def add(self, value):
+
+        if value >= len(self.counts):
+            self.counts.extend( [0] * (value + 1 - len(self.counts)) )
+
+        self.counts[value] += 1
+        self.n     += 1
+        self.total += value
+
+
+    def mean(self):
+        return self.total/self.n if self.n else nan
+
+
+
+def ranksums_z(x, y):
+    '''
+    Same z-statistic as scipy.stats.ranksums(x, y)[0], but x and y are IntegerHistograms.
+    Tied values get the average of their ranks, and there is no tie correction, just like scipy.
+    The sum of ranks is tallied as an integer (i.e., twice the sum) so it is exact.
+    '''
+
+    n1, n2 = x.n, y.n
+
+    if n1 == 0 or n2 == 0:
+        return nan
+
+    twice_rank_sum = 0
+    n_below = 0
+    for count_x, count_y in zip_longest(x.counts, y.counts, fillvalue=0):
+
+        count_xy = count_x + count_y
+
+        # Values tied here take ranks n_below+1 through n_below+count_xy, i.e., an average of n_below + (count_xy+1)/2
+        if count_x:
+            twice_rank_sum += count_x * (2*n_below + count_xy + 1)
+
+        n_below += count_xy
+
+    expected = n1 * (n1+n2+1) / 2.0
+    z = (twice_rank_sum/2 - expected) / math.sqrt(n1*n2*(n1+n2+1)/12.0)
+
+    return z
+
+
+
+
+def skipped_features(features, prefix):
+    '''
+    The keys of OPTIONAL_FEATURES whose columns, i.e., prefix + column, are not among features, the columns of vcf2tsv asked for.
+    features of None asks for all of them.
+    '''
+
+    if features is None:
+        return frozenset()
+
+    return frozenset( key_i for key_i, column_i in OPTIONAL_FEATURES.items() if column_i is None or prefix + column_i not in features )
+
+
+
+def from_bam(bam, my_coordinate, ref_base, first_alt, min_mq=1, min_bq=10, skipped=()):
+
+    '''
+    bam is the opened file handle of bam file, or a PileupSweeper of it
     my_coordiate is a list or tuple of 0-based (contig, position)
+    skipped are keys of OPTIONAL_FEATURES to leave nan, e.g., from skipped_features
     '''
-    
-    indel_length = len(first_alt) - len(ref_base)
+
+    return from_bam_multiallelic(bam, my_coordinate, [(ref_base, first_alt)], min_mq, min_bq, skipped)[0]
+
+
+
+def from_bam_multiallelic(bam, my_coordinate, variants, min_mq=1, min_bq=10, skipped=()):
+
+    '''
+    Same as from_bam, but for all the variants at the same coordinate, i.e., variants is a list of (ref_base, first_alt).
+    The reads are fetched and located once, and each read is then classified against every variant.
+    Returns a list of feature dictionaries, one for each variant in the same order.
+    '''
+
+    tallies = [ AlleleTally(ref_base, first_alt) for ref_base, first_alt in variants ]
+
+    dp = MQ0 = poor_read_count = 0
+
     reads = bam.fetch( my_coordinate[0], my_coordinate[1]-1, my_coordinate[1] )
-    
-    ref_read_mq = []
-    alt_read_mq = []
-    ref_read_bq = []
-    alt_read_bq = []
-    ref_edit_distance = []
-    alt_edit_distance = []
-    
-    ref_concordant_reads = alt_concordant_reads = ref_discordant_reads = alt_discordant_reads = 0
-    ref_for = ref_rev = alt_for = alt_rev = dp = 0
-    ref_SC_reads = alt_SC_reads = ref_notSC_reads = alt_notSC_reads = 0
-    MQ0 = 0
-    
-    ref_pos_from_end = []
-    alt_pos_from_end = []
-    ref_flanking_indel = []
-    alt_flanking_indel = []
-    
-    noise_read_count = poor_read_count  = 0
-    
-    qname_collector = {}
-    
+
     for read_i in reads:
         if not read_i.is_unmapped and dedup_test(read_i):
-            
+
             dp += 1
-            
-            code_i, ith_base, base_call_i, indel_length_i, flanking_indel_i = position_of_aligned_read(read_i, my_coordinate[1]-1 )
-            
+
+            code_i, ith_base, base_call_i, indel_length_i, flanking_indel_i = locate_aligned_position(read_i, my_coordinate[1]-1 )
+
             if read_i.mapping_quality < min_mq and mean(read_i.query_qualities) < min_bq:
                 poor_read_count += 1
-            
+
             if read_i.mapping_quality == 0:
                 MQ0 += 1
-            
-            # Reference calls:
-            if code_i == 1 and base_call_i == ref_base[0]:
 
-                try:
-                    qname_collector[read_i.qname].append(0)
-                except KeyError:
-                    qname_collector[read_i.qname] = [0]
-            
-                ref_read_mq.append( read_i.mapping_quality )
-                ref_read_bq.append( read_i.query_qualities[ith_base] )
-                
-                try:
-                    ref_edit_distance.append( read_i.get_tag('NM') )
-                except KeyError:
-                    pass
-                
-                # Concordance
-                if        read_i.is_proper_pair  and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    ref_concordant_reads += 1
-                elif (not read_i.is_proper_pair) and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    ref_discordant_reads += 1
-                
-                # Orientation
-                if (not read_i.is_reverse) and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    ref_for += 1
-                elif    read_i.is_reverse  and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    ref_rev += 1
-                
-                # Soft-clipped reads?
-                if read_i.cigar[0][0] == cigar_soft_clip or read_i.cigar[-1][0] == cigar_soft_clip:
-                    ref_SC_reads += 1
-                else:
-                    ref_notSC_reads += 1
-
-                # Distance from the end of the read:
-                if ith_base != None:
-                    ref_pos_from_end.append( min(ith_base, read_i.query_length-ith_base) )
-                    
-                # Flanking indels:
-                ref_flanking_indel.append( flanking_indel_i )
+            # Only reference or alternate calls need to know more about the read:
+            if code_i in (1, 2, 3):
+                aligned_read = AlignedRead(read_i, ith_base, flanking_indel_i, min_mq, min_bq)
+            else:
+                aligned_read = None
 
-            
-            # Alternate calls:
-            # SNV, or Deletion, or Insertion where I do not check for matching indel length
-            elif (indel_length == 0 and code_i == 1 and base_call_i == first_alt) or \
-                 (indel_length < 0  and code_i == 2 and indel_length == indel_length_i) or \
-                 (indel_length > 0  and code_i == 3):
-
-                try:
-                    qname_collector[read_i.qname].append(1)
-                except KeyError:
-                    qname_collector[read_i.qname] = [1]
-
-                alt_read_mq.append( read_i.mapping_quality )
-                alt_read_bq.append( read_i.query_qualities[ith_base] )
-                
-                try:
-                    alt_edit_distance.append( read_i.get_tag('NM') )
-                except KeyError:
-                    pass
-                
-                # Concordance
-                if        read_i.is_proper_pair  and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    alt_concordant_reads += 1
-                elif (not read_i.is_proper_pair) and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    alt_discordant_reads += 1
-                
-                # Orientation
-                if (not read_i.is_reverse) and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    alt_for += 1
-                elif    read_i.is_reverse  and read_i.mapping_quality >= min_mq and read_i.query_qualities[ith_base] >= min_bq:
-                    alt_rev += 1
-                
-                # Soft-clipped reads?
-                if read_i.cigar[0][0] == cigar_soft_clip or read_i.cigar[-1][0] == cigar_soft_clip:
-                    alt_SC_reads += 1
-                else:
-                    alt_notSC_reads += 1
-
-                # Distance from the end of the read:
-                if ith_base != None:
-                    alt_pos_from_end.append( min(ith_base, read_i.query_length-ith_base) )
-                                        
-                # Flanking indels:
-                alt_flanking_indel.append( flanking_indel_i )
-            
-            
-            # Inconsistent read or 2nd alternate calls:
+            for tally_i in tallies:
+                tally_i.add(read_i.qname, code_i, base_call_i, indel_length_i, aligned_read)
+
+    return [ tally_i.features(dp, MQ0, poor_read_count, skipped) for tally_i in tallies ]
+
+
+
+class AlignedRead:
+    '''What from_bam needs to know about a read that covers the site, worked out once no matter how many variants are there.'''
+
+    __slots__ = ('mq', 'bq', 'NM', 'passed', 'is_proper_pair', 'is_reverse', 'soft_clipped', 'pos_from_end', 'flanking_indel')
+
+    def __init__(self, read_i, ith_base, flanking_indel_i, min_mq, min_bq):
+
+        self.mq = read_i.mapping_quality
+        self.bq = read_i.query_qualities[ith_base]
+
+        try:
+            self.NM = read_i.get_tag('NM')
+        except KeyError:
+            self.NM = None
+
+        self.passed         = self.mq >= min_mq and self.bq >= min_bq
+        self.is_proper_pair = read_i.is_proper_pair
+        self.is_reverse     = read_i.is_reverse
+        self.soft_clipped   = read_i.cigar[0][0] == cigar_soft_clip or read_i.cigar[-1][0] == cigar_soft_clip
+
+        # Distance from the end of the read:
+        self.pos_from_end   = min(ith_base, read_i.query_length-ith_base) if ith_base != None else None
+        self.flanking_indel = flanking_indel_i
+
+
+
+class AlleleTally:
+    '''Reference and alternate read tallies at a site for one variant, i.e., ref_base and first_alt.'''
+
+    def __init__(self, ref_base, first_alt):
+
+        self.ref_base     = ref_base
+        self.first_alt    = first_alt
+        self.indel_length = len(first_alt) - len(ref_base)
+
+        # [ reference, alternate ]
+        self.mq             = [ IntegerHistogram(), IntegerHistogram() ]
+        self.bq             = [ IntegerHistogram(), IntegerHistogram() ]
+        self.edit_distance  = [ IntegerHistogram(), IntegerHistogram() ]
+        self.pos_from_end   = [ IntegerHistogram(), IntegerHistogram() ]
+        self.concordant     = [0, 0]
+        self.discordant     = [0, 0]
+        self.forward        = [0, 0]
+        self.reverse        = [0, 0]
+        self.SC_reads       = [0, 0]
+        self.notSC_reads    = [0, 0]
+
+        # Number of reads with the nearest flanking indel 1, 2, or 3 bp away:
+        self.flanking_indel = [ [0, 0, 0, 0], [0, 0, 0, 0] ]
+
+        self.noise_read_count = 0
+        self.qname_collector  = {}
+
+
+    def add(self, qname, code_i, base_call_i, indel_length_i, aligned_read):
+
+        # Reference calls:
+        if code_i == 1 and base_call_i == self.ref_base[0]:
+            call_i = 0
+
+        # Alternate calls:
+        # SNV, or Deletion, or Insertion where I do not check for matching indel length
+        elif (self.indel_length == 0 and code_i == 1 and base_call_i == self.first_alt) or \
+             (self.indel_length < 0  and code_i == 2 and self.indel_length == indel_length_i) or \
+             (self.indel_length > 0  and code_i == 3):
+            call_i = 1
+
+        # Inconsistent read or 2nd alternate calls:
+        else:
+            call_i = 2
+
+        try:
+            self.qname_collector[qname].append(call_i)
+        except KeyError:
+            self.qname_collector[qname] = [call_i]
+
+        if call_i == 2:
+            self.noise_read_count += 1
+            return
+
+        self.mq[call_i].add( aligned_read.mq )
+        self.bq[call_i].add( aligned_read.bq )
+
+        if aligned_read.NM is not None:
+            self.edit_distance[call_i].add( aligned_read.NM )
+
+        # Concordance
+        if aligned_read.passed:
+            if aligned_read.is_proper_pair:
+                self.concordant[call_i] += 1
             else:
-                
-                try:
-                    qname_collector[read_i.qname].append(2)
-                except KeyError:
-                    qname_collector[read_i.qname] = [2]
-                
-                noise_read_count += 1
-    
-    # Done extracting info from tumor BAM. Now tally them:
-    ref_mq        = mean(ref_read_mq)
-    alt_mq        = mean(alt_read_mq)
-    z_ranksums_mq = stats.ranksums(alt_read_mq, ref_read_mq)[0]
-    
-    ref_bq        = mean(ref_read_bq)
-    alt_bq        = mean(alt_read_bq)
-    z_ranksums_bq = stats.ranksums(alt_read_bq, ref_read_bq)[0]
-    
-    ref_NM        = mean(ref_edit_distance)
-    alt_NM        = mean(alt_edit_distance)
-    z_ranksums_NM = stats.ranksums(alt_edit_distance, ref_edit_distance)[0]
-    NM_Diff       = alt_NM - ref_NM - abs(indel_length)
-    
-    concordance_fet = stats.fisher_exact(( (ref_concordant_reads, alt_concordant_reads), (ref_discordant_reads, alt_discordant_reads) ))[1]
-    strandbias_fet  = stats.fisher_exact(( (ref_for, alt_for), (ref_rev, alt_rev) ))[1]
-    clipping_fet    = stats.fisher_exact(( (ref_notSC_reads, alt_notSC_reads), (ref_SC_reads, alt_SC_reads) ))[1]
-    
-    z_ranksums_endpos = stats.ranksums(alt_pos_from_end, ref_pos_from_end)[0]
-    
-    ref_indel_1bp = ref_flanking_indel.count(1)
-    ref_indel_2bp = ref_flanking_indel.count(2) + ref_indel_1bp
-    ref_indel_3bp = ref_flanking_indel.count(3) + ref_indel_2bp + ref_indel_1bp
-    alt_indel_1bp = alt_flanking_indel.count(1)
-    alt_indel_2bp = alt_flanking_indel.count(2) + alt_indel_1bp
-    alt_indel_3bp = alt_flanking_indel.count(3) + alt_indel_2bp + alt_indel_1bp
-    
-    consistent_mates = inconsistent_mates = 0
-    for pairs_i in qname_collector:
-        
-        # Both are alternative calls:
-        if qname_collector[pairs_i] == [1,1]:
-            consistent_mates += 1
-        
-        # One is alternate call but the other one is not:
-        elif len(qname_collector[pairs_i]) == 2 and 1 in qname_collector[pairs_i]:
-            inconsistent_mates += 1
+                self.discordant[call_i] += 1
+
+        # Orientation
+        if aligned_read.passed:
+            if aligned_read.is_reverse:
+                self.reverse[call_i] += 1
+            else:
+                self.forward[call_i] += 1
+
+        # Soft-clipped reads?
+        if aligned_read.soft_clipped:
+            self.SC_reads[call_i] += 1
+        else:
+            self.notSC_reads[call_i] += 1
+
+        # Distance from the end of the read:
+        if aligned_read.pos_from_end != None:
+            self.pos_from_end[call_i].add( aligned_read.pos_from_end )
+
+        # Flanking indels:
+        if aligned_read.flanking_indel in (1,2,3):
+            self.flanking_indel[call_i][aligned_read.flanking_indel] += 1
+
+
+    def features(self, dp, MQ0, poor_read_count, skipped=()):
+        '''skipped are keys of OPTIONAL_FEATURES, which are then nan rather than tested'''
+
+        ref_mq        = self.mq[0].mean()
+        alt_mq        = self.mq[1].mean()
+        z_ranksums_mq = ranksums_z(self.mq[1], self.mq[0]) if 'z_ranksums_mq' not in skipped else nan
+
+        ref_bq        = self.bq[0].mean()
+        alt_bq        = self.bq[1].mean()
+        z_ranksums_bq = ranksums_z(self.bq[1], self.bq[0]) if 'z_ranksums_bq' not in skipped else nan
+
+        ref_NM        = self.edit_distance[0].mean()
+        alt_NM        = self.edit_distance[1].mean()
+        z_ranksums_NM = ranksums_z(self.edit_distance[1], self.edit_distance[0]) if 'z_ranksums_NM' not in skipped else nan
+        NM_Diff       = alt_NM - ref_NM - abs(self.indel_length)
+
+        ref_concordant_reads, alt_concordant_reads = self.concordant
+        ref_discordant_reads, alt_discordant_reads = self.discordant
+        ref_for, alt_for = self.forward
+        ref_rev, alt_rev = self.reverse
+        ref_SC_reads,    alt_SC_reads    = self.SC_reads
+        ref_notSC_reads, alt_notSC_reads = self.notSC_reads
+
+        concordance_fet = fisher.fisher_exact(( (ref_concordant_reads, alt_concordant_reads), (ref_discordant_reads, alt_discordant_reads) ))[1] if 'concordance_fet' not in skipped else nan
+        strandbias_fet  = fisher.fisher_exact(( (ref_for, alt_for), (ref_rev, alt_rev) ))[1]                                                    if 'strandbias_fet'  not in skipped else nan
+        clipping_fet    = fisher.fisher_exact(( (ref_notSC_reads, alt_notSC_reads), (ref_SC_reads, alt_SC_reads) ))[1]                        if 'clipping_fet'    not in skipped else nan
+
+        z_ranksums_endpos = ranksums_z(self.pos_from_end[1], self.pos_from_end[0]) if 'z_ranksums_endpos' not in skipped else nan
+
+        ref_flanking_indel, alt_flanking_indel = self.flanking_indel
+        ref_indel_1bp = ref_flanking_indel[1]
+        ref_indel_2bp = ref_flanking_indel[2] + ref_indel_1bp
+        ref_indel_3bp = ref_flanking_indel[3] + ref_indel_2bp + ref_indel_1bp
+        alt_indel_1bp = alt_flanking_indel[1]
+        alt_indel_2bp = alt_flanking_indel[2] + alt_indel_1bp
+        alt_indel_3bp = alt_flanking_indel[3] + alt_indel_2bp + alt_indel_1bp
+
+        consistent_mates = inconsistent_mates = 0
+        for pairs_i in self.qname_collector:
+
+            # Both are alternative calls:
+            if self.qname_collector[pairs_i] == [1,1]:
+                consistent_mates += 1
+
+            # One is alternate call but the other one is not:
+            elif len(self.qname_collector[pairs_i]) == 2 and 1 in self.qname_collector[pairs_i]:
+                inconsistent_mates += 1
+
+        noise_read_count = self.noise_read_count
+        indel_length     = self.indel_length
+
+        features = vars()
+        del features['self'], features['skipped']
+
+        return features
+
+
+
+
+
+class BamFeaturePrefetcher:
+    '''
+    Extracts BAM features (i.e., from_bam_multiallelic) in a pool of I/O threads, ahead of the sites vcf2tsv is working on.
+    Every thread opens its own pysam handles to every BAM file, so the tumor and normal BAM files are read concurrently, and so are the next sites (up to lookahead of them) while the current one is being annotated.
+    sites is an iterator of ( (contig, position), [(ref_base, first_alt), ...] ) in the same sorted order vcf2tsv walks through, e.g., variants_by_coordinate.
+    get() returns the same list of feature dictionaries per BAM file as calling from_bam_multiallelic directly. Sites skipped by vcf2tsv are simply dropped.
+    skipped are the skipped features of from_bam_multiallelic for each BAM file.
+    '''
+
+    def __init__(self, bam_files, sites, chrom_seq, ref_fa=None, min_mq=1, min_bq=10, io_threads=2, lookahead=64, per_site_fetch=False, skipped=None):
+
+        self.bam_files      = bam_files
+        self.sites          = iter(sites)
+        self.chrom_seq      = chrom_seq
+        self.ref_fa         = ref_fa
+        self.min_mq         = min_mq
+        self.min_bq         = min_bq
+        self.lookahead      = lookahead
+        self.per_site_fetch = per_site_fetch
+        self.skipped        = skipped if skipped else [ () for bam_file in bam_files ]
+
+        self.pool    = ThreadPoolExecutor(max_workers=io_threads)
+        self.local   = threading.local()
+        self.lock    = threading.Lock()
+        self.handles = []
+        self.queue   = deque()   # [ (coordinate, variants), [future for each BAM file] ]
+
+        self.fill()
+
+
+    def fill(self):
+
+        while len(self.queue) < self.lookahead:
+
+            try:
+                my_coordinate, variants = next(self.sites)
+            except StopIteration:
+                break
+
+            futures = [ self.pool.submit(self.extract, bam_i, my_coordinate, variants) for bam_i in range(len(self.bam_files)) ]
+            self.queue.append( ( (tuple(my_coordinate), tuple(variants)), futures ) )
+
+
+    def extract(self, bam_i, my_coordinate, variants):
+
+        # pysam handles cannot be shared between threads:
+        handles = getattr(self.local, 'handles', None)
+
+        if handles is None:
+            handles = [ pysam.AlignmentFile(bam_file, reference_filename=self.ref_fa) for bam_file in self.bam_files ]
+
+            if not self.per_site_fetch:
+                handles = [ PileupSweeper(bam) for bam in handles ]
 
-    return vars()
+            self.local.handles = handles
+            with self.lock:
+                self.handles.extend( handles )
 
+        return from_bam_multiallelic(handles[bam_i], my_coordinate, variants, self.min_mq, self.min_bq, self.skipped[bam_i])
+
+
+    def get(self, my_coordinate, variants):
+
+        key = ( tuple(my_coordinate), tuple(variants) )
+        ranked_coordinate = ( self.chrom_seq[my_coordinate[0]], my_coordinate[1] )
+
+        while self.queue:
+
+            key_i, futures = self.queue[0]
+
+            # Should not happen, but if the prefetched sites have gone past this one, extract it here and now:
+            if ( self.chrom_seq[key_i[0][0]], key_i[0][1] ) > ranked_coordinate:
+                break
+
+            self.queue.popleft()
+            self.fill()
+
+            if key_i == key:
+                return [ future_i.result() for future_i in futures ]
+
+            # This site was skipped:
+            for future_i in futures:
+                future_i.cancel()
+
+        return [ self.extract(bam_i, my_coordinate, variants) for bam_i in range(len(self.bam_files)) ]
+
+
+    def close(self):
+
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+        for handle_i in self.handles:
+            handle_i.close()
+
+
+
+def variants_by_coordinate(vcf_file):
+    '''
+    For each coordinate of a sorted VCF file, yields ( (contig, position), [(ref_base, first_alt), ...] ), where the lines at the same coordinate and their comma-separated ALT's are grouped in the same way vcf2tsv groups them.
+    '''
+
+    with genome.open_textfile(vcf_file) as vcf:
+
+        line_i = vcf.readline().rstrip()
+        while line_i.startswith('#') or line_i.startswith('track='):
+            line_i = vcf.readline().rstrip()
+
+        coordinate_i = None
+        variants     = []
+
+        while line_i:
+
+            vcf_i = genome.Vcf_line( line_i )
+
+            if (vcf_i.chromosome, vcf_i.position) != coordinate_i:
+                if variants:
+                    yield coordinate_i, variants
+
+                coordinate_i = (vcf_i.chromosome, vcf_i.position)
+                variants     = []
+
+            for alt_i in vcf_i.altbase.split(','):
+                variants.append( (vcf_i.refbase, alt_i) )
+
+            line_i = vcf.readline().rstrip()
+
+        if variants:
+            yield coordinate_i, variants
 
 
 
@@ -255,6 +584,64 @@ def from_genome_reference(ref_fa, my_coordinate, ref_base, first_alt):
 
 
 
+def junction_homopolymer(left_base, left_run, allele, right_base, right_run):
+    '''
+    Longest homopolymer in (left_base * left_run) + allele + (right_base * right_run) that involves the allele.
+    '''
+
+    if len(allele) == 1:
+        return 1 + (left_run if allele == left_base else 0) + (right_run if allele == right_base else 0)
+
+    if not allele:
+        return left_run + right_run if left_base == right_base else max(left_run, right_run)
+
+    counts = genome.count_repeating_bases(allele)
+
+    if allele[0] == left_base:
+        counts[0] += left_run
+
+    if allele[-1] == right_base:
+        counts[-1] += right_run
+
+    return max(counts)
+
+
+
+def from_reference_cache(ref_cache, my_coordinate, ref_base, first_alt):
+
+    '''
+    Same as from_genome_reference, but with array lookups in genomicFileHandler.reference_cache.ReferenceCache instead of sequence strings.
+    '''
+
+    contig_i = ref_cache.contig(my_coordinate[0])
+    position = my_coordinate[1]
+
+    # lseq is [left_start, left_end), and rseq is [right_start, right_end), clipped like in from_genome_reference
+    left_start  = min( max(0, position-20), contig_i.length )
+    left_end    = min( position,    contig_i.length )
+    right_start = min( position+1,  contig_i.length )
+    right_end   = min( position+21, contig_i.length )
+
+    # Longest homopolymer within lseq and within rseq, and the ones next to the variant site, i.e., at the end of lseq and the beginning of rseq:
+    left_longest, left_run = contig_i.homopolymers(left_start, left_end)
+    right_longest         = contig_i.homopolymers(right_start, right_end)[0]
+    right_run             = min( contig_i.right_run[right_start], right_end-right_start ) if right_end > right_start else 0
+
+    left_base  = contig_i.base(left_end-1) if left_run  else None
+    right_base = contig_i.base(right_start) if right_run else None
+
+    homopolymer_length = max( left_longest, right_longest, junction_homopolymer(left_base, left_run, ref_base, right_base, right_run), junction_homopolymer(left_base, left_run, first_alt, right_base, right_run) )
+
+    # Homopolymer spanning the variant site:
+    ref_c = (left_run if left_base == ref_base else 0)  + (right_run if right_base == ref_base else 0)
+    alt_c = (left_run if left_base == first_alt else 0) + (right_run if right_base == first_alt else 0)
+
+    site_homopolymer_length = max( alt_c+1, ref_c+1 )
+
+    return homopolymer_length, site_homopolymer_length
+
+
+
 
 
 def somaticOddRatio(n_ref, n_alt, t_ref, t_alt, max_value=100):
@@ -2,7 +2,7 @@
 
 # single-sample only
 
-import sys, argparse, math, gzip, os, pysam, re, logging
+import sys, argparse, math, gzip, os, pysam, re, logging, contextlib
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
@@ -10,11 +10,16 @@ sys.path.append( PRE_DIR )
 
 import scipy.stats as stats
 from copy import copy
+from functools import partial
 
 from genomicFileHandler.read_info_extractor import *
 import genomicFileHandler.genomic_file_handlers as genome
+import genomicFileHandler.reference_cache as reference_cache
 import somaticseq.annotate_caller as annotate_caller
 import somaticseq.sequencing_features as sequencing_features
+import somaticseq.annotation_index as annotation_index
+import somaticseq.parallel_vcf2tsv as parallel_vcf2tsv
+import somaticseq.ada_predictor as ada_predictor
 
 ch = logging.StreamHandler()
 ch.setLevel(logging.DEBUG)
@@ -103,8 +108,8 @@ def run():
     parser.add_argument('-bam', '--in-bam',              type=str,   help='Tumor tBAM File',    required=True, default=None)
 
     parser.add_argument('-truth',     '--ground-truth-vcf',       type=str,   help='VCF of true hits',  required=False, default=None)
-    parser.add_argument('-dbsnp',     '--dbsnp-vcf',              type=str,   help='dbSNP VCF: do not use if input VCF is annotated', required=False, default=None)
-    parser.add_argument('-cosmic',    '--cosmic-vcf',             type=str,   help='COSMIC VCF: do not use if input VCF is annotated',   required=False, default=None)
+    parser.add_argument('-dbsnp',     '--dbsnp-vcf',              type=str,   help='dbSNP VCF, or its index from annotation_index.py: do not use if input VCF is annotated', required=False, default=None)
+    parser.add_argument('-cosmic',    '--cosmic-vcf',             type=str,   help='COSMIC VCF, or its index from annotation_index.py: do not use if input VCF is annotated',   required=False, default=None)
 
     parser.add_argument('-mutect',  '--mutect-vcf',               type=str,   help='MuTect VCF',        required=False, default=None)
     parser.add_argument('-varscan', '--varscan-vcf',              type=str,   help='VarScan2 VCF',      required=False, default=None)
@@ -115,6 +120,12 @@ def run():
 
     parser.add_argument('-ref',     '--genome-reference',         type=str,   help='.fasta.fai file to get the contigs', required=True, default=None)
     parser.add_argument('-dedup',   '--deduplicate',     action='store_true', help='Do not consider duplicate reads from tBAM files. Default is to count everything', required=False, default=False)
+    parser.add_argument('-persite', '--per-site-fetch',  action='store_true', help='Fetch reads from the BAM file site by site instead of sweeping through it once. Slower, but kept to compare outputs', required=False, default=False)
+    parser.add_argument('-iothreads', '--io-threads',       type=int,   help='Number of threads to read the BAM file with, i.e., a few sites ahead. 0 to read it in the main thread', required=False, default=0)
+    parser.add_argument('-prefetch',  '--prefetch-sites',   type=int,   help='With I/O threads, extract BAM features up to this many sites ahead', required=False, default=64)
+    parser.add_argument('-refcache',  '--reference-cache',  type=str,   help='Reference cache built by genomicFileHandler/reference_cache.py, to get homopolymer lengths from a memory-mapped file', required=False, default=None)
+    parser.add_argument('-threads',   '--threads',          type=int,   help='Number of processes to work on blocks of sites of the input VCF file in parallel', required=False, default=1)
+    parser.add_argument('-features',  '--feature-manifest', type=str,   help='Classifier from ada_model_exporter.R or ada_trainer.py, or a text file of column names, one per line. The rank sum tests, Fisher exact tests, and homopolymer lengths of the other columns are skipped and written as nan', required=False, default=None)
 
     parser.add_argument('-minMQ',     '--minimum-mapping-quality',type=float, help='Minimum mapping quality below which is considered poor', required=False, default=1)
     parser.add_argument('-minBQ',     '--minimum-base-quality',   type=float, help='Minimum base quality below which is considered poor', required=False, default=5)
@@ -132,7 +143,72 @@ def run():
 
 
 
-def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosmic=None, dbsnp=None, mutect=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, dedup=True, min_mq=1, min_bq=5, min_caller=0, ref_fa=None, p_scale=None, outfile=None):
+def open_shared_inputs(bam_fn, ref_fa, ref_cache, dbsnp=None, cosmic=None):
+    '''
+    The inputs that do not depend on the sites, opened once to be used by any number of vcf2tsv runs, e.g., all the chunks of a worker process of somaticseq_parallel.py.
+    Returns {'bam', 'ref_fa', 'ref_cache', 'annotation_indices'}, where bam is None if bam_fn is None.
+    '''
+
+    bam      = pysam.AlignmentFile(bam_fn, reference_filename=ref_fa) if bam_fn else None
+
+    fai_file = ref_fa + '.fai'
+    ref_fa   = pysam.FastaFile(ref_fa)
+
+    # Homopolymer lengths from the memory-mapped reference cache rather than the fasta file:
+    if ref_cache:
+        ref_cache = reference_cache.ReferenceCache(ref_cache)
+        ref_cache.check(fai_file)
+
+    # dbSNP and COSMIC given as prebuilt indices are looked up by binary search instead of being read with the other VCF files:
+    annotation_indices = { name_i:annotation_index.AnnotationIndex(file_i) for name_i, file_i in (('dbsnp', dbsnp), ('cosmic', cosmic)) if annotation_index.is_annotation_index(file_i) }
+
+    return {'bam': bam, 'ref_fa': ref_fa, 'ref_cache': ref_cache, 'annotation_indices': annotation_indices}
+
+
+
+def close_shared_inputs(shared_inputs):
+
+    for name_i in ('bam', 'ref_fa', 'ref_cache'):
+        if shared_inputs[name_i]:
+            shared_inputs[name_i].close()
+
+
+
+def open_inputs(bam_fn, ref_fa, ref_cache, per_site_fetch, chrom_seq, vcf_files, shared_inputs=None, open_bam=True):
+    '''
+    Returns the opened (bam, ref_fa, ref_cache, vcf_multiplexer, annotation_indices), with the ones in shared_inputs if given.
+    Without open_bam, i.e., when the BAM file is read by a BamFeaturePrefetcher instead, bam is None unless it is in shared_inputs.
+    '''
+
+    if not shared_inputs:
+        shared_inputs = open_shared_inputs(bam_fn if open_bam else None, ref_fa, ref_cache, vcf_files['dbsnp'], vcf_files['cosmic'])
+
+    bam                = shared_inputs['bam']
+    annotation_indices = shared_inputs['annotation_indices']
+
+    # The sites are sorted, so sweep through the BAM file once rather than fetching reads site by site:
+    if not per_site_fetch and bam:
+        bam = sequencing_features.PileupSweeper(bam)
+
+    # All the caller VCF files, truth, dbSNP, and COSMIC are read together, so for each coordinate, one call gets the variants of every file:
+    vcf_multiplexer = genome.VcfMultiplexer( {name_i:file_i for name_i, file_i in vcf_files.items() if file_i and name_i not in annotation_indices}, chrom_seq )
+
+    return bam, shared_inputs['ref_fa'], shared_inputs['ref_cache'], vcf_multiplexer, annotation_indices
+
+
+
+def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosmic=None, dbsnp=None, mutect=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, dedup=True, min_mq=1, min_bq=5, min_caller=0, ref_fa=None, p_scale=None, outfile=None, per_site_fetch=False, io_threads=0, prefetch_sites=64, ref_cache=None, threads=1, inputs=None, shared_inputs=None, features=None):
+
+    '''
+    threads > 1 works on blocks of sites of the input VCF file in that many processes.
+    inputs are what open_inputs returns, already opened and left open, e.g., by the worker processes of threads.
+    shared_inputs are what open_shared_inputs returns, also left open.
+    outfile can also be an opened file.
+    features are the columns needed, e.g., by a classifier, from ada_predictor.feature_manifest. The expensive ones not among them are nan. None for all of them, e.g., to train on.
+    '''
+
+    # Every parameter, for the worker processes of threads:
+    parameters = dict( locals() )
 
     # Convert contig_sequence to chrom_seq dict:
     fai_file  = ref_fa + '.fai'
@@ -167,59 +243,36 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
     pattern_chr_position = genome.pattern_chr_position
 
 
-    ## Running
-    with genome.open_textfile(mysites) as my_sites, open(outfile, 'w') as outhandle:
-
-        my_line = my_sites.readline().rstrip()
-
-        bam    = pysam.AlignmentFile(bam_fn, reference_filename=ref_fa)
-        ref_fa = pysam.FastaFile(ref_fa)
-
-        if truth:
-            truth = genome.open_textfile(truth)
-            truth_line = genome.skip_vcf_header( truth )
-
-        if cosmic:
-            cosmic = genome.open_textfile(cosmic)
-            cosmic_line = genome.skip_vcf_header( cosmic )
-
-        if dbsnp:
-            dbsnp = genome.open_textfile(dbsnp)
-            dbsnp_line = genome.skip_vcf_header( dbsnp )
-
-        # 6 Incorporate callers: get thru the #'s
-        if mutect:
-            mutect = genome.open_textfile(mutect)
-            mutect_line = genome.skip_vcf_header( mutect )
+    # Features not needed by anyone are not worked out:
+    tSkipped = sequencing_features.skipped_features(features, 'tBAM_')
+    need_homopolymers = features is None or 'MaxHomopolymer_Length' in features or 'SiteHomopolymer_Length' in features
 
-        if varscan:
-            varscan = genome.open_textfile(varscan)
-            varscan_line = genome.skip_vcf_header( varscan )
+    vcf_files = {'truth': truth, 'cosmic': cosmic, 'dbsnp': dbsnp, 'mutect': mutect, 'varscan': varscan, 'vardict': vardict, 'lofreq': lofreq, 'scalpel': scalpel, 'strelka': strelka}
 
-        if vardict:
-            vardict = genome.open_textfile(vardict)
-            vardict_line = genome.skip_vcf_header( vardict )
+    if threads > 1 and is_vcf:
+        # The BAM file is already read by that many processes:
+        parameters.update( threads=1, io_threads=0, shared_inputs=None )
+        return parallel_vcf2tsv.vcf2tsv_in_blocks( partial(vcf2tsv, **parameters), partial(open_inputs, bam_fn, ref_fa, ref_cache, per_site_fetch, chrom_seq, vcf_files), is_vcf, chrom_seq, outfile, threads, out_header.replace('{','').replace('}','') + '\n' )
 
-        if lofreq:
-            lofreq = genome.open_textfile(lofreq)
-            lofreq_line = genome.skip_vcf_header( lofreq )
+    ## Running
+    with genome.open_textfile(mysites) as my_sites, ( contextlib.nullcontext(outfile) if hasattr(outfile, 'write') else open(outfile, 'w') ) as outhandle:
 
-        if scalpel:
-            scalpel = genome.open_textfile(scalpel)
-            scalpel_line = genome.skip_vcf_header( scalpel )
+        my_line = my_sites.readline().rstrip()
 
-        if strelka:
-            strelka = genome.open_textfile(strelka)
-            strelka_line = genome.skip_vcf_header( strelka )
+        # Read the BAM file in I/O threads, ahead of the sites being worked on:
+        if io_threads > 0 and is_vcf:
+            bam_prefetcher = sequencing_features.BamFeaturePrefetcher((bam_fn,), sequencing_features.variants_by_coordinate(is_vcf), chrom_seq, ref_fa, min_mq, min_bq, io_threads, prefetch_sites, per_site_fetch, (tSkipped,))
+        else:
+            bam_prefetcher = None
 
+        bam, ref_fa, ref_cache, vcf_multiplexer, annotation_indices = inputs if inputs else open_inputs(bam_fn, ref_fa, ref_cache, per_site_fetch, chrom_seq, vcf_files, shared_inputs, open_bam=not bam_prefetcher)
 
         # Get through all the headers:
         while my_line.startswith('#') or my_line.startswith('track='):
             my_line = my_sites.readline().rstrip()
 
         # First coordinate, for later purpose of making sure the input is sorted properly
-        coordinate_i = re.match( genome.pattern_chr_position, my_line )
-        coordinate_i = coordinate_i.group() if coordinate_i else ''
+        coordinate_i = genome.line_coordinate_key( my_line, chrom_seq ) if is_vcf else None
 
         # First line:
         outhandle.write( out_header.replace('{','').replace('}','')  + '\n' )
@@ -248,10 +301,9 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
                     my_vcf = genome.Vcf_line( my_line )
 
                     ########## This block is code is to ensure the input VCF file is properly sorted ##
-                    coordinate_j = re.match( genome.pattern_chr_position, my_line )
-                    coordinate_j = coordinate_j.group() if coordinate_j else ''
+                    coordinate_j = genome.line_coordinate_key( my_line, chrom_seq )
 
-                    if genome.whoisbehind(coordinate_i, coordinate_j, chrom_seq) == 1:
+                    if coordinate_i > coordinate_j:
                         raise Exception( '{} does not seem to be properly sorted.'.format(mysites) )
 
                     coordinate_i = coordinate_j
@@ -326,15 +378,10 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
                 num_callers = 0
 
                 #################################### Find the same coordinate in those VCF files ####################################
-                if mutect:   got_mutect,  mutect_variants,  mutect_line  = genome.find_vcf_at_coordinate(my_coordinate, mutect_line,  mutect,  chrom_seq)
-                if varscan:  got_varscan, varscan_variants, varscan_line = genome.find_vcf_at_coordinate(my_coordinate, varscan_line, varscan, chrom_seq)
-                if vardict:  got_vardict, vardict_variants, vardict_line = genome.find_vcf_at_coordinate(my_coordinate, vardict_line, vardict, chrom_seq)
-                if lofreq:   got_lofreq,  lofreq_variants,  lofreq_line  = genome.find_vcf_at_coordinate(my_coordinate, lofreq_line,  lofreq,  chrom_seq)
-                if scalpel:  got_scalpel, scalpel_variants, scalpel_line = genome.find_vcf_at_coordinate(my_coordinate, scalpel_line, scalpel, chrom_seq)
-                if strelka:  got_strelka, strelka_variants, strelka_line = genome.find_vcf_at_coordinate(my_coordinate, strelka_line, strelka, chrom_seq)
-                if truth:    got_truth,   truth_variants,   truth_line   = genome.find_vcf_at_coordinate(my_coordinate, truth_line,   truth,   chrom_seq)
-                if dbsnp:    got_dbsnp,   dbsnp_variants,   dbsnp_line   = genome.find_vcf_at_coordinate(my_coordinate, dbsnp_line,   dbsnp,   chrom_seq)
-                if cosmic:   got_cosmic,  cosmic_variants,  cosmic_line  = genome.find_vcf_at_coordinate(my_coordinate, cosmic_line,  cosmic,  chrom_seq)
+                variants_at_coordinate = vcf_multiplexer.variants_at(my_coordinate)
+
+                # The BAM features of all the variants at this coordinate are extracted together the first time they are needed:
+                tBamFeatures_at_coordinate = None
 
                 # Now, use pysam to look into the tBAM file(s), variant by variant from the input:
                 for ith_call, my_call in enumerate( variants_at_my_coordinate ):
@@ -354,42 +401,42 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
 
                     #################### Collect Caller Vcf ####################:
                     if mutect:
-                        mutect_classification, tlod, ecnt = annotate_caller.ssMuTect(variant_id, mutect_variants)
+                        mutect_classification, tlod, ecnt = annotate_caller.ssMuTect(variant_id, variants_at_coordinate['mutect'])
                         num_callers += mutect_classification
                     else:
                         mutect_classification = tlod = ecnt = nan
 
 
                     if varscan:
-                        varscan_classification, score_varscan2 = annotate_caller.ssVarScan(variant_id, varscan_variants)
+                        varscan_classification, score_varscan2 = annotate_caller.ssVarScan(variant_id, variants_at_coordinate['varscan'])
                         num_callers += varscan_classification
                     else:
                         varscan_classification = score_varscan2 = nan
 
 
                     if vardict:
-                        vardict_classification, msi, msilen, shift3, t_pmean, t_pstd, t_qstd = annotate_caller.ssVarDict(variant_id, vardict_variants)
+                        vardict_classification, msi, msilen, shift3, t_pmean, t_pstd, t_qstd = annotate_caller.ssVarDict(variant_id, variants_at_coordinate['vardict'])
                         num_callers += vardict_classification
                     else:
                         vardict_classification = msi = msilen = shift3 = t_pmean = t_pstd = t_qstd = nan
 
 
                     if lofreq:
-                        lofreq_classification = annotate_caller.ssLoFreq(variant_id, lofreq_variants)
+                        lofreq_classification = annotate_caller.ssLoFreq(variant_id, variants_at_coordinate['lofreq'])
                         num_callers += lofreq_classification
                     else:
                         lofreq_classification = nan
 
 
                     if scalpel:
-                        scalpel_classification = annotate_caller.ssScalpel(variant_id, scalpel_variants)
+                        scalpel_classification = annotate_caller.ssScalpel(variant_id, variants_at_coordinate['scalpel'])
                         num_callers += scalpel_classification
                     else:
                         scalpel_classification = nan
 
 
                     if strelka:
-                        strelka_classification = annotate_caller.ssStrelka(variant_id, strelka_variants)
+                        strelka_classification = annotate_caller.ssStrelka(variant_id, variants_at_coordinate['strelka'])
                         num_callers += strelka_classification
                     else:
                         strelka_classification = nan
@@ -400,7 +447,7 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
 
                         ########## Ground truth file ##########
                         if truth:
-                            if variant_id in truth_variants.keys():
+                            if variant_id in variants_at_coordinate['truth'].keys():
                                 judgement = 1
                                 my_identifiers.add('TruePositive')
                             else:
@@ -412,24 +459,43 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
 
                         ########## dbSNP ########## Will overwrite dbSNP info from input VCF file
                         if dbsnp:
-                            if_dbsnp, if_common, rsID = annotate_caller.dbSNP(variant_id, dbsnp_variants)
+                            if 'dbsnp' in annotation_indices:
+                                if_dbsnp, if_common, rsID = annotation_indices['dbsnp'].dbSNP(variant_id)
+                            else:
+                                if_dbsnp, if_common, rsID = annotate_caller.dbSNP(variant_id, variants_at_coordinate['dbsnp'])
                             for ID_i in rsID:
                                 my_identifiers.add( ID_i )
 
 
                         ########## COSMIC ########## Will overwrite COSMIC info from input VCF file
                         if cosmic:
-                            if_cosmic, num_cases, cosmicID = annotate_caller.COSMIC(variant_id, cosmic_variants)
+                            if 'cosmic' in annotation_indices:
+                                if_cosmic, num_cases, cosmicID = annotation_indices['cosmic'].COSMIC(variant_id)
+                            else:
+                                if_cosmic, num_cases, cosmicID = annotate_caller.COSMIC(variant_id, variants_at_coordinate['cosmic'])
                             for ID_i in cosmicID:
                                 my_identifiers.add( ID_i )
 
 
                         ########## ######### INFO EXTRACTION FROM BAM FILES ########## #########
                         # Tumor tBAM file:
-                        tBamFeatures = sequencing_features.from_bam(bam, my_coordinate, ref_base, first_alt, min_mq, min_bq)
+                        if tBamFeatures_at_coordinate is None:
+                            variants_for_bam = list( zip(ref_bases, alt_bases) ) if is_vcf else [ (ref_base, first_alt) ]
+
+                            if bam_prefetcher:
+                                tBamFeatures_at_coordinate, = bam_prefetcher.get(my_coordinate, variants_for_bam)
+                            else:
+                                tBamFeatures_at_coordinate = sequencing_features.from_bam_multiallelic(bam, my_coordinate, variants_for_bam, min_mq, min_bq, tSkipped)
+
+                        tBamFeatures = tBamFeatures_at_coordinate[ith_call]
 
                         # Homopolymer eval:
-                        homopolymer_length, site_homopolymer_length = sequencing_features.from_genome_reference(ref_fa, my_coordinate, ref_base, first_alt)
+                        if not need_homopolymers:
+                            homopolymer_length = site_homopolymer_length = nan
+                        elif ref_cache:
+                            homopolymer_length, site_homopolymer_length = sequencing_features.from_reference_cache(ref_cache, my_coordinate, ref_base, first_alt)
+                        else:
+                            homopolymer_length, site_homopolymer_length = sequencing_features.from_genome_reference(ref_fa, my_coordinate, ref_base, first_alt)
 
                         # Fill the ID field of the TSV/VCF
                         my_identifiers = ';'.join(my_identifiers) if my_identifiers else '.'
@@ -505,7 +571,13 @@ def vcf2tsv(is_vcf=None, is_bed=None, is_pos=None, bam_fn=None, truth=None, cosm
                 my_line = my_sites.readline().rstrip()
 
         ##########  Close all open files if they were opened  ##########
-        opened_files = (ref_fa, bam, truth, cosmic, dbsnp, mutect, varscan, vardict, lofreq, scalpel, strelka)
+        if inputs:
+            opened_files = (bam_prefetcher,)
+        elif shared_inputs:
+            opened_files = (bam_prefetcher, vcf_multiplexer)
+        else:
+            opened_files = (bam_prefetcher, ref_fa, ref_cache, bam, vcf_multiplexer)
+
         [opened_file.close() for opened_file in opened_files if opened_file]
 
 
@@ -531,4 +603,10 @@ if __name__ == '__main__':
             min_caller = runParameters['minimum_num_callers'], \
             ref_fa     = runParameters['genome_reference'], \
             p_scale    = runParameters['p_scale'], \
-            outfile    = runParameters['output_tsv_file'])
+            outfile    = runParameters['output_tsv_file'], \
+            per_site_fetch = runParameters['per_site_fetch'], \
+            io_threads     = runParameters['io_threads'], \
+            prefetch_sites = runParameters['prefetch_sites'], \
+            ref_cache      = runParameters['reference_cache'], \
+            threads        = runParameters['threads'], \
+            features       = ada_predictor.feature_manifest(runParameters['feature_manifest']) if runParameters['feature_manifest'] else None )
@@ -1,46 +1,163 @@
 #!/usr/bin/env python3
 
-import sys, os, argparse, shutil, math, re, subprocess
+import sys, os, argparse, shutil, math, re, subprocess, time
 from multiprocessing import Pool
 from functools import partial
 from shutil import rmtree
 
 import somaticseq.run_somaticseq as run_somaticseq
+
+# Imported by runPaired/runSingle at every call, so they are imported here, once, for the worker processes to start with, scipy.stats and all:
+import somaticseq.somatic_vcf2tsv as somatic_vcf2tsv
+import somaticseq.single_sample_vcf2tsv as single_sample_vcf2tsv
+import somaticseq.SSeq_tsv2vcf as tsv2vcf
+import somaticseq.ada_predictor as ada_predictor
+import somaticseq.combine_callers as combineCallers
+import vcfModifier.shardVcf as shardVcf
 import utilities.split_Bed_into_equal_regions as split_bed
+import utilities.split_Bed_by_candidates as split_bed_by_candidates
 import genomicFileHandler.concat as concat
+import genomicFileHandler.genomic_file_handlers as genome
+import genomicFileHandler.reference_cache as reference_cache
+
+# Callers' arguments of runPaired/runSingle, and their keys in run_somaticseq's runParameters
+PAIRED_CALLERS = {'mutect': 'mutect_vcf', 'indelocator': 'indelocator_vcf', 'mutect2': 'mutect2_vcf', 'varscan_snv': 'varscan_snv', 'varscan_indel': 'varscan_indel', 'jsm': 'jsm_vcf', 'sniper': 'somaticsniper_vcf', 'vardict': 'vardict_vcf', 'muse': 'muse_vcf', 'lofreq_snv': 'lofreq_snv', 'lofreq_indel': 'lofreq_indel', 'scalpel': 'scalpel_vcf', 'strelka_snv': 'strelka_snv', 'strelka_indel': 'strelka_indel', 'tnscope': 'tnscope_vcf', 'platypus': 'platypus_vcf'}
+SINGLE_CALLERS = {'mutect': 'mutect_vcf', 'mutect2': 'mutect2_vcf', 'varscan': 'varscan_vcf', 'vardict': 'vardict_vcf', 'lofreq': 'lofreq_vcf', 'scalpel': 'scalpel_vcf', 'strelka': 'strelka_vcf'}
+
+# Inputs opened by a worker process, and kept open for all of its chunks
+worker = {}
+
 
-def splitRegions(nthreads, outfiles, bed=None, fai=None):
+def splitRegions(nthreads, outfiles, bed=None, fai=None, caller_vcfs=(), bam_files=()):
+
+    '''
+    With the candidate VCF files, the regions are split to give each chunk about the same number of candidates, weighted by the read depth from the index statistics of bam_files.
+    Otherwise, about the same number of base pairs.
+    '''
 
     assert bed or fai
     if fai and not bed:
         bed = split_bed.fai2bed(fai, outfiles)
 
-    writtenBeds = split_bed.split(bed, outfiles, nthreads)
+    if caller_vcfs:
+        writtenBeds = split_bed_by_candidates.split(bed, outfiles, nthreads, caller_vcfs, bam_files, fai)
+    else:
+        writtenBeds = split_bed.split(bed, outfiles, nthreads)
 
     return writtenBeds
 
 
 
 
-def runPaired_by_region(inclusion, outdir=None, ref=None, tbam=None, nbam=None, tumor_name='TUMOR', normal_name='NORMAL', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, exclusion=None, mutect=None, indelocator=None, mutect2=None, varscan_snv=None, varscan_indel=None, jsm=None, sniper=None, vardict=None, muse=None, lofreq_snv=None, lofreq_indel=None, scalpel=None, strelka_snv=None, strelka_indel=None, tnscope=None, platypus=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False):
+def shardInputs(bed_splitted, outdir, vcf_files):
+
+    '''
+    vcf_files is {name: VCF file}. Each of them is split into the sub-directories of the chunks, by the regions of their BED files.
+    Returns {name: VCF file} of each chunk. Tabix-indexed VCF files are not split, because each chunk reads only its own regions of them anyway.
+    '''
+
+    region_shards = shardVcf.RegionShards(bed_splitted)
+
+    subdirs = [ outdir + os.sep + bed_i.split(os.sep)[-1].split('.')[0] for bed_i in bed_splitted ]
+    for dir_i in subdirs:
+        os.makedirs(dir_i, exist_ok=True)
+
+    sharded = [ {} for bed_i in bed_splitted ]
+
+    for name_i, vcf_i in vcf_files.items():
+
+        if genome.tabix_index_of(vcf_i):
+            for shard_j in sharded:
+                shard_j[name_i] = vcf_i
+
+        else:
+            outfiles = shardVcf.shard(vcf_i, region_shards, [ '{}{}shard.{}.vcf'.format(dir_j, os.sep, name_i) for dir_j in subdirs ])
+            for shard_j, outfile_j in zip(sharded, outfiles):
+                shard_j[name_i] = outfile_j
+
+    return sharded
+
+
+
+def init_worker(open_shared_inputs):
+    '''open_shared_inputs is the open_shared_inputs of somatic_vcf2tsv or single_sample_vcf2tsv, with all of its arguments'''
+
+    worker['open_shared_inputs'] = open_shared_inputs
+    worker['shared_inputs']      = None
+
+
+
+def runChunk(indexed_arguments, run_by_region):
+
+    i, shard_arguments = indexed_arguments
+
+    start_time = time.time()
+
+    # The BAM files with their indices, the reference, and the annotation indices are opened by the first chunk of each worker, and kept open for the rest.
+    # Opened here rather than in init_worker, so that errors come back to the main process instead of killing the worker:
+    if worker['shared_inputs'] is None:
+        worker['shared_inputs'] = worker['open_shared_inputs']()
+
+    subdir_i = run_by_region(shared_inputs=worker['shared_inputs'], **shard_arguments)
+
+    return i, subdir_i, time.time() - start_time
+
+
+
+def runChunks(pool, run_by_region, shard_arguments, costs):
+
+    '''
+    The chunks are handed out one at a time to whichever worker is free, the ones of the most estimated work first, so that no big chunk is left to run alone at the end.
+    Returns the sub-directories in the order of shard_arguments, i.e., the genomic order, whatever order they finish in.
+    The pool is closed and joined when the chunks are done, or terminated if one of them fails.
+    '''
+
+    chunk_order = sorted( range(len(shard_arguments)), key=lambda i: -costs[i] )
+
+    subdirs = [None] * len(shard_arguments)
+    seconds = [0]    * len(shard_arguments)
+
+    # The workers keep their BAM, FASTA, reference cache, and annotation index handles open until they exit, so the pool is closed here, before the merges and the training:
+    try:
+        for i, subdir_i, seconds_i in pool.imap_unordered( partial(runChunk, run_by_region=run_by_region), [ (i, shard_arguments[i]) for i in chunk_order ] ):
+            subdirs[i] = subdir_i
+            seconds[i] = seconds_i
+            run_somaticseq.logger.info( 'Chunk {} ({}) done in {:.1f} seconds, estimated cost {:.0f}'.format(i+1, shard_arguments[i]['inclusion'], seconds[i], costs[i]) )
+
+        pool.close()
+
+    except BaseException:
+        pool.terminate()
+        raise
+
+    finally:
+        pool.join()
+
+    run_somaticseq.logger.info( '{} chunks: slowest {:.1f} seconds, fastest {:.1f} seconds, total {:.1f} seconds'.format(len(seconds), max(seconds), min(seconds), sum(seconds)) )
+
+    return subdirs
+
+
+
+def runPaired_by_region(inclusion, outdir=None, ref=None, tbam=None, nbam=None, tumor_name='TUMOR', normal_name='NORMAL', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, exclusion=None, mutect=None, indelocator=None, mutect2=None, varscan_snv=None, varscan_indel=None, jsm=None, sniper=None, vardict=None, muse=None, lofreq_snv=None, lofreq_indel=None, scalpel=None, strelka_snv=None, strelka_indel=None, tnscope=None, platypus=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False, ref_cache=None, combined=None, shared_inputs=None, write_tsv=False):
 
     basename   = inclusion.split(os.sep)[-1].split('.')[0]
     outdir_i   = outdir + os.sep + basename
     os.makedirs(outdir_i, exist_ok=True)
 
-    run_somaticseq.runPaired(outdir_i, ref, tbam, nbam, tumor_name, normal_name, truth_snv, truth_indel, classifier_snv, classifier_indel, pass_threshold, lowqual_threshold, hom_threshold, het_threshold, dbsnp, cosmic, inclusion, exclusion, mutect, indelocator, mutect2, varscan_snv, varscan_indel, jsm, sniper, vardict, muse, lofreq_snv, lofreq_indel, scalpel, strelka_snv, strelka_indel, tnscope, platypus, min_mq, min_bq, min_caller, somaticseq_train, ensembleOutPrefix, consensusOutPrefix, classifiedOutPrefix, keep_intermediates)
+    run_somaticseq.runPaired(outdir_i, ref, tbam, nbam, tumor_name, normal_name, truth_snv, truth_indel, classifier_snv, classifier_indel, pass_threshold, lowqual_threshold, hom_threshold, het_threshold, dbsnp, cosmic, inclusion, exclusion, mutect, indelocator, mutect2, varscan_snv, varscan_indel, jsm, sniper, vardict, muse, lofreq_snv, lofreq_indel, scalpel, strelka_snv, strelka_indel, tnscope, platypus, min_mq, min_bq, min_caller, somaticseq_train, ensembleOutPrefix, consensusOutPrefix, classifiedOutPrefix, keep_intermediates, ref_cache, combined, shared_inputs, write_tsv)
 
     return outdir_i
 
 
 
-def runSingle_by_region(inclusion, outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, exclusion=None, mutect=None, mutect2=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False):
+def runSingle_by_region(inclusion, outdir, ref, bam, sample_name='TUMOR', truth_snv=None, truth_indel=None, classifier_snv=None, classifier_indel=None, pass_threshold=0.5, lowqual_threshold=0.1, hom_threshold=0.85, het_threshold=0.01, dbsnp=None, cosmic=None, exclusion=None, mutect=None, mutect2=None, varscan=None, vardict=None, lofreq=None, scalpel=None, strelka=None, min_mq=1, min_bq=5, min_caller=0.5, somaticseq_train=False, ensembleOutPrefix='Ensemble.', consensusOutPrefix='Consensus.', classifiedOutPrefix='SSeq.Classified.', keep_intermediates=False, ref_cache=None, combined=None, shared_inputs=None, write_tsv=False):
 
     basename   = inclusion.split(os.sep)[-1].split('.')[0]
     outdir_i   = outdir + os.sep + basename
     os.makedirs(outdir_i, exist_ok=True)
 
-    run_somaticseq.runSingle(outdir_i, ref, bam, sample_name, truth_snv, truth_indel, classifier_snv, classifier_indel, pass_threshold, lowqual_threshold, hom_threshold, het_threshold, dbsnp, cosmic, inclusion, exclusion, mutect, mutect2, varscan, vardict, lofreq, scalpel, strelka, min_mq, min_bq, min_caller, somaticseq_train, ensembleOutPrefix, consensusOutPrefix, classifiedOutPrefix, keep_intermediates)
+    run_somaticseq.runSingle(outdir_i, ref, bam, sample_name, truth_snv, truth_indel, classifier_snv, classifier_indel, pass_threshold, lowqual_threshold, hom_threshold, het_threshold, dbsnp, cosmic, inclusion, exclusion, mutect, mutect2, varscan, vardict, lofreq, scalpel, strelka, min_mq, min_bq, min_caller, somaticseq_train, ensembleOutPrefix, consensusOutPrefix, classifiedOutPrefix, keep_intermediates, ref_cache, combined, shared_inputs, write_tsv)
 
     return outdir_i
 
@@ -62,12 +179,49 @@ if __name__ == '__main__':
 
     os.makedirs(runParameters['output_directory'], exist_ok=True)
 
-    bed_splitted = splitRegions(runParameters['threads'], runParameters['output_directory']+os.sep+'th.input.bed', runParameters['inclusion_region'], runParameters['genome_reference']+'.fai')
+    if runParameters['which'] == 'paired':
+        caller_vcfs = { arg_i: runParameters[key_i] for arg_i, key_i in PAIRED_CALLERS.items() if runParameters[key_i] }
+        outSnv, outIndel, intermediateVcfs, combinedFiles = combineCallers.combinePaired(outdir=runParameters['output_directory'], ref=runParameters['genome_reference'], tbam=runParameters['tumor_bam_file'], nbam=runParameters['normal_bam_file'], inclusion=runParameters['inclusion_region'], exclusion=runParameters['exclusion_region'], keep_intermediates=True, **caller_vcfs)
+
+    elif runParameters['which'] == 'single':
+        caller_vcfs = { arg_i: runParameters[key_i] for arg_i, key_i in SINGLE_CALLERS.items() if runParameters[key_i] }
+        outSnv, outIndel, intermediateVcfs, combinedFiles = combineCallers.combineSingle(outdir=runParameters['output_directory'], ref=runParameters['genome_reference'], bam=runParameters['bam_file'], inclusion=runParameters['inclusion_region'], exclusion=runParameters['exclusion_region'], keep_intermediates=True, **caller_vcfs)
+
+    # The callers are combined once above, rather than once per thread, and the regions are split by the combined candidates into many more chunks than threads:
+    bam_files    = [ runParameters[key_i] for key_i in ('tumor_bam_file', 'normal_bam_file', 'bam_file') if runParameters.get(key_i) ]
+    bed_splitted = splitRegions(runParameters['threads'] * runParameters['chunks_per_thread'], runParameters['output_directory']+os.sep+'th.input.bed', runParameters['inclusion_region'], runParameters['genome_reference']+'.fai', (outSnv, outIndel), bam_files)
+    chunk_costs  = split_bed_by_candidates.bed_costs(bed_splitted, (outSnv, outIndel), bam_files, runParameters['genome_reference']+'.fai')
+
+    # Each chunk gets its own part of the combined candidates and of every caller's VCF file, so no chunk reads through the other chunks' regions.
+    # A variant goes to exactly one chunk by its position, e.g., a deletion across the border of two chunks' regions is no longer extracted twice.
+    vcf_files = dict(caller_vcfs, combined_snv=outSnv, combined_indel=outIndel)
+    vcf_files.update( { key_i: runParameters[key_i] for key_i in ('truth_snv', 'truth_indel') if runParameters[key_i] } )
+    for caller_i in intermediateVcfs:
+        for type_j in intermediateVcfs[caller_i]:
+            if intermediateVcfs[caller_i][type_j]:
+                vcf_files[ '{}.{}'.format(caller_i, type_j) ] = intermediateVcfs[caller_i][type_j]
+
+    shard_arguments = []
+    for bed_i, shard_i in zip(bed_splitted, shardInputs(bed_splitted, runParameters['output_directory'], vcf_files)):
+
+        shard_intermediates = { caller_j: { type_k: shard_i.get('{}.{}'.format(caller_j, type_k)) for type_k in intermediateVcfs[caller_j] } for caller_j in intermediateVcfs }
 
-    pool = Pool(processes = runParameters['threads'])
+        arguments_i = { name_j: shard_i[name_j] for name_j in shard_i if name_j in caller_vcfs or name_j in ('truth_snv', 'truth_indel') }
+        arguments_i.update( inclusion=bed_i, combined=(shard_i['combined_snv'], shard_i['combined_indel'], shard_intermediates) )
+        shard_arguments.append( arguments_i )
+
+    # Build the reference cache once, before the worker processes start. They all memory-map the same file, so they share the same pages.
+    if runParameters['reference_cache'] and not os.path.exists(runParameters['reference_cache']):
+        reference_cache.build(runParameters['genome_reference'], runParameters['reference_cache'])
+
+    # Classifiers from ada_model_exporter.R or ada_trainer.py classify in memory, without TSV files, unless they are asked for, or trained on in training mode:
+    write_tsv = runParameters['write_tsv'] or runParameters['somaticseq_train']
+    streamed  = { type_i: ada_predictor.is_tree_ensemble(runParameters['classifier_' + type_i]) and not write_tsv for type_i in ('snv', 'indel') }
 
     if runParameters['which'] == 'paired':
 
+        pool = Pool(processes = runParameters['threads'], initializer = init_worker, initargs = (partial(somatic_vcf2tsv.open_shared_inputs, runParameters['normal_bam_file'], runParameters['tumor_bam_file'], runParameters['genome_reference'], runParameters['reference_cache'], runParameters['dbsnp_vcf'], runParameters['cosmic_vcf']),) )
+
         runPaired_by_region_i = partial(runPaired_by_region, \
                    outdir             = runParameters['output_directory'], \
                    ref                = runParameters['genome_reference'], \
@@ -106,12 +260,16 @@ if __name__ == '__main__':
                    tnscope            = runParameters['tnscope_vcf'], \
                    platypus           = runParameters['platypus_vcf'], \
                    somaticseq_train   = False, \
-                   keep_intermediates = runParameters['keep_intermediates'] )
+                   keep_intermediates = runParameters['keep_intermediates'], \
+                   ref_cache          = runParameters['reference_cache'], \
+                   write_tsv          = write_tsv )
 
-        subdirs = pool.map(runPaired_by_region_i, bed_splitted)
+        subdirs = runChunks(pool, runPaired_by_region_i, shard_arguments, chunk_costs)
 
     elif runParameters['which'] == 'single':
 
+        pool = Pool(processes = runParameters['threads'], initializer = init_worker, initargs = (partial(single_sample_vcf2tsv.open_shared_inputs, runParameters['bam_file'], runParameters['genome_reference'], runParameters['reference_cache'], runParameters['dbsnp_vcf'], runParameters['cosmic_vcf']),) )
+
         runSingle_by_region_i = partial(runSingle_by_region, \
                    outdir             = runParameters['output_directory'], \
                    ref                = runParameters['genome_reference'], \
@@ -139,34 +297,45 @@ if __name__ == '__main__':
                    scalpel            = runParameters['scalpel_vcf'], \
                    strelka            = runParameters['strelka_vcf'], \
                    somaticseq_train   = False, \
-                   keep_intermediates = runParameters['keep_intermediates'] )
+                   keep_intermediates = runParameters['keep_intermediates'], \
+                   ref_cache          = runParameters['reference_cache'], \
+                   write_tsv          = write_tsv )
 
-        subdirs = pool.map(runSingle_by_region_i, bed_splitted)
+        subdirs = runChunks(pool, runSingle_by_region_i, shard_arguments, chunk_costs)
 
     run_somaticseq.logger.info('Sub-directories created: {}'.format(', '.join(subdirs)) )
 
     # Merge sub-results
-    mergeSubdirTsv(subdirs, 'Ensemble.sSNV.tsv', runParameters['output_directory'])
-    mergeSubdirTsv(subdirs, 'Ensemble.sINDEL.tsv', runParameters['output_directory'])
+    if not streamed['snv']:
+        mergeSubdirTsv(subdirs, 'Ensemble.sSNV.tsv', runParameters['output_directory'])
+
+    if not streamed['indel']:
+        mergeSubdirTsv(subdirs, 'Ensemble.sINDEL.tsv', runParameters['output_directory'])
 
     if runParameters['classifier_snv']:
-        mergeSubdirTsv(subdirs, 'SSeq.Classified.sSNV.tsv', runParameters['output_directory'])
+        if not streamed['snv']:
+            mergeSubdirTsv(subdirs, 'SSeq.Classified.sSNV.tsv', runParameters['output_directory'])
         mergeSubdirVcf(subdirs, 'SSeq.Classified.sSNV.vcf', runParameters['output_directory'])
     else:
         mergeSubdirVcf(subdirs, 'Consensus.sSNV.vcf', runParameters['output_directory'])
 
     if runParameters['classifier_indel']:
-        mergeSubdirTsv(subdirs, 'SSeq.Classified.sINDEL.tsv', runParameters['output_directory'])
+        if not streamed['indel']:
+            mergeSubdirTsv(subdirs, 'SSeq.Classified.sINDEL.tsv', runParameters['output_directory'])
         mergeSubdirVcf(subdirs, 'SSeq.Classified.sINDEL.vcf', runParameters['output_directory'])
     else:
         mergeSubdirVcf(subdirs, 'Consensus.sINDEL.vcf', runParameters['output_directory'])
 
     if runParameters['somaticseq_train']:
-        subprocess.call( (run_somaticseq.adaTrainer, runParameters['output_directory'] + os.sep + 'Ensemble.sSNV.tsv', 'Consistent_Mates', 'Inconsistent_Mates') )
-        subprocess.call( (run_somaticseq.adaTrainer, runParameters['output_directory'] + os.sep + 'Ensemble.sINDEL.tsv', 'Strelka_QSS', 'Strelka_TQSS','Consistent_Mates', 'Inconsistent_Mates') )
+        run_somaticseq.runTrainer(runParameters['output_directory'] + os.sep + 'Ensemble.sSNV.tsv',   ('Consistent_Mates', 'Inconsistent_Mates'), runParameters['threads'], runParameters['python_trainer'])
+        run_somaticseq.runTrainer(runParameters['output_directory'] + os.sep + 'Ensemble.sINDEL.tsv', ('Strelka_QSS', 'Strelka_TQSS', 'Consistent_Mates', 'Inconsistent_Mates'), runParameters['threads'], runParameters['python_trainer'])
 
     # Clean up after yourself
     if not runParameters['keep_intermediates']:
+        for file_i in (outSnv, outIndel, *combinedFiles):
+            os.remove( file_i )
+            run_somaticseq.logger.info('Removed: {}'.format( file_i ) )
+
         for bed_i in bed_splitted:
             os.remove( bed_i )
             run_somaticseq.logger.info('Removed: {}'.format( bed_i ) )
@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Builds the R side of the fixture of tests/test_ada_predictor.py, which needs R and ada:
+# 1) ada_model_builder_ntChange.R trains train.tsv.ntChange.Classifier.RData on train.tsv,
+# 2) ada_model_exporter.R exports it into train.tsv.ntChange.Classifier.txt, and
+# 3) ada_model_predictor.R scores test.tsv into test.classified.tsv, i.e., the SCORE column to match.
+# Usage: make_fixture.sh [output directory, by default this directory]
+
+set -e
+
+FIXTURE_DIR=$(dirname $(readlink -f $0))
+R_SCRIPTS=${FIXTURE_DIR}/../../r_scripts
+OUT_DIR=$(readlink -f ${1:-$FIXTURE_DIR})
+
+mkdir -p ${OUT_DIR}
+
+if [[ ${OUT_DIR} != ${FIXTURE_DIR} ]]
+then
+    cp ${FIXTURE_DIR}/train.tsv ${FIXTURE_DIR}/test.tsv ${OUT_DIR}
+fi
+
+Rscript ${R_SCRIPTS}/ada_model_builder_ntChange.R ${OUT_DIR}/train.tsv
+Rscript ${R_SCRIPTS}/ada_model_exporter.R ${OUT_DIR}/train.tsv.ntChange.Classifier.RData ${OUT_DIR}/train.tsv.ntChange.Classifier.txt
+Rscript ${R_SCRIPTS}/ada_model_predictor.R ${OUT_DIR}/train.tsv.ntChange.Classifier.RData ${OUT_DIR}/test.tsv ${OUT_DIR}/test.classified.tsv
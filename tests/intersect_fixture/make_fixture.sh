@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# Builds the expected outputs of tests/test_vcfIntersector.py with intersectBed, i.e., the pipes vcfIntersector.py used to run:
+# 1) sample.include_sorted.vcf and sample.include_unsorted.vcf: sample.vcf in sorted.bed and in the same intervals unsorted, where deletions that begin before an interval have their POS moved,
+# 2) sample.exclude.vcf: sample.vcf not in exclusion.bed, and
+# 3) sample.intersect.vcf: sample.vcf in unsorted.bed, and then not in exclusion.bed.
+# Usage: make_fixture.sh [output directory, by default this directory]
+
+set -e
+
+FIXTURE_DIR=$(dirname $(readlink -f $0))
+OUT_DIR=$(readlink -f ${1:-$FIXTURE_DIR})
+
+mkdir -p ${OUT_DIR}
+cd ${FIXTURE_DIR}
+
+intersectBed -header -a sample.vcf -b sorted.bed   | uniq > ${OUT_DIR}/sample.include_sorted.vcf
+intersectBed -header -a sample.vcf -b unsorted.bed | uniq > ${OUT_DIR}/sample.include_unsorted.vcf
+intersectBed -header -a sample.vcf -b exclusion.bed -v | uniq > ${OUT_DIR}/sample.exclude.vcf
+intersectBed -header -a sample.vcf -b unsorted.bed | uniq | intersectBed -header -a stdin -b exclusion.bed -v | uniq > ${OUT_DIR}/sample.intersect.vcf
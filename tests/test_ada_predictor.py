@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# somaticseq/ada_predictor.py against r_scripts/ada_model_predictor.R, on a classifier trained by ada_model_builder_ntChange.R and exported by ada_model_exporter.R.
+# The R side is in tests/ada_fixture, built by its make_fixture.sh. Without it, it is built in a temporary directory if Rscript is in the PATH.
+# test_scores_by_hand needs no R, and checks the scoring rules on a classifier written by hand.
+
+import sys, os, shutil, subprocess
+import numpy as np
+import pytest
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import somaticseq.ada_predictor as ada_predictor
+
+FIXTURE_DIR = os.path.join(MY_DIR, 'ada_fixture')
+
+# The exported numbers have 17 significant digits, and R writes SCORE with 15, so they differ by rounding and the order of the additions only
+TOLERANCE = 1e-9
+
+
+def read_scores(tsv_fn):
+
+    with open(tsv_fn) as tsv:
+        header = tsv.readline().rstrip('\n').split('\t')
+        return np.array( [ float( line_i.rstrip('\n').split('\t')[ header.index('SCORE') ] ) for line_i in tsv if line_i.strip() ] )
+
+
+@pytest.fixture(scope='module')
+def fixture_dir(tmp_path_factory):
+
+    if os.path.exists( os.path.join(FIXTURE_DIR, 'test.classified.tsv') ):
+        return FIXTURE_DIR
+
+    if not shutil.which('Rscript'):
+        pytest.skip('tests/ada_fixture has not been built by make_fixture.sh, and there is no Rscript to build it')
+
+    out_dir = str( tmp_path_factory.mktemp('ada_fixture') )
+    subprocess.check_call( (os.path.join(FIXTURE_DIR, 'make_fixture.sh'), out_dir) )
+
+    return out_dir
+
+
+def test_scores_match_ada(fixture_dir, tmp_path):
+
+    classified_tsv = str( tmp_path / 'test.classified.tsv' )
+    ada_predictor.predict( os.path.join(fixture_dir, 'train.tsv.ntChange.Classifier.txt'), os.path.join(fixture_dir, 'test.tsv'), classified_tsv )
+
+    python_scores = read_scores( classified_tsv )
+    r_scores      = read_scores( os.path.join(fixture_dir, 'test.classified.tsv') )
+
+    assert len(python_scores) == len(r_scores) == 100
+    assert np.abs(python_scores - r_scores).max() <= TOLERANCE
+
+
+# Without R: a classifier written by hand in the format of ada_model_exporter.R, whose scores are worked out from predict.ada's F = sum of alpha times the class of the leaf of each tree (nu is already in alpha)
+HAND_MODEL = '''##SomaticSeq tree ensemble
+##model=by hand
+##nu=0.1
+#TREE\tALPHA\tNODE\tN\tVARIABLE\tNCAT\tSPLIT\tVALUE
+1\t0.3\t1\t100\tT_DP\t-1\t50\t1
+1\t0.3\t1\t100\ttBAM_ALT_BQ\t1\t30\t1
+1\t0.3\t2\t60\t<leaf>\t0\tnan\t-1
+1\t0.3\t3\t40\t<leaf>\t0\tnan\t1
+2\t0.2\t1\t100\tT_ALT_FOR\t1\t2.5\t-1
+2\t0.2\t2\t30\t<leaf>\t0\tnan\t1
+2\t0.2\t3\t70\t<leaf>\t0\tnan\t-1
+'''
+
+# T_DP, tBAM_ALT_BQ, T_ALT_FOR, and F:
+# Tree 1 goes left if T_DP < 50, or if T_DP is missing and tBAM_ALT_BQ >= 30 (its surrogate), or if both are missing (the left child has more samples).
+# Tree 2 goes left if T_ALT_FOR >= 2.5, and right (the child with more samples) if it is missing.
+HAND_CASES = ( ('10',  'nan', '3',   -0.3 + 0.2),
+               ('80',  '20',  '1',    0.3 - 0.2),
+               ('50',  '20',  '2',    0.3 - 0.2),
+               ('nan', '35',  'nan', -0.3 - 0.2),
+               ('nan', '25',  '2.5',  0.3 + 0.2),
+               ('nan', 'nan', '2.5', -0.3 + 0.2), )
+
+
+def test_scores_by_hand(tmp_path):
+
+    model_file = tmp_path / 'hand.ntChange.Classifier.txt'
+    model_file.write_text( HAND_MODEL )
+
+    tsv_file = tmp_path / 'hand.tsv'
+    tsv_file.write_text( 'CHROM\tPOS\tID\tREF\tALT\tT_DP\ttBAM_ALT_BQ\tT_ALT_FOR\n' + ''.join( '1\t{}\t.\tA\tG\t{}\t{}\t{}\n'.format(i+1, *case_i[:3]) for i, case_i in enumerate(HAND_CASES) ) )
+
+    classified_tsv = str( tmp_path / 'hand.classified.tsv' )
+    ada_predictor.predict( str(model_file), str(tsv_file), classified_tsv )
+
+    expected_scores = 1 / ( 1 + np.exp( -2 * np.array([ case_i[3] for case_i in HAND_CASES ]) ) )
+
+    assert np.abs( read_scores(classified_tsv) - expected_scores ).max() <= TOLERANCE
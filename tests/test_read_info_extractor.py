@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# genomicFileHandler/read_info_extractor.py: locate_aligned_position, which walks the CIGAR once, against position_of_aligned_read, the per-base walk through get_aligned_pairs().
+# Both are given the same pysam reads, on random CIGARs as well as a few by hand, and every target position from before the read to after it.
+
+import sys, os, random
+import pysam
+import pytest
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.read_info_extractor as read_info_extractor
+
+# Operations that consume the query, i.e., have bases in the read sequence, plus padding, which pysam's get_aligned_pairs() gives query positions to as well
+QUERY_OPS = 'MIS=XP'
+
+HEADER = pysam.AlignmentHeader.from_dict( {'SQ': [{'SN': 'chr1', 'LN': 100000}]} )
+
+# Hand-picked CIGARs: soft clips, insertions and deletions next to the target and at the ends, N, and the edges of the read
+EDGE_CIGARS = ( '10M',
+                '1M',
+                '3S7M',
+                '7M3S',
+                '2H3S5M2S1H',
+                '5M2I5M',
+                '5M2D5M',
+                '5M100N5M',
+                '1M1I1M',
+                '1M1D1M',
+                '5M4I',
+                '4I5M',
+                '3S2I5M2D1M',
+                '5M1I1D5M',
+                '5M1D1I5M',
+                '2M1D1D2M',
+                '3=1X2I3=',
+                '4M1P2I4M',
+                '2M3N2D3I1S',
+                '1M0I1M0D1M', )
+
+
+def make_read(cigarstring, reference_start=1000):
+
+    read_i = pysam.AlignedSegment(HEADER)
+    read_i.query_name      = 'read'
+    read_i.reference_id    = 0
+    read_i.reference_start = reference_start
+    read_i.cigarstring     = cigarstring
+
+    query_length = sum( length_i for op_i, length_i in read_i.cigartuples if 'MIDNSHP=X'[op_i] in QUERY_OPS )
+    read_i.query_sequence  = ''.join( random.Random(cigarstring).choice('ACGT') for _ in range(query_length) )
+
+    return read_i
+
+
+def random_cigar(random_i):
+
+    ops = [ random_i.choice('MMMMIDN=XP') for _ in range( random_i.randint(1, 8) ) ]
+
+    # Clips are only at the ends, soft clips inside hard clips
+    for clip_i in 'SH':
+        if random_i.random() < 0.3:
+            ops.insert(0, clip_i)
+        if random_i.random() < 0.3:
+            ops.append(clip_i)
+
+    # At least one base aligned to the reference
+    if not any( op_i in 'M=X' for op_i in ops ):
+        ops.insert( len(ops)//2, 'M' )
+
+    return ''.join( '{}{}'.format(random_i.randint(1, 6), op_i) for op_i in ops )
+
+
+def assert_same_locations(read_i):
+
+    for target_position in range(read_i.reference_start - 2, read_i.reference_end + 2):
+
+        expected = read_info_extractor.position_of_aligned_read(read_i, target_position)
+        observed = read_info_extractor.locate_aligned_position(read_i, target_position)
+
+        # nan != nan, so compare them by their repr
+        assert repr(observed) == repr(expected), (read_i.cigarstring, target_position)
+
+
+@pytest.mark.parametrize('cigarstring', EDGE_CIGARS)
+def test_edge_cigars(cigarstring):
+    assert_same_locations( make_read(cigarstring) )
+
+
+def test_random_cigars():
+
+    random_i = random.Random(2018)
+
+    for _ in range(3000):
+        assert_same_locations( make_read( random_cigar(random_i), random_i.randint(0, 50) ) )
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# vcfModifier/vcfIntersector.py against the intersectBed | uniq pipes it replaced, on the VCF and BED files in tests/intersect_fixture.
+# The expected outputs are built by its make_fixture.sh. Without them, they are built in a temporary directory if intersectBed is in the PATH.
+
+import sys, os, shutil, subprocess
+import pytest
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import vcfModifier.vcfIntersector as vcfIntersector
+
+FIXTURE_DIR = os.path.join(MY_DIR, 'intersect_fixture')
+VCF_FILE    = os.path.join(FIXTURE_DIR, 'sample.vcf')
+
+
+@pytest.fixture(scope='module')
+def expected_dir(tmp_path_factory):
+
+    if os.path.exists( os.path.join(FIXTURE_DIR, 'sample.intersect.vcf') ):
+        return FIXTURE_DIR
+
+    if not shutil.which('intersectBed'):
+        pytest.skip('tests/intersect_fixture has not been built by make_fixture.sh, and there is no intersectBed to build it')
+
+    out_dir = str( tmp_path_factory.mktemp('intersect_fixture') )
+    subprocess.check_call( (os.path.join(FIXTURE_DIR, 'make_fixture.sh'), out_dir) )
+
+    return out_dir
+
+
+def read_lines(file_name):
+    with open(file_name) as file_i:
+        return file_i.readlines()
+
+
+def distinct_lines(lines):
+    return sorted( set(lines) )
+
+
+# A deletion across several intervals has its POS moved once per interval. bedtools writes them in its own order of the intervals, and uniq only drops identical lines next to each other,
+# whereas vcfIntersector writes each distinct one once, in coordinate order (see included_lines), so the included lines are compared regardless of their order and repeats.
+@pytest.mark.parametrize('bed_file, expected_file', ( ('sorted.bed',   'sample.include_sorted.vcf'),
+                                                      ('unsorted.bed', 'sample.include_unsorted.vcf'), ))
+def test_bed_include(expected_dir, tmp_path, bed_file, expected_file):
+
+    outfile = vcfIntersector.bed_include( VCF_FILE, os.path.join(FIXTURE_DIR, bed_file), str(tmp_path / expected_file) )
+    assert distinct_lines( read_lines(outfile) ) == distinct_lines( read_lines( os.path.join(expected_dir, expected_file) ) )
+
+
+def test_bed_exclude(expected_dir, tmp_path):
+
+    outfile = vcfIntersector.bed_exclude( VCF_FILE, os.path.join(FIXTURE_DIR, 'exclusion.bed'), str(tmp_path / 'sample.exclude.vcf') )
+    assert read_lines(outfile) == read_lines( os.path.join(expected_dir, 'sample.exclude.vcf') )
+
+
+def test_bed_intersector(expected_dir, tmp_path):
+
+    outfile = vcfIntersector.bed_intersector( VCF_FILE, str(tmp_path / 'sample.intersect.vcf'), os.path.join(FIXTURE_DIR, 'unsorted.bed'), os.path.join(FIXTURE_DIR, 'exclusion.bed') )
+    assert distinct_lines( read_lines(outfile) ) == distinct_lines( read_lines( os.path.join(expected_dir, 'sample.intersect.vcf') ) )
+
+
+# Without intersectBed: the lines of a deletion across nested, overlapping, and unsorted intervals, one for each distinct overlap start in coordinate order
+def test_included_lines_across_intervals(tmp_path):
+
+    bed_file = tmp_path / 'regions.bed'
+    bed_file.write_text( 'chr1\t120\t130\nchr1\t100\t200\nchr1\t90\t105\nchr1\t110\t115\nchr1\t120\t125\n' )
+
+    vcf_lines = ( '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n',
+                  'chr1\t96\t.\t{}\tA\t.\tPASS\t.\n'.format('A' * 30),
+                  'chr1\t101\t.\tC\tG\t.\tPASS\t.\n',
+                  'chr1\t201\t.\tC\tG\t.\tPASS\t.\n', )
+
+    included = list( vcfIntersector.unique_lines( vcfIntersector.included_lines(vcf_lines, vcfIntersector.BedIndex(str(bed_file))) ) )
+
+    assert included == [ vcf_lines[0],
+                         vcf_lines[1],
+                         vcf_lines[1].replace('\t96\t', '\t101\t'),
+                         vcf_lines[1].replace('\t96\t', '\t111\t'),
+                         vcf_lines[1].replace('\t96\t', '\t121\t'),
+                         vcf_lines[2], ]
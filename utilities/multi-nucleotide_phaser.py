@@ -109,7 +109,7 @@ pysam.FastaFile(ref_fa) as ref_fa:
                     mnp_call = ''
                     for coordinate_i in my_coordinates:
                     
-                        code_i, ith_base, base_call_i, indel_length_i, flanking_indel_i = position_of_aligned_read(read_i, coordinate_i[1]-1 )
+                        code_i, ith_base, base_call_i, indel_length_i, flanking_indel_i = locate_aligned_position(read_i, coordinate_i[1]-1 )
                         
                         # The position is matched:
                         if (code_i == 0 or code_i == 1 or code_i == 2) and base_call_i:
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# Splits a BED file into regions of about equal work rather than equal base pairs.
+# The work is in the candidate sites, i.e., the positions in the callers' VCF files, times the read depth there, so the breakpoints are chosen to give each output the same share of candidates, each weighted by the depth of its contig from the BAM index statistics if BAM files are given.
+# If there is no candidate in the BED file, it is split by base pairs like split_Bed_into_equal_regions.py.
+
+import sys, os, argparse, re
+import numpy as np
+import pysam
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+import utilities.split_Bed_into_equal_regions as split_bed
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-infile',    '--input-file',    type=str,  help='Input merged BED file',    required=True,  default=None)
+    parser.add_argument('-num',       '--num-of-files',  type=int,  help='1',                        required=False, default=1)
+    parser.add_argument('-outfiles',  '--output-files',  type=str,  help='Output BED file',          required=False, default=sys.stdout)
+    parser.add_argument('-vcfs',      '--caller-vcfs',   nargs='*', help='VCF files of the callers, whose positions are the candidates', required=True)
+    parser.add_argument('-bams',      '--bam-files',     nargs='*', help='Indexed BAM files to weight each candidate by the read depth of its contig', required=False, default=[])
+    parser.add_argument('-fai',       '--fasta-index',   type=str,  help='.fasta.fai file for the contig lengths, required with -bams', required=False, default=None)
+
+    args = parser.parse_args()
+
+    return args.input_file, args.output_files, args.num_of_files, args.caller_vcfs, args.bam_files, args.fasta_index
+
+
+
+def candidate_positions(vcf_files):
+    '''{contig: sorted array of the unique positions in all the vcf_files}'''
+
+    positions = {}
+
+    for vcf_file_i in vcf_files:
+        with genome.open_textfile(vcf_file_i) as vcf:
+
+            line_i = genome.skip_vcf_header(vcf)
+
+            while line_i:
+                contig_i, position_i = line_i.split('\t', 2)[:2]
+                positions.setdefault(contig_i, []).append( int(position_i) )
+
+                line_i = vcf.readline().rstrip()
+
+    return { contig_i: np.unique(positions_i) for contig_i, positions_i in positions.items() }
+
+
+
+def contig_weights(bam_files, fai):
+    '''
+    {contig: cost of a candidate site there}, i.e., 1 for the work at any site, plus the mapped reads per base pair in all the BAM files, relative to the whole genome.
+    Contigs not in the dictionary count 1.
+    '''
+
+    with open(fai) as fai_in:
+        contig_lengths = { line_i.split('\t')[0]: int(line_i.split('\t')[1]) for line_i in fai_in if line_i.strip() }
+
+    mapped_reads = dict.fromkeys(contig_lengths, 0)
+
+    for bam_file_i in bam_files:
+        with pysam.AlignmentFile(bam_file_i) as bam:
+
+            # e.g., an index without the number of mapped reads, as some CRAM indices are
+            try:
+                index_statistics = bam.get_index_statistics()
+            except ValueError:
+                return {}
+
+            for stat_i in index_statistics:
+                if stat_i.contig in mapped_reads:
+                    mapped_reads[ stat_i.contig ] += stat_i.mapped
+
+    total_reads, total_length = sum(mapped_reads.values()), sum(contig_lengths.values())
+
+    if total_reads == 0:
+        return {}
+
+    genome_depth = total_reads / total_length
+
+    return { contig_i: 1 + mapped_reads[contig_i] / contig_lengths[contig_i] / genome_depth for contig_i in contig_lengths if contig_lengths[contig_i] > 0 }
+
+
+
+def read_bed(infile):
+
+    regions = []
+    with open(infile) as bedin:
+
+        line_i = bedin.readline().rstrip()
+
+        while re.match(r'track|browser|#', line_i):
+            line_i = bedin.readline().rstrip()
+
+        while line_i:
+            items = line_i.split('\t')
+            regions.append( (items[0], int(items[1]), int(items[2])) )
+
+            line_i = bedin.readline().rstrip()
+
+    return regions
+
+
+
+def write_bed(regions, outfile):
+
+    with open(outfile, 'w') as bedout:
+        for chr_i, start_i, end_i in regions:
+            bedout.write( '{}\t{}\t{}\n'.format(chr_i, start_i, end_i) )
+
+    return outfile
+
+
+
+def sites_and_costs(regions, positions, weights):
+    '''Candidate positions and their costs inside each BED region, i.e., start < position <= end'''
+
+    region_sites = []
+    region_costs = []
+    for chr_i, start_i, end_i in regions:
+        positions_i = positions.get(chr_i, np.zeros(0, dtype=int))
+        positions_i = positions_i[ positions_i.searchsorted(start_i, 'right') : positions_i.searchsorted(end_i, 'right') ]
+
+        region_sites.append( positions_i )
+        region_costs.append( np.full( len(positions_i), weights.get(chr_i, 1.0) ) )
+
+    return region_sites, region_costs
+
+
+
+def bed_costs(bed_files, vcf_files, bam_files=(), fai=None):
+    '''Estimated work of each BED file, i.e., its weighted number of candidates, the same as split balances'''
+
+    positions = candidate_positions(vcf_files)
+    weights   = contig_weights(bam_files, fai) if bam_files else {}
+
+    return [ float( sum( costs_i.sum() for costs_i in sites_and_costs(read_bed(bed_i), positions, weights)[1] ) ) for bed_i in bed_files ]
+
+
+
+def split(infile, outfiles, num, vcf_files, bam_files=(), fai=None):
+
+    out_basename  = os.path.basename(outfiles)
+    out_directory = os.path.dirname(outfiles) or os.curdir
+
+    positions = candidate_positions(vcf_files)
+    weights   = contig_weights(bam_files, fai) if bam_files else {}
+
+    regions = read_bed(infile)
+    region_sites, region_costs = sites_and_costs(regions, positions, weights)
+
+    total_cost = sum( costs_i.sum() for costs_i in region_costs )
+
+    if total_cost == 0:
+        return split_bed.split(infile, outfiles, num)
+
+    # The i_th output ends right after the candidate at which the cumulative cost reaches i/num of the total.
+    # The breakpoint is half way to the next candidate in the same BED region, or the end of the BED region.
+    cost_per_file   = total_cost / num
+    outfilesWritten = []
+    current_region  = []
+    cumulative_cost = 0
+    ith_split       = 1
+
+    for (chr_i, start_i, end_i), positions_i, costs_i in zip(regions, region_sites, region_costs):
+
+        cumulative_costs = cumulative_cost + np.cumsum(costs_i)
+        piece_start      = start_i
+
+        while ith_split < num and len(positions_i) and cumulative_costs[-1] >= ith_split * cost_per_file:
+
+            k = int( cumulative_costs.searchsorted(ith_split * cost_per_file, 'left') )
+            breakpoint_i = (positions_i[k] + positions_i[k+1]) // 2 if k+1 < len(positions_i) else end_i
+
+            current_region.append( (chr_i, piece_start, int(breakpoint_i)) )
+            outfilesWritten.append( write_bed(current_region, '{}{}{}.{}'.format(out_directory, os.sep, len(outfilesWritten)+1, out_basename)) )
+            current_region = []
+            piece_start    = int(breakpoint_i)
+
+            # More than one share in a single candidate, i.e., one very deep contig, does not make empty files
+            while ith_split < num and cumulative_costs[k] >= ith_split * cost_per_file:
+                ith_split += 1
+
+        if piece_start < end_i:
+            current_region.append( (chr_i, piece_start, end_i) )
+
+        if len(costs_i):
+            cumulative_cost = cumulative_costs[-1]
+
+    # The final region to write out:
+    if current_region:
+        outfilesWritten.append( write_bed(current_region, '{}{}{}.{}'.format(out_directory, os.sep, len(outfilesWritten)+1, out_basename)) )
+
+    return outfilesWritten
+
+
+
+if __name__ == '__main__':
+    infile, outfiles, num, vcf_files, bam_files, fai = run()
+    split(infile, outfiles, num, vcf_files, bam_files, fai)
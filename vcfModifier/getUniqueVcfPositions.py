@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
 
 # A simple and quick way to replace GATK3 CombineVariants
+# The callers' VCF files are already sorted by coordinate, so they are merged like in merge sort, i.e., one variant from each file at a time, and the output comes out sorted and unique without holding all the variants in memory.
+
+import sys, os, argparse, gzip, re, heapq, logging
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+
+logger = logging.getLogger( os.path.basename(__file__) )
+
+
+class UnsortedVcfError(Exception):
+    pass
 
-import sys, argparse, gzip, re
 
 
 def open_textfile(file_name):
 
+    # In-memory VCF files, i.e., vcfStream.VcfStream, open themselves:
+    if hasattr(file_name, 'open'):
+        return file_name.open()
+
     # See if the input file is a .gz file:
-    if file_name.lower().endswith('.gz'):
+    elif file_name.lower().endswith('.gz'):
         return gzip.open(file_name, 'rt')
 
     else:
@@ -20,54 +38,124 @@ def run():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-vcfs',  '--input-vcfs', nargs='*', type=str, help='Input VCF file', required=True, default=None)
     parser.add_argument('-out',   '--output-vcf',            type=str, help='Output VCF file', required=True)
+    parser.add_argument('-fai',   '--fasta-index',           type=str, help='.fasta.fai file for the contig order. Default is to sort contigs by name', default=None)
 
     args = parser.parse_args()
 
     infiles = args.input_vcfs
     outfile  = args.output_vcf
+    fai      = args.fasta_index
 
-    return infiles, outfile
+    return infiles, outfile, fai
 
 
 
-def combine(infiles, outfile):
+def variant_keys(vcf_file, chrom_seq):
 
-    variant_positions = set()
+    '''
+    Yields (contig order, contig, position, refbase, altbase) for every ALT allele of a coordinate-sorted VCF file, in sorted order.
+    Variants at the same coordinate are gathered first, since their lines may be in any order.
+    Contigs not in chrom_seq go after the ones that are, by name.
+    '''
 
-    for file_i in infiles:
+    with open_textfile(vcf_file) as vcf:
 
-        with open_textfile(file_i) as vcf:
+        line_i = vcf.readline().rstrip()
 
+        while line_i.startswith('#'):
             line_i = vcf.readline().rstrip()
 
-            while line_i.startswith('#'):
-                line_i = vcf.readline().rstrip()
+        coordinate_variants = []
+        previous_key        = None
 
+        while line_i:
 
-            while line_i:
+            item = line_i.split('\t')
 
-                item = line_i.split('\t')
+            chromosome = item[0]
+            position   = int( item[1] )
+            refbase    = item[3]
+            altbases   = re.split(r'[,/]', item[4])
 
-                chromosome = item[0]
-                position   = int( item[1] )
-                refbase    = item[3]
-                altbases   = re.split(r'[,/]', item[4])
+            coordinate_key = ( chrom_seq.get(chromosome, len(chrom_seq)), chromosome, position )
 
-                for altbase_i in altbases:
-                    variant_positions.add( (chromosome, position, refbase, altbase_i) )
+            if coordinate_key != previous_key:
 
-                line_i = vcf.readline().rstrip()
+                if previous_key and coordinate_key < previous_key:
+                    raise UnsortedVcfError( '{} is not sorted at {}:{}'.format(vcf_file, chromosome, position) )
+
+                yield from sorted(coordinate_variants)
 
+                coordinate_variants = []
+                previous_key        = coordinate_key
+
+            for altbase_i in altbases:
+                coordinate_variants.append( coordinate_key + (refbase, altbase_i) )
+
+            line_i = vcf.readline().rstrip()
+
+        yield from sorted(coordinate_variants)
+
+
+
+def write_variants(variant_keys, outfile):
 
     with open(outfile, 'w') as vcf_out:
         vcf_out.write('##fileformat=VCFv4.1\n')
         vcf_out.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
 
-        for variant_position_i in sorted(variant_positions):
+        previous_key = None
+
+        for variant_key_i in variant_keys:
+
+            # The same variant from different callers comes out one after another:
+            if variant_key_i != previous_key:
+                vcf_out.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(variant_key_i[1], variant_key_i[2], '.', variant_key_i[3], variant_key_i[4], '.', 'PASS', '.') )
+
+            previous_key = variant_key_i
+
+
+
+def combine(infiles, outfile, fai=None):
+
+    '''
+    Writes the unique variants of all infiles into outfile, sorted by the contig order in the .fai file, position, REF, and ALT.
+    If any infile turns out not to be sorted, all the variants are read into memory and sorted instead.
+    '''
+
+    chrom_seq = genome.faiordict2contigorder(fai, 'fai') if fai else {}
+
+    try:
+        write_variants( heapq.merge( *[variant_keys(file_i, chrom_seq) for file_i in infiles] ), outfile )
+
+    except UnsortedVcfError as error:
+        logger.warning( '{}. Sorting all the variants in memory.'.format(error) )
+
+        variant_positions = set()
+        for file_i in infiles:
+
+            with open_textfile(file_i) as vcf:
+
+                line_i = vcf.readline().rstrip()
+
+                while line_i.startswith('#'):
+                    line_i = vcf.readline().rstrip()
+
+                while line_i:
+
+                    item = line_i.split('\t')
+
+                    for altbase_i in re.split(r'[,/]', item[4]):
+                        variant_positions.add( (chrom_seq.get(item[0], len(chrom_seq)), item[0], int(item[1]), item[3], altbase_i) )
+
+                    line_i = vcf.readline().rstrip()
+
+        write_variants( sorted(variant_positions), outfile )
+
+    return outfile
 
-            vcf_out.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(variant_position_i[0], variant_position_i[1], '.', variant_position_i[2], variant_position_i[3], '.', 'PASS', '.') )
 
 
 if __name__ == '__main__':
-    infiles, outfile = run()
-    combine(infiles, outfile)
+    infiles, outfile, fai = run()
+    combine(infiles, outfile, fai)
@@ -37,7 +37,17 @@ def run():
 
 
 def convert(infile, outfile, tbam, nbam):
-    
+
+    with genome.open_textfile(infile) as vcf, open(outfile, 'w') as vcfout:
+        for line_i in convert_lines(vcf, tbam, nbam):
+            vcfout.write( line_i )
+
+
+
+def convert_lines(vcf, tbam, nbam):
+
+    '''Same as convert, but reads an open VCF and yields the lines instead of writing them'''
+
     paired_mode = True if nbam else False
 
     # Get tumor and normal sample names from the bam files:
@@ -63,57 +73,55 @@ def convert(infile, outfile, tbam, nbam):
     
     idx_chrom,idx_pos,idx_id,idx_ref,idx_alt,idx_qual,idx_filter,idx_info,idx_format = 0,1,2,3,4,5,6,7,8
     idx_SM1, idx_SM2 = 9,10
-    
-    with genome.open_textfile(infile) as vcf, open(outfile, 'w') as vcfout:
 
-        line_i = vcf.readline().rstrip()
+    line_i = vcf.readline().rstrip()
 
-        while line_i.startswith('#'):
+    while line_i.startswith('#'):
 
 
-            if line_i.startswith('##'):
-                vcfout.write( line_i + '\n' )
+        if line_i.startswith('##'):
+            yield line_i + '\n'
 
-            elif line_i.startswith('#CHROM'):
-                header_items = line_i.rstrip().split('\t')
-    
-                idxN = header_items.index(n_samplename)
-                idxT = header_items.index(t_samplename)
-    
-                if paired_mode:
-                    header_items[idx_SM1] = 'NORMAL'
-                    header_items[idx_SM2] = 'TUMOR'
+        elif line_i.startswith('#CHROM'):
+            header_items = line_i.rstrip().split('\t')
 
-                else:
+            idxN = header_items.index(n_samplename)
+            idxT = header_items.index(t_samplename)
 
-                    # Keep up to the first sample column, then make sure it's labeled the TUMOR sample name
-                    header_items = header_items[:idx_SM1+1]
-                    header_items[idx_SM1] = args.tumor_sample_name
-    
-                replaced_header = '\t'.join(header_items)
-                vcfout.write(replaced_header + '\n')
-    
-            line_i = vcf.readline().rstrip()
+            if paired_mode:
+                header_items[idx_SM1] = 'NORMAL'
+                header_items[idx_SM2] = 'TUMOR'
 
+            else:
 
-        while line_i:
+                # Keep up to the first sample column, then make sure it's labeled the TUMOR sample name
+                header_items = header_items[:idx_SM1+1]
+                header_items[idx_SM1] = args.tumor_sample_name
 
-            items_i = line_i.split('\t')
+            replaced_header = '\t'.join(header_items)
+            yield replaced_header + '\n'
 
-            if paired_mode:
-                items_i[idx_SM1], items_i[idx_SM2] = items_i[idxN], items_i[idxT]
+        line_i = vcf.readline().rstrip()
 
-            else:
-                items_i = items_i[:idx_SM1] + [items_i[idxT]]
 
-            # Print the new stuff:
-            new_line = '\t'.join( items_i )
+    while line_i:
+
+        items_i = line_i.split('\t')
+
+        if paired_mode:
+            items_i[idx_SM1], items_i[idx_SM2] = items_i[idxN], items_i[idxT]
 
-            # Have to get rid of "N" in REF, because after snpSift annotation, it changes the ALT and vcf-validator will complain.
-            if not ( 'N' in items_i[idx_ref] ):
-                vcfout.write( new_line + '\n' )
+        else:
+            items_i = items_i[:idx_SM1] + [items_i[idxT]]
 
-            line_i = vcf.readline().rstrip()
+        # Print the new stuff:
+        new_line = '\t'.join( items_i )
+
+        # Have to get rid of "N" in REF, because after snpSift annotation, it changes the ALT and vcf-validator will complain.
+        if not ( 'N' in items_i[idx_ref] ):
+            yield new_line + '\n'
+
+        line_i = vcf.readline().rstrip()
     
     
     
@@ -33,104 +33,116 @@ def run():
 
 def convert(infile, snv_out, indel_out, is_tnscope):
 
+    with genome.open_textfile(infile) as vcf_in, open(snv_out, 'w') as snv_out, open(indel_out, 'w') as indel_out:
+
+        outfiles = {'snv': snv_out, 'indel': indel_out}
+
+        for variant_type, line_i in convert_lines(vcf_in, is_tnscope):
+            outfiles[variant_type].write( line_i )
+
+
+
+def convert_lines(vcf_in, is_tnscope):
+
+    '''Same as convert, but reads an open VCF and yields ('snv' or 'indel', line) instead of writing two files'''
+
     info_to_split = 'NLOD', 'TLOD'
     info_to_keep = 'STR', 'ECNT'
 
-    with genome.open_textfile(infile) as vcf_in, open(snv_out, 'w') as snv_out, open(indel_out, 'w') as indel_out:
 
-        line_i = vcf_in.readline().rstrip()
+    line_i = vcf_in.readline().rstrip()
 
-        while line_i.startswith('##'):
+    while line_i.startswith('##'):
 
-            if line_i.startswith('##normal_sample='):
-                normal_name = line_i.split('=')[1]
+        if line_i.startswith('##normal_sample='):
+            normal_name = line_i.split('=')[1]
 
-            if line_i.startswith('##tumor_sample='):
-                tumor_name = line_i.split('=')[1]
+        if line_i.startswith('##tumor_sample='):
+            tumor_name = line_i.split('=')[1]
 
-            if line_i.startswith('##INFO=<ID=SOR,'):
-                line_i = re.sub(r'Float', 'String', line_i)
+        if line_i.startswith('##INFO=<ID=SOR,'):
+            line_i = re.sub(r'Float', 'String', line_i)
 
-            snv_out.write( line_i + '\n' )
-            indel_out.write( line_i + '\n' )
+        yield 'snv', line_i + '\n'
+        yield 'indel', line_i + '\n'
 
-            line_i = vcf_in.readline().rstrip()
+        line_i = vcf_in.readline().rstrip()
 
-        # This line will be #CHROM:
-        snv_out.write( line_i + '\n' )
-        indel_out.write( line_i + '\n' )
-        header = line_i.split('\t')
+    # This line will be #CHROM:
+    yield 'snv', line_i + '\n'
+    yield 'indel', line_i + '\n'
+    header = line_i.split('\t')
 
-        if is_tnscope:
-            # Doesn't matter which one is normal/tumor. These information are not used.
-            normal_index, tumor_index = 1,0
+    if is_tnscope:
+        # Doesn't matter which one is normal/tumor. These information are not used.
+        normal_index, tumor_index = 1,0
 
-        else:
-            normal_index = header.index(normal_name) - 9
-            tumor_index = header.index(tumor_name) - 9
+    else:
+        normal_index = header.index(normal_name) - 9
+        tumor_index = header.index(tumor_name) - 9
 
-        # This will be the first variant line:
-        line_i = vcf_in.readline().rstrip()
+    # This will be the first variant line:
+    line_i = vcf_in.readline().rstrip()
 
-        while line_i:
+    while line_i:
 
-            vcf_i = genome.Vcf_line( line_i )
+        vcf_i = genome.Vcf_line( line_i )
 
-            if ',' not in vcf_i.altbase:
+        if ',' not in vcf_i.altbase:
 
-                if len(vcf_i.refbase) == 1 and len(vcf_i.altbase) == 1:
-                    snv_out.write( line_i + '\n' )
-                elif len(vcf_i.refbase) == 1 or len(vcf_i.altbase) == 1:
-                    indel_out.write( line_i + '\n' )
+            if len(vcf_i.refbase) == 1 and len(vcf_i.altbase) == 1:
+                yield 'snv', line_i + '\n'
+            elif len(vcf_i.refbase) == 1 or len(vcf_i.altbase) == 1:
+                yield 'indel', line_i + '\n'
 
-            else:
-                alt_bases = vcf_i.altbase.split(',')
-                measures = []
-                still_measures = []
+        else:
+            alt_bases = vcf_i.altbase.split(',')
+            measures = []
+            still_measures = []
 
-                for measure_i in info_to_split:
-                    try:
-                        measures.append( vcf_i.get_info_value(measure_i).split(',') )
-                    except AttributeError:
-                        measures.append( None )
+            for measure_i in info_to_split:
+                try:
+                    measures.append( vcf_i.get_info_value(measure_i).split(',') )
+                except AttributeError:
+                    measures.append( None )
 
-                for measure_i in info_to_keep:
-                    try:
-                        still_measures.append( vcf_i.get_info_value(measure_i) )
-                    except AttributeError:
-                        still_measures.append( None )
+            for measure_i in info_to_keep:
+                try:
+                    still_measures.append( vcf_i.get_info_value(measure_i) )
+                except AttributeError:
+                    still_measures.append( None )
 
-                for ith_base, altbase_i in enumerate(alt_bases):
+            for ith_base, altbase_i in enumerate(alt_bases):
 
-                    split_infos = [ '{}={}'.format(info_variable, info_value[ith_base]) for info_variable, info_value in zip(info_to_split, measures) if info_value != None ]
+                split_infos = [ '{}={}'.format(info_variable, info_value[ith_base]) for info_variable, info_value in zip(info_to_split, measures) if info_value != None ]
 
-                    still_infos = [ '{}={}'.format(info_variable, info_value) for info_variable, info_value in zip(info_to_keep, still_measures) if info_value != False ]
+                still_infos = [ '{}={}'.format(info_variable, info_value) for info_variable, info_value in zip(info_to_keep, still_measures) if info_value != False ]
 
-                    split_infos.extend(still_infos)
+                split_infos.extend(still_infos)
 
-                    info_string = ';'.join( split_infos )
+                info_string = ';'.join( split_infos )
 
-                    GT0 = vcf_i.get_sample_value('GT', idx=0)
-                    if GT0 != '0/0' and GT0 != '0/1':
-                        sample_0 = re.sub(r'^[^:]+', '0/1', vcf_i.samples[0])
-                    else:
-                        sample_0 = vcf_i.samples[0]
+                GT0 = vcf_i.get_sample_value('GT', idx=0)
+                if GT0 != '0/0' and GT0 != '0/1':
+                    sample_0 = re.sub(r'^[^:]+', '0/1', vcf_i.samples[0])
+                else:
+                    sample_0 = vcf_i.samples[0]
 
-                    GT1 = vcf_i.get_sample_value('GT', idx=1)
-                    if GT1 != '0/0' and GT0 != '0/1':
-                        sample_1 = re.sub(r'^[^:]+', '0/1', vcf_i.samples[1])
-                    else:
-                        sample_1 = vcf_i.samples[1]
+                GT1 = vcf_i.get_sample_value('GT', idx=1)
+                if GT1 != '0/0' and GT0 != '0/1':
+                    sample_1 = re.sub(r'^[^:]+', '0/1', vcf_i.samples[1])
+                else:
+                    sample_1 = vcf_i.samples[1]
 
 
-                    new_line = '\t'.join(( vcf_i.chromosome, str(vcf_i.position), vcf_i.identifier, vcf_i.refbase, altbase_i, vcf_i.qual, vcf_i.filters, info_string, vcf_i.field, sample_0, sample_1 ))
+                new_line = '\t'.join(( vcf_i.chromosome, str(vcf_i.position), vcf_i.identifier, vcf_i.refbase, altbase_i, vcf_i.qual, vcf_i.filters, info_string, vcf_i.field, sample_0, sample_1 ))
 
-                    if len(vcf_i.refbase) == 1 and len(altbase_i) == 1:
-                        snv_out.write( new_line + '\n' )
-                    elif len(vcf_i.refbase) == 1 or len(altbase_i) == 1:
-                        indel_out.write( new_line + '\n')
+                if len(vcf_i.refbase) == 1 and len(altbase_i) == 1:
+                    yield 'snv', new_line + '\n'
+                elif len(vcf_i.refbase) == 1 or len(altbase_i) == 1:
+                    yield 'indel', new_line + '\n'
 
-            line_i = vcf_in.readline().rstrip()
+        line_i = vcf_in.readline().rstrip()
 
 
 if __name__ == '__main__':
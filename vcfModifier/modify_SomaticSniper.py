@@ -26,31 +26,40 @@ def run():
 
 def convert(infile, outfile):
 
+    with genome.open_textfile(infile) as vcf, open(outfile, 'w') as vcfout:
+        for line_i in convert_lines(vcf):
+            vcfout.write( line_i )
+
+
+
+def convert_lines(vcf):
+
+    '''Same as convert, but reads an open VCF and yields the lines instead of writing them'''
+
     idx_chrom,idx_pos,idx_id,idx_ref,idx_alt,idx_qual,idx_filter,idx_info,idx_format,idx_SM1,idx_SM2 = 0,1,2,3,4,5,6,7,8,9,10
 
-    with genome.open_textfile(infile) as vcf, open(outfile, 'w') as vcfout:
 
-        line_i = vcf.readline().rstrip()
+    line_i = vcf.readline().rstrip()
 
-        # VCF header
-        while line_i.startswith('#'):
+    # VCF header
+    while line_i.startswith('#'):
 
-            vcfout.write( line_i + '\n')
-            line_i = vcf.readline().rstrip()
+        yield line_i + '\n'
+        line_i = vcf.readline().rstrip()
 
 
-        while line_i:
+    while line_i:
 
-            # Print "SomaticSniper" into the INFO field if it is called so, otherwise never mind.
-            item = line_i.split('\t')
+        # Print "SomaticSniper" into the INFO field if it is called so, otherwise never mind.
+        item = line_i.split('\t')
 
-            # In the REF field, non-GCTA characters should be changed to N to fit the VCF standard:
-            item[idx_ref] = re.sub( r'[^GCTA]', 'N', item[idx_ref], flags=re.I )
-            line_i = '\t'.join(item)
+        # In the REF field, non-GCTA characters should be changed to N to fit the VCF standard:
+        item[idx_ref] = re.sub( r'[^GCTA]', 'N', item[idx_ref], flags=re.I )
+        line_i = '\t'.join(item)
 
-            vcfout.write( line_i + '\n' )
+        yield line_i + '\n'
 
-            line_i = vcf.readline().rstrip()
+        line_i = vcf.readline().rstrip()
 
 
 if __name__ == '__main__':
@@ -29,34 +29,43 @@ def run():
 
 
 def convert(infile, outfile):
+
     with genome.open_textfile(infile) as vcf_in, open(outfile, 'w') as vcf_out:
+        for line_i in convert_lines(vcf_in):
+            vcf_out.write( line_i )
 
-        line_i = vcf_in.readline().rstrip()
 
-        while line_i.startswith('##'):
 
-            vcf_out.write( line_i + '\n' )
-            line_i = vcf_in.readline().rstrip()
+def convert_lines(vcf_in):
+
+    '''Same as convert, but reads an open VCF and yields the lines instead of writing them'''
+
+    line_i = vcf_in.readline().rstrip()
 
-        # This is the #CHROM line:
-        headers = line_i.split('\t')
-        num_columns = len(headers)
-        vcf_out.write( line_i + '\n' )
+    while line_i.startswith('##'):
 
+        yield line_i + '\n'
         line_i = vcf_in.readline().rstrip()
-        while line_i:
 
-            items = line_i.split('\t')
+    # This is the #CHROM line:
+    headers = line_i.split('\t')
+    num_columns = len(headers)
+    yield line_i + '\n'
 
-            items[8] = 'GT:' + items[8]
+    line_i = vcf_in.readline().rstrip()
+    while line_i:
 
-            for i in range(9, num_columns):
-                items[i] = '0/1:' + items[i]
+        items = line_i.split('\t')
 
-            line_out = '\t'.join( items )
-            vcf_out.write( line_out + '\n' )
+        items[8] = 'GT:' + items[8]
 
-            line_i = vcf_in.readline().rstrip()
+        for i in range(9, num_columns):
+            items[i] = '0/1:' + items[i]
+
+        line_out = '\t'.join( items )
+        yield line_out + '\n'
+
+        line_i = vcf_in.readline().rstrip()
 
 
 if __name__ == '__main__':
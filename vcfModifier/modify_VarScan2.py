@@ -29,113 +29,121 @@ def run():
 def convert(infile, outfile):
 
     with genome.open_textfile(infile) as vcf, open(outfile, 'w') as vcfout:
+        for line_i in convert_lines(vcf):
+            vcfout.write( line_i )
 
-        line_i = vcf.readline().rstrip()
 
-        # Skip headers from now on:
-        while line_i.startswith('#'):
 
-            if line_i.startswith('##FORMAT=<ID=DP4,'):
-                line_i = '##FORMAT=<ID=DP4,Number=4,Type=Integer,Description="# high-quality ref-forward bases, ref-reverse, alt-forward and alt-reverse bases">'
+def convert_lines(vcf):
 
-            elif line_i.startswith('##FORMAT=<ID=AD,'):
-                line_i = '##FORMAT=<ID=AD,Number=.,Type=Integer,Description="Allelic depths for the ref and alt alleles in the order listed">'
+    '''Same as convert, but reads an open VCF and yields the lines instead of writing them'''
 
-            vcfout.write( line_i + '\n')
+    line_i = vcf.readline().rstrip()
 
-            line_i = vcf.readline().rstrip()
+    # Skip headers from now on:
+    while line_i.startswith('#'):
 
-        # Doing the work here:
-        while line_i:
+        if line_i.startswith('##FORMAT=<ID=DP4,'):
+            line_i = '##FORMAT=<ID=DP4,Number=4,Type=Integer,Description="# high-quality ref-forward bases, ref-reverse, alt-forward and alt-reverse bases">'
 
-            vcf_i = genome.Vcf_line(line_i)
+        elif line_i.startswith('##FORMAT=<ID=AD,'):
+            line_i = '##FORMAT=<ID=AD,Number=.,Type=Integer,Description="Allelic depths for the ref and alt alleles in the order listed">'
 
-            num_samples = len( vcf_i.samples )
-            if num_samples == 1:
-                paired = False
+        yield line_i + '\n'
 
-            elif num_samples == 2:
-                paired = True
+        line_i = vcf.readline().rstrip()
 
-            elif num_samples > 2:
-                sys.stderr.write('We found more than 2 sammples in this VCF file. It may be messed up, but I\'ll just assume the first 2 samples mean anything at all')
-                paired = True
+    # Doing the work here:
+    while line_i:
 
-            elif num_samples == 0:
-                raise Exception('No sample information here.')
+        vcf_i = genome.Vcf_line(line_i)
 
-            # Replace the wrong "G/A" with the correct "G,A" in ALT column:
-            vcf_i.altbase = vcf_i.altbase.replace('/', ',')
+        num_samples = len( vcf_i.samples )
+        if num_samples == 1:
+            paired = False
 
-            # vcf-validator is not going to accept multiple sequences in the REF, as is the case in VarScan2's indel output:
-            vcf_i.refbase = re.sub( r'[^\w].*$', '', vcf_i.refbase )
+        elif num_samples == 2:
+            paired = True
 
-            # Get rid of non-compliant characters in the ALT column:
-            vcf_i.altbase = re.sub(r'[^\w,.]', '', vcf_i.altbase)
+        elif num_samples > 2:
+            sys.stderr.write('We found more than 2 sammples in this VCF file. It may be messed up, but I\'ll just assume the first 2 samples mean anything at all')
+            paired = True
 
-            # Eliminate dupliate entries in ALT:
-            vcf_i.altbase = re.sub(r'(\w+),\1', r'\1', vcf_i.altbase )
+        elif num_samples == 0:
+            raise Exception('No sample information here.')
 
-            # Eliminate ALT entries when it matches with the REF column, to address vcf-validator complaints:
-            if ',' in vcf_i.altbase:
-                alt_item = vcf_i.altbase.split(',')
+        # Replace the wrong "G/A" with the correct "G,A" in ALT column:
+        vcf_i.altbase = vcf_i.altbase.replace('/', ',')
 
-                if vcf_i.refbase in alt_item:
+        # vcf-validator is not going to accept multiple sequences in the REF, as is the case in VarScan2's indel output:
+        vcf_i.refbase = re.sub( r'[^\w].*$', '', vcf_i.refbase )
 
-                    bad_idx = alt_item.index(vcf_i.refbase)
-                    alt_item.pop(bad_idx)
-                    vcf_i.altbase = ','.join(alt_item)
+        # Get rid of non-compliant characters in the ALT column:
+        vcf_i.altbase = re.sub(r'[^\w,.]', '', vcf_i.altbase)
 
-                # To fix this vcf-validator complaints:
-                # Could not parse the allele(s) [GTC], first base does not match the reference
-                for n1,alt_i in enumerate(alt_item[1::]):
-                    if not alt_i.startswith( vcf_i.refbase ):
+        # Eliminate dupliate entries in ALT:
+        vcf_i.altbase = re.sub(r'(\w+),\1', r'\1', vcf_i.altbase )
 
-                        alt_item.pop(n1+1)
-                        vcf_i.altbase = ','.join(alt_item)
+        # Eliminate ALT entries when it matches with the REF column, to address vcf-validator complaints:
+        if ',' in vcf_i.altbase:
+            alt_item = vcf_i.altbase.split(',')
 
+            if vcf_i.refbase in alt_item:
 
-            # Combine AD:RD into AD:
-            format_items = vcf_i.get_sample_variable()
-            if 'AD' in format_items and 'RD' in format_items:
+                bad_idx = alt_item.index(vcf_i.refbase)
+                alt_item.pop(bad_idx)
+                vcf_i.altbase = ','.join(alt_item)
 
-                rd_sm1 = vcf_i.get_sample_value('RD', 0)
-                ad_sm1 = vcf_i.get_sample_value('AD', 0)
+            # To fix this vcf-validator complaints:
+            # Could not parse the allele(s) [GTC], first base does not match the reference
+            for n1,alt_i in enumerate(alt_item[1::]):
+                if not alt_i.startswith( vcf_i.refbase ):
+
+                    alt_item.pop(n1+1)
+                    vcf_i.altbase = ','.join(alt_item)
 
-                try:
-                    rd_sm2 = vcf_i.get_sample_value('RD', 1)
-                    ad_sm2 = vcf_i.get_sample_value('AD', 1)
-                except IndexError:
-                    rd_sm2 = ad_sm2 = 0
 
+        # Combine AD:RD into AD:
+        format_items = vcf_i.get_sample_variable()
+        if 'AD' in format_items and 'RD' in format_items:
 
-                idx_ad = format_items.index('AD')
-                idx_rd = format_items.index('RD')
-                format_items.pop(idx_rd)
-                vcf_i.field = ':'.join(format_items)
+            rd_sm1 = vcf_i.get_sample_value('RD', 0)
+            ad_sm1 = vcf_i.get_sample_value('AD', 0)
 
-                item_normal = vcf_i.samples[0].split(':')
-                item_normal[idx_ad] = '{},{}'.format( rd_sm1, ad_sm1 )
-                item_normal.pop(idx_rd)
-                vcf_i.samples[0] = ':'.join(item_normal)
+            try:
+                rd_sm2 = vcf_i.get_sample_value('RD', 1)
+                ad_sm2 = vcf_i.get_sample_value('AD', 1)
+            except IndexError:
+                rd_sm2 = ad_sm2 = 0
 
-                if paired:
 
-                    item_tumor = vcf_i.samples[1].split(':')
-                    item_tumor[idx_ad] = '{},{}'.format( rd_sm2, ad_sm2 )
-                    item_tumor.pop(idx_rd)
-                    vcf_i.samples[1] = ':'.join(item_tumor)
+            idx_ad = format_items.index('AD')
+            idx_rd = format_items.index('RD')
+            format_items.pop(idx_rd)
+            vcf_i.field = ':'.join(format_items)
 
+            item_normal = vcf_i.samples[0].split(':')
+            item_normal[idx_ad] = '{},{}'.format( rd_sm1, ad_sm1 )
+            item_normal.pop(idx_rd)
+            vcf_i.samples[0] = ':'.join(item_normal)
 
-            # Reform the line:
-            line_i = '\t'.join(( vcf_i.chromosome, str(vcf_i.position), vcf_i.identifier, vcf_i.refbase, vcf_i.altbase, vcf_i.qual, vcf_i.filters, vcf_i.info, vcf_i.field, '\t'.join((vcf_i.samples)) ))
+            if paired:
 
-            # VarScan2 output a line with REF allele as "M". GATK CombineVariants complain about that.
-            if not re.search(r'[^GCTAU]', vcf_i.refbase, re.I):
-                vcfout.write(line_i+'\n')
+                item_tumor = vcf_i.samples[1].split(':')
+                item_tumor[idx_ad] = '{},{}'.format( rd_sm2, ad_sm2 )
+                item_tumor.pop(idx_rd)
+                vcf_i.samples[1] = ':'.join(item_tumor)
 
-            # Next line:
-            line_i = vcf.readline().rstrip()
+
+        # Reform the line:
+        line_i = '\t'.join(( vcf_i.chromosome, str(vcf_i.position), vcf_i.identifier, vcf_i.refbase, vcf_i.altbase, vcf_i.qual, vcf_i.filters, vcf_i.info, vcf_i.field, '\t'.join((vcf_i.samples)) ))
+
+        # VarScan2 output a line with REF allele as "M". GATK CombineVariants complain about that.
+        if not re.search(r'[^GCTAU]', vcf_i.refbase, re.I):
+            yield line_i+'\n'
+
+        # Next line:
+        line_i = vcf.readline().rstrip()
 
 
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Splits VCF files by the BED files of somaticseq_parallel.py's threads, so each thread reads only its own part of every VCF file.
+# A line goes to the BED file of the last region that starts before its position on the same contig (or of the contig's first region), so all the lines of the same position go to the same BED file, even the ones outside of every region, e.g., a deletion that starts before a region and overlaps it.
+# Lines on contigs in none of the BED files are left out.
+
+import sys, os, argparse, re
+from bisect import bisect_right
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+import genomicFileHandler.genomic_file_handlers as genome
+
+
+def run():
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-vcf',      '--vcf-file',     type=str,  help='Input VCF file',  required=True)
+    parser.add_argument('-beds',     '--bed-files',    nargs='*', help='BED files, e.g., from split_Bed_into_equal_regions.py', required=True)
+    parser.add_argument('-outfiles', '--output-files', nargs='*', help='Output VCF file for each BED file', required=True)
+
+    args = parser.parse_args()
+
+    return args.vcf_file, args.bed_files, args.output_files
+
+
+
+class RegionShards:
+
+    def __init__(self, bed_files):
+
+        regions = {}
+        for n, bed_i in enumerate(bed_files):
+            with open(bed_i) as bed:
+                for line_i in bed:
+                    if line_i.strip() and not re.match(r'track|browser|#', line_i):
+                        item = line_i.split('\t')
+                        regions.setdefault(item[0], []).append( (int(item[1]), n) )
+
+        self.starts = {}
+        self.shards = {}
+        for contig_i in regions:
+            regions[contig_i].sort()
+            self.starts[contig_i] = [ start_j for start_j, n in regions[contig_i] ]
+            self.shards[contig_i] = [ n for start_j, n in regions[contig_i] ]
+
+
+    def shard_of(self, contig, position):
+        '''Number of the BED file for the 1-based position, or None'''
+
+        if contig not in self.starts:
+            return None
+
+        i = bisect_right(self.starts[contig], position-1) - 1
+
+        return self.shards[contig][ max(i, 0) ]
+
+
+
+def shard(vcf_file, region_shards, outfiles):
+    '''Every output has the full header'''
+
+    outhandles = [ open(outfile_i, 'w') for outfile_i in outfiles ]
+
+    with genome.open_textfile(vcf_file) as vcf:
+
+        line_i = vcf.readline()
+
+        while line_i.startswith('#'):
+            for outhandle_j in outhandles:
+                outhandle_j.write( line_i )
+
+            line_i = vcf.readline()
+
+        while line_i:
+
+            if line_i.strip():
+                item = line_i.split('\t', 2)
+                n    = region_shards.shard_of( item[0], int(item[1]) )
+
+                if n is not None:
+                    outhandles[n].write( line_i )
+
+            line_i = vcf.readline()
+
+    for outhandle_j in outhandles:
+        outhandle_j.close()
+
+    return outfiles
+
+
+
+if __name__ == '__main__':
+    vcf_file, bed_files, outfiles = run()
+    assert len(bed_files) == len(outfiles)
+    shard(vcf_file, RegionShards(bed_files), outfiles)
@@ -37,74 +37,85 @@ def split_into_snv_and_indel(infile, snv_out, indel_out):
 
     with genome.open_textfile(infile) as vcf_in, open(snv_out, 'w') as snv_out, open(indel_out, 'w') as indel_out:
 
-        line_i = vcf_in.readline().rstrip()
+        outfiles = {'snv': snv_out, 'indel': indel_out}
+
+        for variant_type, line_i in split_lines(vcf_in):
+            outfiles[variant_type].write( line_i )
+
 
-        while line_i.startswith('#'):
 
-            snv_out.write( line_i + '\n' )
-            indel_out.write( line_i + '\n' )
+def split_lines(vcf_in):
 
-            line_i = vcf_in.readline().rstrip()
+    '''Same as split_into_snv_and_indel, but reads an open VCF and yields ('snv' or 'indel', line) instead of writing two files'''
 
-        while line_i:
+    line_i = vcf_in.readline().rstrip()
 
-            vcf_i = genome.Vcf_line( line_i )
+    while line_i.startswith('#'):
+
+        yield 'snv', line_i + '\n'
+        yield 'indel', line_i + '\n'
+
+        line_i = vcf_in.readline().rstrip()
 
+    while line_i:
 
-            if (',' not in vcf_i.altbase) and ('/' not in vcf_i.altbase):
+        vcf_i = genome.Vcf_line( line_i )
 
-                if len(vcf_i.refbase) == 1 and len(vcf_i.altbase) == 1:
-                    snv_out.write( line_i + '\n' )
-                elif len(vcf_i.refbase) == 1 or len(vcf_i.altbase) == 1:
-                    indel_out.write( line_i + '\n' )
 
+        if (',' not in vcf_i.altbase) and ('/' not in vcf_i.altbase):
+
+            if len(vcf_i.refbase) == 1 and len(vcf_i.altbase) == 1:
+                yield 'snv', line_i + '\n'
+            elif len(vcf_i.refbase) == 1 or len(vcf_i.altbase) == 1:
+                yield 'indel', line_i + '\n'
+
+        else:
+            
+            item = line_i.split('\t')
+            
+            if ',' in vcf_i.altbase:
+                alt_bases = vcf_i.altbase.split(',')
+            elif '/' in vcf_i.altbase:
+                alt_bases = vcf_i.altbase.split('/')
             else:
+                raise Exception('Check the line: {}'.format(line_i))
+            
+            for ith_base, altbase_i in enumerate(alt_bases):
+
+                if len(vcf_i.refbase) == 1 and len(altbase_i) == 1:
+                    item_j    = copy(item)
+                    item_j[4] = altbase_i
+                    new_line  = '\t'.join(item_j)
+                    
+                    yield 'snv', new_line + '\n'
                 
-                item = line_i.split('\t')
-                
-                if ',' in vcf_i.altbase:
-                    alt_bases = vcf_i.altbase.split(',')
-                elif '/' in vcf_i.altbase:
-                    alt_bases = vcf_i.altbase.split('/')
+                elif len(vcf_i.refbase) == 1 or len(altbase_i) == 1:
+                    item_j    = copy(item)
+                    item_j[4] = altbase_i
+                    new_line  = '\t'.join(item_j)
+                    
+                    yield 'indel', new_line + '\n'
+                    
                 else:
-                    raise Exception('Check the line: {}'.format(line_i))
-                
-                for ith_base, altbase_i in enumerate(alt_bases):
-
-                    if len(vcf_i.refbase) == 1 and len(altbase_i) == 1:
-                        item_j    = copy(item)
-                        item_j[4] = altbase_i
-                        new_line  = '\t'.join(item_j)
-                        
-                        snv_out.write( new_line + '\n' )
+                    complex_variant = complex2indel.translate(vcf_i.refbase, altbase_i)
                     
-                    elif len(vcf_i.refbase) == 1 or len(altbase_i) == 1:
-                        item_j    = copy(item)
-                        item_j[4] = altbase_i
-                        new_line  = '\t'.join(item_j)
-                        
-                        indel_out.write( new_line + '\n')
+                    if complex_variant:
+                        (new_ref, new_alt), offset = complex_variant
                         
-                    else:
-                        complex_variant = complex2indel.translate(vcf_i.refbase, altbase_i)
-                        
-                        if complex_variant:
-                            (new_ref, new_alt), offset = complex_variant
+                        if new_ref[0] == new_alt[0] and ( len(new_ref) == 1 or len(new_alt) == 1):
                             
-                            if new_ref[0] == new_alt[0] and ( len(new_ref) == 1 or len(new_alt) == 1):
-                                
-                                item_j    = copy(item)
-                                item_j[3] = new_ref
-                                item_j[4] = new_alt
+                            item_j    = copy(item)
+                            item_j[3] = new_ref
+                            item_j[4] = new_alt
+                            
+                            # This *may* cause the output VCF file to go out of order
+                            if offset != 0:
+                                item_j[1] = str( int(item[1]) + offset )
                                 
-                                # This *may* cause the output VCF file to go out of order
-                                if offset != 0:
-                                    item_j[1] = str( int(item[1]) + offset )
-                                    
-                                new_line = '\t'.join(item_j)
-                                indel_out.write( new_line + '\n')
-
-            line_i = vcf_in.readline().rstrip()
+                            new_line = '\t'.join(item_j)
+                            yield 'indel', new_line + '\n'
+
+        line_i = vcf_in.readline().rstrip()
 
 
 
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
-import sys, os, argparse, gzip, re, subprocess, uuid
+import sys, os, argparse, gzip, re, subprocess
+import numpy as np
+from functools import lru_cache
 
 MY_DIR = os.path.dirname(os.path.realpath(__file__))
 PRE_DIR = os.path.join(MY_DIR, os.pardir)
@@ -10,79 +12,207 @@ import genomicFileHandler.genomic_file_handlers as genome
 
 
 
+class BedIndex:
+    '''
+    Intervals of a BED file, as sorted numpy arrays of starts and ends for each contig, to find overlaps with binary search.
+    max_ends[i] is the largest end among intervals 0, 1, ..., i, so whether anything up to i overlaps a position is one lookup.
+    '''
+
+    def __init__(self, bed_file):
+
+        intervals = {}
+
+        with genome.open_textfile(bed_file) as bed:
+            for line_i in bed:
+
+                if line_i.startswith('#') or line_i.startswith('track') or line_i.startswith('browser') or not line_i.strip():
+                    continue
+
+                contig_i, start_i, end_i = line_i.rstrip('\n').split('\t')[:3]
+                intervals.setdefault(contig_i, []).append( (int(start_i), int(end_i)) )
+
+        self.starts   = {}
+        self.ends     = {}
+        self.max_ends = {}
+
+        for contig_i in intervals:
+            intervals_i = np.array( sorted(intervals[contig_i]), dtype=np.int64 ).reshape(-1, 2)
+
+            self.starts[contig_i]   = intervals_i[:,0]
+            self.ends[contig_i]     = intervals_i[:,1]
+            self.max_ends[contig_i] = np.maximum.accumulate( intervals_i[:,1] )
+
+
+    def overlaps(self, contig, start, end):
+        '''Does [start, end) overlap any interval?'''
+
+        if contig not in self.starts:
+            return False
+
+        n_before_end = np.searchsorted(self.starts[contig], end, side='left')
+
+        return n_before_end > 0 and self.max_ends[contig][n_before_end-1] > start
+
+
+    def overlap_starts(self, contig, start, end):
+        '''
+        Where the overlap with each interval begins, i.e., max(start, interval start), for the intervals overlapping [start, end) in the sorted order.
+        Intervals that begin at or before start all give start, so they come out as one.
+        '''
+
+        if contig not in self.starts:
+            return []
+
+        starts, ends = self.starts[contig], self.ends[contig]
+
+        n_before_end   = np.searchsorted(starts, end,   side='left')
+        n_until_start  = np.searchsorted(starts, start, side='right')
+
+        overlap_starts = [start] if n_until_start > 0 and self.max_ends[contig][n_until_start-1] > start else []
+        overlap_starts.extend( starts[n_until_start:n_before_end][ ends[n_until_start:n_before_end] > start ].tolist() )
+
+        return overlap_starts
+
+
+
+@lru_cache(maxsize=16)
+def cached_bed_index(bed_file, modified_time, file_size):
+    return BedIndex(bed_file)
+
+
+
+def bed_index(bed_file):
+    '''The same BED file is used for every caller VCF, so it's only read once unless it has changed.'''
+    stat_i = os.stat(bed_file)
+    return cached_bed_index(os.path.realpath(bed_file), stat_i.st_mtime_ns, stat_i.st_size)
+
+
+
+def vcf_interval(vcf_line):
+    '''0-based [start, end) of a VCF record, same as bedtools, i.e., spanning the REF allele'''
+    contig_i, pos_i, id_i, ref_i = vcf_line.split('\t', 4)[:4]
+    return contig_i, int(pos_i)-1, int(pos_i)-1 + len(ref_i)
+
+
+
+def included_lines(vcf_lines, inclusion_index):
+    '''
+    Follows intersectBed -header -a vcf -b bed | uniq:
+    Without -wa, bedtools reports a record once for each overlapping interval, with POS moved to where the overlap begins, i.e., only deletions that begin before an interval are changed.
+    Unlike bedtools, a record is written once for each distinct overlap start, in coordinate order, whatever the order of the intervals in the BED file.
+    bedtools writes one line per interval in the order it finds them, and uniq only drops identical lines next to each other, so a deletion across several intervals can come out in another order, or more than once.
+    Records within a single interval, and SNVs and insertions however many intervals they are in, are the same as with bedtools.
+    '''
+
+    for line_i in vcf_lines:
+
+        if line_i.startswith('#'):
+            yield line_i
+            continue
+
+        contig_i, start_i, end_i = vcf_interval(line_i)
+
+        for overlap_start in inclusion_index.overlap_starts(contig_i, start_i, end_i):
+            if overlap_start == start_i:
+                yield line_i
+            else:
+                yield '{}\t{}\t{}'.format( contig_i, overlap_start+1, line_i.split('\t', 2)[2] )
+
+
+
+def excluded_lines(vcf_lines, exclusion_index):
+    '''Same as intersectBed -header -a vcf -b bed -v | uniq'''
+
+    for line_i in vcf_lines:
+        if line_i.startswith('#') or not exclusion_index.overlaps( *vcf_interval(line_i) ):
+            yield line_i
+
+
+
+def unique_lines(lines):
+    '''Same as uniq, i.e., drops lines identical to the one right before'''
+
+    previous_line = None
+
+    for line_i in lines:
+        if line_i != previous_line:
+            yield line_i
+
+        previous_line = line_i
+
+
+
+def intersected_lines(infile, inclusion_region=None, exclusion_region=None):
+    '''Yields the lines of the VCF file that bed_intersector would have written, without writing them'''
+
+    with genome.open_textfile(infile) as vcf_in:
+
+        vcf_lines = ( line_i for line_i in vcf_in if line_i.strip() )
+
+        if inclusion_region:
+            vcf_lines = unique_lines( included_lines(vcf_lines, bed_index(inclusion_region)) )
+
+        if exclusion_region:
+            vcf_lines = unique_lines( excluded_lines(vcf_lines, bed_index(exclusion_region)) )
+
+        for line_i in vcf_lines:
+            yield line_i if line_i.endswith('\n') else line_i + '\n'
+
+
+
+def intersect_vcf(infile, outfile, inclusion_region=None, exclusion_region=None):
+    '''Filters the VCF file in one streaming pass, without intersectBed, pipes, or temporary files'''
+
+    with open(outfile, 'w') as vcf_out:
+        for line_i in intersected_lines(infile, inclusion_region, exclusion_region):
+            vcf_out.write( line_i )
+
+    return outfile
+
+
+
 def bed_include(infile, inclusion_region, outfile):
-    
+
     assert infile != outfile
-    
+
     if inclusion_region:
-    
-        exit_code = os.system( 'intersectBed -header -a {} -b {} | uniq > {}'.format(infile, inclusion_region, outfile) )
-        assert exit_code == 0
+        intersect_vcf(infile, outfile, inclusion_region=inclusion_region)
     else:
         outfile = None
-    
+
     return outfile
 
 
 
 def bed_exclude(infile, exclusion_region, outfile):
-    
+
     assert infile != outfile
-    
+
     if exclusion_region:
-    
-        exit_code = os.system( 'intersectBed -header -a {} -b {} -v | uniq > {}'.format(infile, exclusion_region, outfile) )
-        assert exit_code == 0
+        intersect_vcf(infile, outfile, exclusion_region=exclusion_region)
     else:
         outfile = None
-        
+
     return outfile
 
 
 
 
 def bed_intersector(infile, outfile, inclusion_region=None, exclusion_region=None):
-    
+
     assert infile != outfile
     from shutil import copyfile
-    
-    # Get the input file name minus the extention, and also get the extension
-    infile_noext = re.sub(r'\.\w+$', '', infile)
-    file_ext     = re.search(r'\.\w+$',  infile).group()
-    
-    temp_files   = []
-    
-    if inclusion_region:
-        
-        included_temp_file = infile_noext + uuid.uuid4().hex + file_ext
-        
-        exit_code = os.system( 'intersectBed -header -a {} -b {} | uniq > {}'.format(infile, inclusion_region, included_temp_file) )
-        assert exit_code == 0
-        
-        infile  = included_temp_file
-        temp_files.append( included_temp_file )
-    
-    
-    if exclusion_region:
-        
-        exit_code = os.system( 'intersectBed -header -a {} -b {} -v | uniq > {}'.format(infile, exclusion_region, outfile) )
+
+    if inclusion_region or exclusion_region:
+        intersect_vcf(infile, outfile, inclusion_region, exclusion_region)
+
+    elif infile.endswith('.gz'):
+        exit_code = os.system( 'gunzip -c {} > {}'.format(infile, outfile) )
         assert exit_code == 0
-    
-    
-    if inclusion_region and not exclusion_region:
-        copyfile(included_temp_file, outfile)
-    
-    elif not (inclusion_region or exclusion_region):
-        if infile.endswith('.gz'):
-            exit_code = os.system( 'gunzip -c {} > {}'.format(infile, outfile) )
-            assert exit_code == 0
-        else:
-            copyfile(infile, outfile)
-    
-    
-    for file_i in temp_files:
-        os.remove( file_i )
-        
+
+    else:
+        copyfile(infile, outfile)
+
     return outfile
 
 
@@ -95,3 +225,29 @@ def vcfsorter(ref, vcfin, vcfout):
     fai = ref + '.fai'
     exit_code = os.system('bedtools sort -faidx {} -header -i {} > {}'.format(fai, vcfin, vcfout))
     assert exit_code == 0
+
+
+
+def sorted_lines(ref, vcf_lines):
+    '''
+    Same as vcfsorter, but for VCF lines in memory: headers first, then records sorted by the contig order in the .fai file and position.
+    Records at the same position stay in their input order.
+    '''
+
+    chrom_seq = genome.faiordict2contigorder(ref + '.fai', 'fai')
+
+    header_lines, variant_lines = [], []
+    for line_i in vcf_lines:
+        if line_i.startswith('#'):
+            header_lines.append(line_i)
+        else:
+            variant_lines.append(line_i)
+
+    def coordinate(line_i):
+        contig_i, pos_i = line_i.split('\t', 2)[:2]
+        return chrom_seq.get(contig_i, len(chrom_seq)), int(pos_i)
+
+    variant_lines.sort(key=coordinate)
+
+    yield from header_lines
+    yield from variant_lines
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# A caller's VCF file after region filtering, modify_* conversion, SNV/INDEL split, and sorting, without writing any of the steps into files.
+# Every time a VcfStream is opened, the chain of generators runs again from the caller's raw VCF file, so the normalized VCF lines are never all in memory (except for sorting VarDict's), and never on disk unless written out.
+
+import sys, os
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+PRE_DIR = os.path.join(MY_DIR, os.pardir)
+sys.path.append( PRE_DIR )
+
+
+
+class LineReader:
+    '''Reads lines from a generator with the same calls used on an opened VCF file, i.e., readline(), iteration, close(), and "with"'''
+
+    def __init__(self, lines, name='<stream>'):
+        self.lines = lines
+        self.name  = name
+
+    def readline(self):
+        return next(self.lines, '')
+
+    def __iter__(self):
+        return self.lines
+
+    def __next__(self):
+        return next(self.lines)
+
+    def close(self):
+        # Closes the files opened inside the generators
+        self.lines.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+class VcfStream:
+    '''
+    make_lines is a function with no argument that returns a new generator of the VCF lines.
+    genome.open_textfile(vcf_stream) opens it like a VCF file.
+    '''
+
+    def __init__(self, name, make_lines):
+        self.name       = name
+        self.make_lines = make_lines
+
+    def open(self):
+        return LineReader(self.make_lines(), self.name)
+
+    def write(self, outfile):
+        with open(outfile, 'w') as vcf_out:
+            for line_i in self.make_lines():
+                vcf_out.write( line_i )
+
+        return outfile
+
+    def __repr__(self):
+        return 'VcfStream({})'.format(self.name)
+
+
+
+def selected_lines(typed_lines, variant_type):
+    '''From ('snv' or 'indel', line) of a two-way split, yields the lines of variant_type'''
+
+    for type_i, line_i in typed_lines:
+        if type_i == variant_type:
+            yield line_i